@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+# ex:ts=4:sw=4:sts=4:et
+# -*- tab-width: 4; c-basic-offset: 4; indent-tabs-mode: nil -*-
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 2 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+#
+# Time the local file checksums of a large directory SRC_URI entry as the
+# signature generator computes them, e.g.:
+#
+#   bench-checksum.py --files 20000 --size 16384
+#
+# A tree of the given shape is created in a temporary directory unless
+# --dir points at an existing one. The "cold" run starts from an empty
+# checksum cache, the "warm" run from the cache the cold run saved and the
+# "repeat" run asks again within the same run. --legacy also times walking
+# and hashing the tree the way get_file_checksums used to, one file at a time.
+#
+import os
+import sys
+import time
+import shutil
+import random
+import tempfile
+import optparse
+
+sys.path.insert(0, os.path.join(os.path.abspath(os.path.dirname(sys.argv[0])), '../lib'))
+import bb
+import bb.fetch2
+import bb.checksum
+
+def make_tree(path, numfiles, size, seed):
+    rand = random.Random(seed)
+    for i in xrange(numfiles):
+        dirname = os.path.join(path, "dir%d" % (i % 100), "sub%d" % (i % 7))
+        if not os.path.exists(dirname):
+            os.makedirs(dirname)
+        with open(os.path.join(dirname, "file%d" % i), "wb") as f:
+            f.write(os.urandom(rand.randint(1, size * 2)))
+
+def legacy(path):
+    checksums = []
+    for root, dirs, files in os.walk(path):
+        for name in files:
+            fullpth = os.path.join(root, name)
+            checksums.append((fullpth, bb.utils.md5_file(fullpth)))
+    return checksums
+
+def timed(func, *args):
+    start = time.time()
+    result = func(*args)
+    return result, time.time() - start
+
+def main():
+    parser = optparse.OptionParser(usage="%prog [options]")
+    parser.add_option("-n", "--files", type="int", default=20000,
+                      help="number of files in the generated tree (default: %default)")
+    parser.add_option("-s", "--size", type="int", default=16384,
+                      help="average file size in bytes (default: %default)")
+    parser.add_option("-d", "--dir",
+                      help="checksum an existing tree instead of generating one")
+    parser.add_option("--legacy", action="store_true",
+                      help="also time the old one file at a time walk")
+    options, args = parser.parse_args()
+
+    tempdir = tempfile.mkdtemp()
+    try:
+        path = options.dir
+        if not path:
+            path = os.path.join(tempdir, "tree")
+            make_tree(path, options.files, options.size, 0)
+        d = bb.data.init()
+        d.setVar("PERSISTENT_DIR", os.path.join(tempdir, "persist"))
+        filelist = "%s:True" % path
+
+        if options.legacy:
+            expected, elapsed = timed(legacy, path)
+            print("legacy  %8.3fs" % elapsed)
+
+        bb.fetch2._checksum_cache.init_cache(d)
+        checksums, elapsed = timed(bb.fetch2.get_file_checksums, filelist, "bench")
+        print("cold    %8.3fs  (%d files)" % (elapsed, len(checksums)))
+        if options.legacy and sorted(checksums) != sorted(expected):
+            print("checksums differ from the legacy ones!")
+            return 1
+
+        _, elapsed = timed(bb.fetch2.get_file_checksums, filelist, "bench")
+        print("repeat  %8.3fs" % elapsed)
+        bb.fetch2.fetcher_checksums_done(d)
+
+        bb.fetch2._checksum_cache = bb.checksum.FileChecksumCache()
+        bb.fetch2._checksum_cache.init_cache(d)
+        _, elapsed = timed(bb.fetch2.get_file_checksums, filelist, "bench")
+        print("warm    %8.3fs" % elapsed)
+    finally:
+        shutil.rmtree(tempdir)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
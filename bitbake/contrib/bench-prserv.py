@@ -0,0 +1,123 @@
+#!/usr/bin/env python
+# ex:ts=4:sw=4:sts=4:et
+# -*- tab-width: 4; c-basic-offset: 4; indent-tabs-mode: nil -*-
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 2 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+#
+# Load test a PR server. A number of client processes query PR values for
+# random (version, pkgarch, checksum) tuples out of a fixed pool, so that
+# the first queries allocate new values and later ones mostly look them up,
+# e.g.:
+#
+#   bench-prserv.py --clients 8 --requests 2000 --batch 50
+#
+# --batch 1 sends one getPR call per query, larger values use getPRs. By
+# default a server is started on a temporary database, --server host:port
+# runs the load against an existing one instead.
+#
+import os
+import sys
+import time
+import random
+import shutil
+import tempfile
+import optparse
+
+sys.path.insert(0, os.path.join(os.path.abspath(os.path.dirname(sys.argv[0])), '../lib'))
+import prserv
+import prserv.serv
+
+def start_server(tmpdir):
+    server = prserv.serv.PRServer(os.path.join(tmpdir, "prserv.sqlite3"),
+                                  os.path.join(tmpdir, "prserv.log"),
+                                  ("localhost", 0), daemon=False)
+    pid = os.fork()
+    if pid == 0:
+        server.work_forever()
+        os._exit(0)
+    server.socket.close()
+    return pid, server.getinfo()
+
+def client(host, port, options, seed):
+    rand = random.Random(seed)
+    conn = prserv.serv.PRServerConnection(host, port)
+    queries = []
+    for i in xrange(options.requests):
+        recipe = rand.randrange(options.recipes)
+        queries.append(("1.0-r%d" % recipe, "core2-64",
+                        "%032x" % (recipe * options.checksums + rand.randrange(options.checksums))))
+    for i in xrange(0, len(queries), options.batch):
+        if options.batch == 1:
+            value = conn.getPR(*queries[i])
+            if value is None:
+                return 1
+        else:
+            values = conn.getPRs(queries[i:i + options.batch])
+            if None in values:
+                return 1
+    return 0
+
+def main():
+    parser = optparse.OptionParser(usage="%prog [options]")
+    parser.add_option("-c", "--clients", type="int", default=4,
+                      help="number of client processes (default: %default)")
+    parser.add_option("-n", "--requests", type="int", default=2000,
+                      help="number of queries per client (default: %default)")
+    parser.add_option("-b", "--batch", type="int", default=1,
+                      help="queries per call, 1 uses getPR (default: %default)")
+    parser.add_option("-r", "--recipes", type="int", default=500,
+                      help="number of distinct versions (default: %default)")
+    parser.add_option("-k", "--checksums", type="int", default=4,
+                      help="number of distinct checksums per version (default: %default)")
+    parser.add_option("-s", "--server", metavar="HOST:PORT",
+                      help="use a running server instead of starting one")
+    options, args = parser.parse_args()
+
+    tmpdir = None
+    serverpid = None
+    if options.server:
+        host, port = options.server.split(":")
+        port = int(port)
+    else:
+        tmpdir = tempfile.mkdtemp(prefix="bench-prserv")
+        serverpid, (host, port) = start_server(tmpdir)
+
+    try:
+        start = time.time()
+        pids = []
+        for i in xrange(options.clients):
+            pid = os.fork()
+            if pid == 0:
+                os._exit(client(host, port, options, i))
+            pids.append(pid)
+        failed = 0
+        for pid in pids:
+            if os.waitpid(pid, 0)[1]:
+                failed += 1
+        elapsed = time.time() - start
+    finally:
+        if serverpid:
+            prserv.serv.PRServerConnection(host, port).terminate()
+            os.waitpid(serverpid, 0)
+            shutil.rmtree(tmpdir)
+
+    total = options.clients * options.requests
+    print("%d clients, batch %d: %d queries in %.3fs, %.0f queries/s%s" %
+          (options.clients, options.batch, total, elapsed, total / elapsed,
+           ", %d clients failed" % failed if failed else ""))
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
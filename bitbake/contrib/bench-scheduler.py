@@ -0,0 +1,158 @@
+#!/usr/bin/env python
+# ex:ts=4:sw=4:sts=4:et
+# -*- tab-width: 4; c-basic-offset: 4; indent-tabs-mode: nil -*-
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 2 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+#
+# Replay a synthetic task graph through the runqueue schedulers and report
+# how long scheduler construction and task selection take, e.g.:
+#
+#   bench-scheduler.py --tasks 50000 --threads 64 speed completion
+#
+# --init-only just reports the scheduler startup time before the first task
+# could be started.
+#
+import os
+import sys
+import time
+import random
+import shutil
+import tempfile
+import optparse
+
+sys.path.insert(0, os.path.join(os.path.abspath(os.path.dirname(sys.argv[0])), '../lib'))
+import bb
+import bb.parse
+import bb.siggen
+import bb.runqueue
+from bb.tests.runqueue import FakeRunQueueData, FakeRunQueueExecute
+
+TASKS = ["do_fetch", "do_unpack", "do_patch", "do_configure", "do_compile",
+         "do_install", "do_populate_sysroot", "do_package", "do_packagedata",
+         "do_package_write_ipk"]
+
+def make_graph(numtasks, seed):
+    """
+    Build a list of (fnid, taskname, weight, depends) tuples for roughly
+    numtasks tasks: a chain of TASKS per recipe with do_configure depending
+    on do_populate_sysroot of a few earlier recipes.
+    """
+    rand = random.Random(seed)
+    numfns = max(1, numtasks // len(TASKS))
+    fns = ["/recipes/recipe-%d.bb" % fnid for fnid in xrange(numfns)]
+    tasks = []
+    for fnid in xrange(numfns):
+        base = len(tasks)
+        for idx, taskname in enumerate(TASKS):
+            deps = []
+            if idx:
+                deps.append(base + idx - 1)
+            if taskname == "do_configure" and fnid:
+                for dep in rand.sample(xrange(fnid), min(fnid, 5)):
+                    deps.append(dep * len(TASKS) + TASKS.index("do_populate_sysroot"))
+            tasks.append([fnid, taskname, 1, deps])
+
+    # Same idea as RunQueueData.calculate_task_weights, walking backwards
+    # since dependencies always have lower ids here
+    for task in reversed(xrange(len(tasks))):
+        for dep in tasks[task][3]:
+            tasks[dep][2] += tasks[task][2]
+
+    # Durations as the makespan scheduler would find them from earlier builds
+    durations = {}
+    for fnid, taskname, _, _ in tasks:
+        durations["recipe-%d:%s" % (fnid, taskname)] = rand.expovariate(1 / 30.0)
+    return fns, [tuple(t) for t in tasks], durations
+
+def replay(rqexec, sched, threads):
+    """
+    Run the graph with up to threads tasks in flight, completing the oldest
+    running task whenever no further task can be started.
+    """
+    rqdata = rqexec.rqdata
+    running = []
+    selecttime = 0
+    while True:
+        start = time.time()
+        task = sched.next_buildable_task() if len(running) < threads else None
+        selecttime += time.time() - start
+        if task is not None:
+            rqexec.runq_running[task] = 1
+            rqexec.build_stamps2.add(sched.stamps[task])
+            running.append(task)
+            continue
+        if not running:
+            break
+        task = running.pop(0)
+        rqexec.build_stamps2.discard(sched.stamps[task])
+        rqexec.runq_complete[task] = 1
+        for revdep in rqdata.runq_revdeps[task]:
+            if rqexec.runq_buildable[revdep]:
+                continue
+            if all(rqexec.runq_complete[dep] for dep in rqdata.runq_depends[revdep]):
+                rqexec.runq_buildable[revdep] = 1
+                sched.newbuilable(revdep)
+    return selecttime
+
+def main():
+    parser = optparse.OptionParser(usage="%prog [options] [scheduler...]")
+    parser.add_option("-n", "--tasks", type="int", default=50000,
+                      help="approximate number of tasks in the graph (default: %default)")
+    parser.add_option("-j", "--threads", type="int", default=64,
+                      help="number of tasks in flight (default: %default)")
+    parser.add_option("-s", "--seed", type="int", default=0,
+                      help="random seed for the graph (default: %default)")
+    parser.add_option("-i", "--init-only", action="store_true",
+                      help="only time scheduler construction, not the replay")
+    options, args = parser.parse_args()
+
+    schedulers = dict((obj.name, obj) for obj in vars(bb.runqueue).values()
+                      if type(obj) is type and issubclass(obj, bb.runqueue.RunQueueScheduler))
+    names = args or sorted(schedulers)
+    for name in names:
+        if name not in schedulers:
+            parser.error("unknown scheduler '%s' (available: %s)" % (name, ", ".join(sorted(schedulers))))
+
+    fns, tasks, durations = make_graph(options.tasks, options.seed)
+    print("%d tasks in %d recipes, %d threads" % (len(tasks), len(fns), options.threads))
+
+    bb.parse.siggen = bb.siggen.SignatureGenerator(None)
+    stampdir = tempfile.mkdtemp()
+    try:
+        for name in names:
+            rqdata = FakeRunQueueData(stampdir, fns, tasks)
+            rqexec = FakeRunQueueExecute(rqdata)
+            schedclass = schedulers[name]
+            if issubclass(schedclass, bb.runqueue.RunQueueSchedulerMakespan):
+                class schedclass(schedclass):
+                    def get_durations(self):
+                        return durations
+            start = time.time()
+            sched = schedclass(rqexec, rqdata)
+            inittime = time.time() - start
+            if options.init_only:
+                print("%-12s init %8.3fs" % (name, inittime))
+                continue
+            selecttime = replay(rqexec, sched, options.threads)
+            if not all(rqexec.runq_complete):
+                print("%s: not all tasks were scheduled!" % name)
+                return 1
+            print("%-12s init %8.3fs  select %8.3fs" % (name, inittime, selecttime))
+    finally:
+        shutil.rmtree(stampdir)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,136 @@
+#!/usr/bin/env python
+# ex:ts=4:sw=4:sts=4:et
+# -*- tab-width: 4; c-basic-offset: 4; indent-tabs-mode: nil -*-
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 2 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+#
+# Time computing the task hashes of a synthetic task graph the way the
+# runqueue does, and writing out the signature data of every task the way
+# bitbake -S does, e.g.:
+#
+#   bench-taskhash.py --recipes 2000 --images 20 --algorithm sha256
+#
+# Each recipe has a chain of tasks; each image task depends on the last
+# task of every recipe, as image and packagegroup tasks do.
+#
+# With --dump, also time bitbake -S none <target> in the current build
+# directory (which must be set up for bitbake).
+#
+import os
+import sys
+import time
+import shutil
+import hashlib
+import tempfile
+import optparse
+import subprocess
+
+sys.path.insert(0, os.path.join(os.path.abspath(os.path.dirname(sys.argv[0])), '../lib'))
+import bb
+import bb.data
+import bb.siggen
+
+tasks = ["do_fetch", "do_unpack", "do_patch", "do_configure", "do_compile",
+         "do_install", "do_package", "do_packagedata", "do_package_write_rpm",
+         "do_populate_sysroot"]
+
+class DataCache(object):
+    def __init__(self, stampdir):
+        self.basetaskhash = {}
+        self.pkg_fn = {}
+        self.file_checksums = {}
+        self.task_deps = {}
+        self.stamp = {}
+        self.stampdir = stampdir
+
+    def add(self, fn, tasks):
+        self.pkg_fn[fn] = os.path.basename(fn)
+        self.file_checksums[fn] = {}
+        self.task_deps[fn] = {}
+        self.stamp[fn] = os.path.join(self.stampdir, os.path.basename(fn))
+        for task in tasks:
+            self.basetaskhash[fn + "." + task] = hashlib.md5(fn + task).hexdigest()
+
+def make_graph(numrecipes, numimages, stampdir):
+    cache = DataCache(stampdir)
+    graph = []
+    last = []
+    for i in xrange(numrecipes):
+        fn = "/recipes/recipe%d_1.0.bb" % i
+        cache.add(fn, tasks)
+        prev = []
+        for task in tasks:
+            graph.append((fn, task, prev))
+            prev = [fn + "." + task]
+        last.extend(prev)
+    for i in xrange(numimages):
+        fn = "/recipes/image%d.bb" % i
+        cache.add(fn, ["do_rootfs"])
+        graph.append((fn, "do_rootfs", last))
+    return cache, graph
+
+def taskhashes(d, cache, graph):
+    siggen = bb.siggen.SignatureGeneratorBasic(d)
+    start = time.time()
+    for fn, task, deps in graph:
+        siggen.get_taskhash(fn, task, deps, cache)
+    return siggen, time.time() - start
+
+def dump(siggen, cache, graph):
+    for fn, task, deps in graph:
+        k = fn + "." + task
+        siggen.basehash[k] = cache.basetaskhash[k]
+        siggen.taskdeps.setdefault(fn, {})[task] = []
+        siggen.gendeps[fn] = {}
+        siggen.lookupcache.setdefault(fn, {})[task] = "value of %s" % task
+    start = time.time()
+    siggen.dump_sigs(cache, None)
+    return time.time() - start
+
+def main():
+    parser = optparse.OptionParser(usage="%prog [options]")
+    parser.add_option("-r", "--recipes", type="int", default=2000,
+                      help="number of recipes (default: %default)")
+    parser.add_option("-i", "--images", type="int", default=20,
+                      help="number of image tasks depending on every recipe (default: %default)")
+    parser.add_option("-a", "--algorithm",
+                      help="value of BB_HASHALGORITHM (default: md5)")
+    parser.add_option("--dump", metavar="TARGET",
+                      help="also time bitbake -S none TARGET")
+    options, args = parser.parse_args()
+
+    d = bb.data.init()
+    if options.algorithm:
+        d.setVar("BB_HASHALGORITHM", options.algorithm)
+
+    tempdir = tempfile.mkdtemp()
+    try:
+        cache, graph = make_graph(options.recipes, options.images, tempdir)
+        siggen, elapsed = taskhashes(d, cache, graph)
+        print("taskhash %8.3fs  (%d tasks)" % (elapsed, len(graph)))
+        elapsed = dump(siggen, cache, graph)
+        print("dump     %8.3fs" % elapsed)
+    finally:
+        shutil.rmtree(tempdir)
+
+    if options.dump:
+        start = time.time()
+        with open(os.devnull, "w") as devnull:
+            subprocess.check_call(["bitbake", "-S", "none", options.dump], stdout=devnull)
+        print("bitbake -S %8.3fs" % (time.time() - start))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,129 @@
+#!/usr/bin/env python
+# ex:ts=4:sw=4:sts=4:et
+# -*- tab-width: 4; c-basic-offset: 4; indent-tabs-mode: nil -*-
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 2 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+#
+# Measure how fast events fired in the process server reach a UI. A child
+# process plays the server and fires a parse like flood of ParseProgress
+# events interleaved with log records through bb.event, the parent reads
+# them as a UI would through ProcessEventQueue, e.g.:
+#
+#   bench-uievents.py --events 100000 --ratelimit 0.1
+#
+# --legacy sends every event on its own through the queue as the server
+# did before events were batched.
+#
+import os
+import sys
+import time
+import logging
+import optparse
+
+sys.path.insert(0, os.path.join(os.path.abspath(os.path.dirname(sys.argv[0])), '../lib'))
+import bb
+import bb.event
+import bb.server.process
+
+class LegacyEventAdapter(bb.server.process.EventAdapter):
+    def start(self):
+        pass
+
+    def send(self, event):
+        self.queue.put(event)
+
+    def flush(self):
+        pass
+
+class LegacyEventQueue(bb.server.process.ProcessEventQueue):
+    def nextEvent(self, block, timeout=None):
+        return self.get(block, timeout)
+
+class FakeServer(object):
+    def __init__(self, adapter):
+        self.event = adapter
+
+    def is_alive(self):
+        return True
+
+def server(queue, options):
+    if options.legacy:
+        adapter = LegacyEventAdapter(queue)
+    else:
+        adapter = bb.server.process.EventAdapter(queue)
+    adapter.start()
+    handle = bb.event.register_UIHhandler(FakeServer(adapter))
+    bb.event.set_UIHmask(handle, logging.INFO, {}, ["*"], options.ratelimit)
+    for i in xrange(options.events):
+        bb.event.fire_ui_handlers(bb.event.ParseProgress(i + 1, options.events), None)
+        if i % options.logevery == 0:
+            record = logging.LogRecord("BitBake", logging.INFO, __file__, i, "parsed %d", (i,), None)
+            bb.event.fire_ui_handlers(record, None)
+    bb.event.fire_ui_handlers(bb.event.ParseCompleted(0, options.events, 0, 0, 0, 0, options.events), None)
+    adapter.flush()
+    queue.close()
+    queue.join_thread()
+
+def main():
+    parser = optparse.OptionParser(usage="%prog [options]")
+    parser.add_option("-n", "--events", type="int", default=100000,
+                      help="number of progress events to fire (default: %default)")
+    parser.add_option("-l", "--logevery", type="int", default=10,
+                      help="fire a log record every this many progress events (default: %default)")
+    parser.add_option("-r", "--ratelimit", type="float", default=0,
+                      help="UI rate limit for progress events in seconds (default: %default)")
+    parser.add_option("--legacy", action="store_true",
+                      help="send events one at a time")
+    options, args = parser.parse_args()
+
+    if options.legacy:
+        queue = LegacyEventQueue(0)
+    else:
+        queue = bb.server.process.ProcessEventQueue(0)
+    queue.server = FakeServer(None)
+
+    start = time.time()
+    pid = os.fork()
+    if pid == 0:
+        try:
+            server(queue, options)
+        finally:
+            os._exit(0)
+
+    received = 0
+    lastprogress = None
+    while True:
+        event = queue.waitEvent(1)
+        if event is None:
+            if os.waitpid(pid, os.WNOHANG)[0]:
+                print("Server process exited early")
+                return 1
+            continue
+        received += 1
+        if isinstance(event, bb.event.ParseProgress):
+            lastprogress = event.current
+        elif isinstance(event, bb.event.ParseCompleted):
+            break
+    elapsed = time.time() - start
+    os.waitpid(pid, 0)
+
+    fired = options.events + (options.events + options.logevery - 1) // options.logevery + 1
+    print("%s: %d events fired, %d received in %.3fs, %.0f fired/s, last progress %s" %
+          ("legacy" if options.legacy else "batched", fired, received, elapsed,
+           fired / elapsed, lastprogress))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
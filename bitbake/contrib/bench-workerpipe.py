@@ -0,0 +1,152 @@
+#!/usr/bin/env python
+# ex:ts=4:sw=4:sts=4:et
+# -*- tab-width: 4; c-basic-offset: 4; indent-tabs-mode: nil -*-
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 2 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+#
+# Measure how fast the server side of the worker pipe (runQueuePipe) can
+# decode events. A child process writes log record events as a busy worker
+# would and the parent reads them through runQueuePipe, e.g.:
+#
+#   bench-workerpipe.py --events 200000 --size 200
+#
+# --legacy runs the same load through the old <event></event> tagged format
+# for comparison.
+#
+import os
+import sys
+import time
+import select
+import logging
+import optparse
+
+sys.path.insert(0, os.path.join(os.path.abspath(os.path.dirname(sys.argv[0])), '../lib'))
+import bb
+import bb.runqueue
+from bb.runqueue import pickle
+
+class FakeRunQueue(object):
+    worker = None
+    fakeworker = None
+    teardown = False
+
+class NullUIHandler(object):
+    """
+    UI handler discarding everything, standing in for the UI connection
+    """
+    def __init__(self):
+        self.event = self
+
+    def send(self, event):
+        pass
+
+class FakeRunQueueExecute(object):
+    def __init__(self):
+        self.exitcodes = 0
+
+    def runqueue_process_waitpid(self, task, status):
+        self.exitcodes += 1
+
+class LegacyPipe(bb.runqueue.runQueuePipe):
+    """
+    The tag searching reader runQueuePipe used before the framed format
+    """
+    def __init__(self, *args):
+        bb.runqueue.runQueuePipe.__init__(self, *args)
+        self.queue = ""
+
+    def read(self):
+        start = len(self.queue)
+        try:
+            self.queue = self.queue + self.input.read(102400)
+        except (OSError, IOError):
+            pass
+        end = len(self.queue)
+        found = True
+        while found and len(self.queue):
+            found = False
+            index = self.queue.find("</event>")
+            while index != -1 and self.queue.startswith("<event>"):
+                event = pickle.loads(self.queue[7:index])
+                bb.event.fire_from_worker(event, self.d)
+                found = True
+                self.queue = self.queue[index+8:]
+                index = self.queue.find("</event>")
+            index = self.queue.find("</exitcode>")
+            while index != -1 and self.queue.startswith("<exitcode>"):
+                task, status = pickle.loads(self.queue[10:index])
+                self.rqexec.runqueue_process_waitpid(task, status)
+                found = True
+                self.queue = self.queue[index+11:]
+                index = self.queue.find("</exitcode>")
+        return (end > start)
+
+def writer(pipeout, options):
+    msg = "x" * options.size
+    if options.legacy:
+        frame = lambda obj: "<event>" + pickle.dumps(obj) + "</event>"
+        exitcode = "<exitcode>" + pickle.dumps((0, 0)) + "</exitcode>"
+    else:
+        frame = lambda obj: bb.runqueue.frame_worker_msg(bb.runqueue.workerMsgEvent, obj)
+        exitcode = bb.runqueue.frame_worker_msg(bb.runqueue.workerMsgExitcode, (0, 0))
+    batch = []
+    for i in xrange(options.events):
+        record = logging.LogRecord("BitBake", logging.INFO, __file__, i, msg, None, None)
+        batch.append(frame(record))
+        if len(batch) == 64:
+            pipeout.write("".join(batch))
+            batch = []
+    batch.append(exitcode)
+    pipeout.write("".join(batch))
+    pipeout.close()
+
+def main():
+    parser = optparse.OptionParser(usage="%prog [options]")
+    parser.add_option("-n", "--events", type="int", default=200000,
+                      help="number of events to send (default: %default)")
+    parser.add_option("-s", "--size", type="int", default=200,
+                      help="size of each log message (default: %default)")
+    parser.add_option("--legacy", action="store_true",
+                      help="use the old tagged message format")
+    options, args = parser.parse_args()
+
+    pipein, pipeout = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(pipein)
+        writer(os.fdopen(pipeout, 'wb', 0), options)
+        os._exit(0)
+
+    os.close(pipeout)
+    bb.event.register_UIHhandler(NullUIHandler())
+    pipein = os.fdopen(pipein, 'rb', 4096)
+    rqexec = FakeRunQueueExecute()
+    pipeclass = LegacyPipe if options.legacy else bb.runqueue.runQueuePipe
+    pipe = pipeclass(pipein, None, None, FakeRunQueue(), rqexec)
+
+    start = time.time()
+    while not rqexec.exitcodes:
+        select.select([pipein], [], [], 1)
+        pipe.read()
+    elapsed = time.time() - start
+    os.waitpid(pid, 0)
+
+    print("%s format: %d events of %d bytes in %.3fs, %.0f events/s" %
+          ("legacy" if options.legacy else "framed", options.events, options.size,
+           elapsed, options.events / elapsed))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
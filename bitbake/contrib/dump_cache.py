@@ -27,9 +27,7 @@ import warnings
 
 # For importing bb.cache
 sys.path.insert(0, os.path.join(os.path.abspath(os.path.dirname(sys.argv[0])), '../lib'))
-from bb.cache import CoreRecipeInfo
-
-import cPickle as pickle
+from bb.cache import CoreRecipeInfo, IndexedCacheFile
 
 def main(argv=None):
     """
@@ -41,27 +39,28 @@ def main(argv=None):
 
     cachefile = argv[0]
 
-    with open(cachefile, "rb") as cachefile:
-        pickled = pickle.Unpickler(cachefile)
-        while cachefile:
-            try:
-                key = pickled.load()
-                val = pickled.load()
-            except Exception:
-                break
-            if isinstance(val, CoreRecipeInfo) and (not val.skipped):
-                pn = val.pn
-                # Filter out the native recipes.
-                if key.startswith('virtual:native:') or pn.endswith("-native"):
-                    continue
+    cachefile = IndexedCacheFile(cachefile)
+    try:
+        cachefile.load()
+    except ValueError as exc:
+        print >>sys.stderr, "Error, unable to load cache file: %s" % exc
+        return 1
+
+    for key in cachefile:
+        val = cachefile.get(key)
+        if isinstance(val, CoreRecipeInfo) and (not val.skipped):
+            pn = val.pn
+            # Filter out the native recipes.
+            if key.startswith('virtual:native:') or pn.endswith("-native"):
+                continue
 
-                # 1.0 is the default version for a no PV recipe.
-                if val.__dict__.has_key("pv"):
-                    pv = val.pv
-                else:
-                    pv = "1.0"
+            # 1.0 is the default version for a no PV recipe.
+            if val.__dict__.has_key("pv"):
+                pv = val.pv
+            else:
+                pv = "1.0"
 
-                print("%s %s %s %s" % (key, pn, pv, ' '.join(val.packages)))
+            print("%s %s %s %s" % (key, pn, pv, ' '.join(val.packages)))
 
 if __name__ == "__main__":
     sys.exit(main(sys.argv[1:]))
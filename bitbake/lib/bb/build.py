@@ -127,6 +127,17 @@ class TaskFailedSilent(TaskBase):
         # Don't need to tell the user it was silent
         return "Failed"
 
+class TaskOverhead(event.Event):
+    """Time from the worker being sent a task to the task starting"""
+
+    def __init__(self, t, overhead, reused, d):
+        event.Event.__init__(self)
+        self.taskfile = d.getVar("FILE", True)
+        self.taskname = t
+        self.overhead = overhead
+        # Whether the recipe data was already loaded for an earlier task
+        self.reused = reused
+
 class TaskInvalid(TaskBase):
 
     def __init__(self, task, metadata):
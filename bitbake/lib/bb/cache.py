@@ -30,7 +30,10 @@
 
 
 import os
+import mmap
+import struct
 import logging
+import collections
 from collections import defaultdict
 import bb.utils
 
@@ -43,11 +46,228 @@ except ImportError:
     logger.info("Importing cPickle failed. "
                 "Falling back to a very slow implementation.")
 
-__cache_version__ = "148"
+__cache_version__ = "149"
 
 def getCacheFile(path, filename, data_hash):
     return os.path.join(path, filename + "." + data_hash)
 
+class IndexedCacheFile(object):
+    """
+    A cache file made of individually pickled records followed by an index
+    of their offsets. The file is memory mapped and records are only
+    unpickled when asked for. Updates append the changed records and a new
+    index to the end of the file, which is rewritten once it is mostly stale.
+
+    Layout: magic, records..., pickled (cache version, bitbake version,
+    {key: (offset, length)}), trailer of (index offset, index length, magic).
+    """
+    magic = "BBCACHE1"
+    trailer = struct.Struct("!QQ8s")
+
+    def __init__(self, path):
+        self.path = path
+        self.index = {}
+        self.map = None
+        self.stat = None
+
+    def load(self):
+        """
+        Map the file and read its index, returning the cache and bitbake
+        versions it was written with. Raises ValueError if the file is
+        missing or not a valid cache file.
+        """
+        try:
+            with open(self.path, "rb") as f:
+                st = os.fstat(f.fileno())
+                if st.st_size < len(self.magic) + self.trailer.size:
+                    raise ValueError("%s is truncated" % self.path)
+                self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (IOError, OSError, mmap.error) as exc:
+            raise ValueError(str(exc))
+        self.stat = st
+
+        offset, length, magic = self.trailer.unpack_from(self.map, st.st_size - self.trailer.size)
+        if self.map[:len(self.magic)] != self.magic or magic != self.magic:
+            raise ValueError("%s is not an indexed cache file" % self.path)
+        try:
+            cache_ver, bitbake_ver, self.index = pickle.loads(self.map[offset:offset + length])
+        except Exception as exc:
+            raise ValueError("%s has an invalid index: %s" % (self.path, exc))
+        return cache_ver, bitbake_ver
+
+    def __contains__(self, key):
+        return key in self.index
+
+    def __iter__(self):
+        return iter(self.index)
+
+    def __len__(self):
+        return len(self.index)
+
+    def raw(self, key):
+        offset, length = self.index[key]
+        return self.map[offset:offset + length]
+
+    def get(self, key):
+        return pickle.loads(self.raw(key))
+
+    def close(self):
+        if self.map is not None:
+            self.map.close()
+            self.map = None
+        self.index = {}
+
+    def update(self, records, removed, reload=False):
+        """
+        Write records, a dict mapping keys to pickled data, and drop the
+        keys in removed. Unchanged records are kept from the existing file.
+        With reload the file is read again once locked, so that records
+        other processes wrote since it was loaded are kept too.
+        """
+        lock = bb.utils.lockfile(self.path + ".lock")
+        try:
+            if reload:
+                self.close()
+                try:
+                    if self.load() != (__cache_version__, bb.__version__):
+                        self.close()
+                except ValueError:
+                    pass
+            if not self._append(records, removed):
+                self._rewrite(records, removed)
+        finally:
+            bb.utils.unlockfile(lock)
+
+    def _append(self, records, removed):
+        if self.map is None:
+            return False
+        try:
+            f = open(self.path, "r+b")
+        except (IOError, OSError):
+            return False
+        with f:
+            # Only safe if nobody else has written the file since we read it
+            st = os.fstat(f.fileno())
+            if (st.st_ino, st.st_dev, st.st_size) != (self.stat.st_ino, self.stat.st_dev, self.stat.st_size):
+                return False
+
+            index = dict(self.index)
+            for key in removed:
+                index.pop(key, None)
+            kept = sum(length for key, (_, length) in index.iteritems() if key not in records)
+            live = kept + sum(len(data) for data in records.itervalues())
+            # Rewrite instead once more than half the file would be stale
+            if st.st_size - len(self.magic) - kept > live:
+                return False
+
+            f.seek(st.st_size)
+            self._write_records(f, st.st_size, records, index)
+        return True
+
+    def _rewrite(self, records, removed):
+        index = {}
+        tmpfile = "%s.%s.tmp" % (self.path, os.getpid())
+        with open(tmpfile, "wb") as f:
+            f.write(self.magic)
+            offset = len(self.magic)
+            if self.map is not None:
+                for key in self.index:
+                    if key in records or key in removed:
+                        continue
+                    data = self.raw(key)
+                    f.write(data)
+                    index[key] = (offset, len(data))
+                    offset += len(data)
+            self._write_records(f, offset, records, index)
+        os.rename(tmpfile, self.path)
+
+    def _write_records(self, f, offset, records, index):
+        for key, data in records.iteritems():
+            f.write(data)
+            index[key] = (offset, len(data))
+            offset += len(data)
+        data = pickle.dumps((__cache_version__, bb.__version__, index), pickle.HIGHEST_PROTOCOL)
+        f.write(data)
+        f.write(self.trailer.pack(offset, len(data), self.magic))
+
+class RecipeInfoMap(collections.MutableMapping):
+    """
+    Mapping of filenames to their list of RecipeInfo objects, one per cache
+    class, which are only unpickled from the cache files when accessed.
+    Changes are tracked so only they need to be written back.
+    """
+    def __init__(self):
+        self.files = []
+        self.loaded = {}
+        self.core = {}
+        self.changed = set()
+        self.removed = set()
+
+    def add_file(self, cachefile):
+        self.files.append(cachefile)
+
+    def get_core(self, key):
+        """
+        Return just the CoreRecipeInfo for key, without unpickling the
+        information held by the other cache classes
+        """
+        if key in self.loaded:
+            return self.loaded[key][0]
+        if key not in self:
+            raise KeyError(key)
+        if key not in self.core:
+            self.core[key] = self.files[0].get(key)
+        return self.core[key]
+
+    def __contains__(self, key):
+        if key in self.loaded:
+            return True
+        if key in self.removed or not self.files:
+            return False
+        return key in self.files[0]
+
+    def __getitem__(self, key):
+        if key in self.loaded:
+            return self.loaded[key]
+        if key not in self:
+            raise KeyError(key)
+        info_array = [self.get_core(key)]
+        for cachefile in self.files[1:]:
+            if key in cachefile:
+                info_array.append(cachefile.get(key))
+        self.loaded[key] = info_array
+        self.core.pop(key, None)
+        return info_array
+
+    def __setitem__(self, key, info_array):
+        self.loaded[key] = info_array
+        self.core.pop(key, None)
+        self.changed.add(key)
+        self.removed.discard(key)
+
+    def __delitem__(self, key):
+        if key not in self:
+            raise KeyError(key)
+        self.loaded.pop(key, None)
+        self.core.pop(key, None)
+        self.changed.discard(key)
+        self.removed.add(key)
+
+    def __iter__(self):
+        for key in self.loaded:
+            yield key
+        if self.files:
+            for key in self.files[0]:
+                if key not in self.loaded and key not in self.removed:
+                    yield key
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def close(self):
+        for cachefile in self.files:
+            cachefile.close()
+
 # RecipeInfoCommon defines common data retrieving methods
 # from meta data for caches. CoreRecipeInfo as well as other
 # Extra RecipeInfo needs to inherit this class
@@ -267,7 +487,7 @@ class Cache(object):
         self.cachedir = data.getVar("CACHE", True)
         self.clean = set()
         self.checked = set()
-        self.depends_cache = {}
+        self.depends_cache = RecipeInfoMap()
         self.data = None
         self.data_fn = None
         self.cacheclean = True
@@ -298,70 +518,47 @@ class Cache(object):
             logger.info("Out of date cache found, rebuilding...")
 
     def load_cachefile(self):
-        # Firstly, using core cache file information for
-        # valid checking
-        with open(self.cachefile, "rb") as cachefile:
-            pickled = pickle.Unpickler(cachefile)
-            try:
-                cache_ver = pickled.load()
-                bitbake_ver = pickled.load()
-            except Exception:
-                logger.info('Invalid cache, rebuilding...')
-                return
-
-            if cache_ver != __cache_version__:
-                logger.info('Cache version mismatch, rebuilding...')
-                return
-            elif bitbake_ver != bb.__version__:
-                logger.info('Bitbake version mismatch, rebuilding...')
-                return
-
-
+        cachefiles = []
         cachesize = 0
-        previous_progress = 0
-        previous_percent = 0
-
-        # Calculate the correct cachesize of all those cache files
         for cache_class in self.caches_array:
             if type(cache_class) is type and issubclass(cache_class, RecipeInfoCommon):
-                cachefile = getCacheFile(self.cachedir, cache_class.cachefile, self.data_hash)
-                with open(cachefile, "rb") as cachefile:
-                    cachesize += os.fstat(cachefile.fileno()).st_size
-
+                cachefile = IndexedCacheFile(getCacheFile(self.cachedir, cache_class.cachefile, self.data_hash))
+                cachefiles.append(cachefile)
+                error = None
+                try:
+                    cache_ver, bitbake_ver = cachefile.load()
+                except ValueError as exc:
+                    logger.debug(1, "Unable to load cache: %s", exc)
+                    error = 'Invalid cache, rebuilding...'
+                else:
+                    if cache_ver != __cache_version__:
+                        error = 'Cache version mismatch, rebuilding...'
+                    elif bitbake_ver != bb.__version__:
+                        error = 'Bitbake version mismatch, rebuilding...'
+                if error:
+                    logger.info(error)
+                    # Unmap the files loaded so far
+                    for cachefile in cachefiles:
+                        cachefile.close()
+                    return
+                cachesize += cachefile.stat.st_size
+
+        # Only the indexes are read here, the recipe information itself is
+        # unpickled as and when it is needed
         bb.event.fire(bb.event.CacheLoadStarted(cachesize), self.data)
-        
-        for cache_class in self.caches_array:
-            if type(cache_class) is type and issubclass(cache_class, RecipeInfoCommon):
-                cachefile = getCacheFile(self.cachedir, cache_class.cachefile, self.data_hash)
-                with open(cachefile, "rb") as cachefile:
-                    pickled = pickle.Unpickler(cachefile)                    
-                    while cachefile:
-                        try:
-                            key = pickled.load()
-                            value = pickled.load()
-                        except Exception:
-                            break
-                        if self.depends_cache.has_key(key):
-                            self.depends_cache[key].append(value)
-                        else:
-                            self.depends_cache[key] = [value]
-                        # only fire events on even percentage boundaries
-                        current_progress = cachefile.tell() + previous_progress
-                        current_percent = 100 * current_progress / cachesize
-                        if current_percent > previous_percent:
-                            previous_percent = current_percent
-                            bb.event.fire(bb.event.CacheLoadProgress(current_progress, cachesize),
-                                          self.data)
-
-                    previous_progress += current_progress
+
+        current_progress = 0
+        for cachefile in cachefiles:
+            self.depends_cache.add_file(cachefile)
+            current_progress += cachefile.stat.st_size
+            bb.event.fire(bb.event.CacheLoadProgress(current_progress, cachesize), self.data)
 
         # Note: depends cache number is corresponding to the parsing file numbers.
         # The same file has several caches, still regarded as one item in the cache
         bb.event.fire(bb.event.CacheLoadCompleted(cachesize,
-                                                  len(self.depends_cache)),
+                                                  len(cachefiles[0])),
                       self.data)
 
-    
     @staticmethod
     def virtualfn2realfn(virtualfn):
         """
@@ -435,8 +632,7 @@ class Cache(object):
         if cached:
             infos = []
             # info_array item is a list of [CoreRecipeInfo, XXXRecipeInfo]
-            info_array = self.depends_cache[filename]
-            for variant in info_array[0].variants:
+            for variant in self.depends_cache.get_core(filename).variants:
                 virtualfn = self.realfn2virtual(filename, variant)
                 infos.append((virtualfn, self.depends_cache[virtualfn]))
         else:
@@ -477,6 +673,45 @@ class Cache(object):
             return True
         return False
 
+    def cacheValidUpdateMany(self, files, num_processes):
+        """
+        Run cacheValidUpdate() for a list of (fn, appends) pairs, checking
+        shards of the list concurrently in num_processes forked processes
+        """
+        if not self.has_cache:
+            return
+
+        files = [(fn, appends) for fn, appends in files if fn not in self.checked]
+        if num_processes < 2 or len(files) < 100:
+            for fn, appends in files:
+                self.cacheValidUpdate(fn, appends)
+            return
+
+        # Several shards per process to even out the load
+        shardsize = max(len(files) // (num_processes * 4), 1)
+        shards = [files[i:i + shardsize] for i in xrange(0, len(files), shardsize)]
+
+        global _validating_cache
+        _validating_cache = self
+        pool = bb.utils.multiprocessingpool(num_processes, _validate_shard_init)
+        try:
+            results = pool.map(_validate_shard, shards)
+            pool.close()
+            pool.join()
+        except:
+            pool.terminate()
+            pool.join()
+            raise
+        finally:
+            _validating_cache = None
+
+        for fn, _ in files:
+            self.checked.add(fn)
+        for clean, removed in results:
+            self.clean.update(clean)
+            for fn in removed:
+                self.remove(fn)
+
     def cacheValidUpdate(self, fn, appends):
         """
         Is the cache valid for fn?
@@ -501,7 +736,8 @@ class Cache(object):
             self.remove(fn)
             return False
 
-        info_array = self.depends_cache[fn]
+        # Only the core information is needed for the checks
+        info_array = [self.depends_cache.get_core(fn)]
         # Check the file's timestamp
         if mtime != info_array[0].timestamp:
             logger.debug(2, "Cache: %s changed", fn)
@@ -592,31 +828,27 @@ class Cache(object):
             logger.debug(2, "Cache is clean, not saving.")
             return
 
-        file_dict = {}
-        pickler_dict = {}
-        for cache_class in self.caches_array:
-            if type(cache_class) is type and issubclass(cache_class, RecipeInfoCommon):
-                cache_class_name = cache_class.__name__
-                cachefile = getCacheFile(self.cachedir, cache_class.cachefile, self.data_hash)
-                file_dict[cache_class_name] = open(cachefile, "wb")
-                pickler_dict[cache_class_name] =  pickle.Pickler(file_dict[cache_class_name], pickle.HIGHEST_PROTOCOL)
-                   
-        pickler_dict['CoreRecipeInfo'].dump(__cache_version__)
-        pickler_dict['CoreRecipeInfo'].dump(bb.__version__)
-
-        try:
-            for key, info_array in self.depends_cache.iteritems():
-                for info in info_array:
-                    if isinstance(info, RecipeInfoCommon):
-                        cache_class_name = info.__class__.__name__
-                        pickler_dict[cache_class_name].dump(key)
-                        pickler_dict[cache_class_name].dump(info)
-        finally:
-            for cache_class in self.caches_array:
-                if type(cache_class) is type and issubclass(cache_class, RecipeInfoCommon):
-                    cache_class_name = cache_class.__name__
-                    file_dict[cache_class_name].close()
-
+        # Only the recipes which were parsed or removed need writing, the
+        # rest of each cache file is left as it is
+        cache_classes = [cache_class for cache_class in self.caches_array
+                         if type(cache_class) is type and issubclass(cache_class, RecipeInfoCommon)]
+        for idx, cache_class in enumerate(cache_classes):
+            if idx < len(self.depends_cache.files):
+                cachefile = self.depends_cache.files[idx]
+            else:
+                cachefile = IndexedCacheFile(getCacheFile(self.cachedir, cache_class.cachefile, self.data_hash))
+            records = {}
+            removed = set(self.depends_cache.removed)
+            for key in self.depends_cache.changed:
+                for info in self.depends_cache[key]:
+                    if info.__class__ is cache_class:
+                        records[key] = pickle.dumps(info, pickle.HIGHEST_PROTOCOL)
+                        break
+                else:
+                    removed.add(key)
+            cachefile.update(records, removed)
+
+        self.depends_cache.close()
         del self.depends_cache
 
     @staticmethod
@@ -636,7 +868,9 @@ class Cache(object):
         if (info_array[0].skipped or 'SRCREVINACTION' not in info_array[0].pv) and not info_array[0].nocache:
             if parsed:
                 self.cacheclean = False
-            self.depends_cache[filename] = info_array
+            # Anything not parsed came from depends_cache in the first place
+            if parsed or filename not in self.depends_cache:
+                self.depends_cache[filename] = info_array
 
     def add(self, file_name, data, cacheData, parsed=None):
         """
@@ -688,6 +922,26 @@ class Cache(object):
             raise
 
 
+# The Cache cacheValidUpdateMany() is working on, inherited by the pool
+# processes when they are forked
+_validating_cache = None
+
+def _validate_shard_init():
+    import signal
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+def _validate_shard(shard):
+    """
+    Check one shard of files against the cache in a pool process and return
+    the set of clean entries and the list of entries found to be invalid
+    """
+    cache = _validating_cache
+    cache.clean = set()
+    cache.depends_cache.removed = set()
+    for fn, appends in shard:
+        cache.cacheValidUpdate(fn, appends)
+    return cache.clean, cache.depends_cache.removed
+
 def init(cooker):
     """
     The Objective: Cache the minimum amount of data possible yet get to the
@@ -17,6 +17,10 @@
 
 import os
 import stat
+import errno
+import hashlib
+import multiprocessing
+import multiprocessing.dummy
 import bb.utils
 import logging
 from bb.cache import MultiProcessCache
@@ -56,35 +60,192 @@ class FileMtimeCache(object):
     def clear(self):
         self.cache.clear()
 
-# Checksum + mtime cache (persistent)
+def file_key(st):
+    """
+    Return the key identifying the contents of a file from its stat result
+    """
+    mtime_ns = getattr(st, "st_mtime_ns", None)
+    if mtime_ns is None:
+        mtime_ns = int(st.st_mtime * 1000000000)
+    return (st.st_dev, st.st_ino, st.st_size, mtime_ns)
+
+def md5_file(f):
+    """
+    Return the MD5 checksum of f, reading it in large blocks so other
+    threads can run while it is read and hashed
+    """
+    m = hashlib.md5()
+    with open(f, "rb") as fd:
+        while True:
+            data = fd.read(65536)
+            if not data:
+                break
+            m.update(data)
+    return m.hexdigest()
+
+# Checksum cache (persistent) keyed on the device, inode, size and mtime of
+# the files. Directory trees are also recorded so that an unchanged tree is
+# checked by looking at the directories and files it held last time rather
+# than listing it again.
 class FileChecksumCache(MultiProcessCache):
     cache_file_name = "local_file_checksum_cache.dat"
-    CACHE_VERSION = 1
+    CACHE_VERSION = 2
+
+    # Hash files using a pool of threads once there are this many to do
+    parallel_threshold = 16
 
     def __init__(self):
-        self.mtime_cache = FileMtimeCache()
+        self.dir_checksums = {}
         MultiProcessCache.__init__(self)
 
-    def get_checksum(self, f):
-        entry = self.cachedata[0].get(f)
-        cmtime = self.mtime_cache.cached_mtime(f)
+    def init_cache(self, d):
+        self.reset()
+        MultiProcessCache.init_cache(self, d)
+
+    def reset(self):
+        """
+        Forget the directory trees checked so far, files may change between
+        builds of a memory resident server
+        """
+        self.dir_checksums = {}
+
+    def create_cachedata(self):
+        # Files and directory trees
+        return [{}, {}]
+
+    def lookup(self, idx, key):
+        entry = self.cachedata_extras[idx].get(key)
+        if entry is None:
+            entry = self.cachedata[idx].get(key)
+        return entry
+
+    def get_checksum(self, f, st=None):
+        if st is None:
+            st = os.stat(f)
+        key = file_key(st)
+        entry = self.lookup(0, f)
         if entry:
-            (mtime, hashval) = entry
-            if cmtime == mtime:
+            (ckey, hashval) = entry
+            if ckey == key:
                 return hashval
             else:
-                bb.debug(2, "file %s changed mtime, recompute checksum" % f)
+                bb.debug(2, "file %s changed, recompute checksum" % f)
 
-        hashval = bb.utils.md5_file(f)
-        self.cachedata_extras[0][f] = (cmtime, hashval)
+        hashval = md5_file(f)
+        self.cachedata_extras[0][f] = (key, hashval)
         return hashval
 
+    def get_checksums(self, files, onerror=None):
+        """
+        Return a list of (file, checksum) for a list of (file, stat) pairs,
+        hashing any changed files in parallel. onerror is called with the
+        file and the exception for files which can't be read.
+        """
+        result = []
+        tohash = []
+        for f, st in files:
+            entry = self.lookup(0, f)
+            if entry and entry[0] == file_key(st):
+                result.append((f, entry[1]))
+            else:
+                tohash.append((f, st))
+
+        def hash_file(item):
+            f, st = item
+            try:
+                return (f, self.get_checksum(f, st), None)
+            except (OSError, IOError) as e:
+                return (f, None, e)
+
+        if len(tohash) >= self.parallel_threshold:
+            pool = multiprocessing.dummy.Pool(min(multiprocessing.cpu_count() * 2, len(tohash) // 4))
+            try:
+                hashed = pool.map(hash_file, tohash)
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            hashed = [hash_file(item) for item in tohash]
+
+        for f, checksum, e in hashed:
+            if e is not None:
+                if onerror:
+                    onerror(f, e)
+                continue
+            result.append((f, checksum))
+        return result
+
+    def walk_dir(self, pth):
+        """
+        List the files under pth, returning the stat keys of all the
+        directories seen and a list of (file, stat) pairs
+        """
+        dirs = []
+        files = []
+        for root, dirnames, filenames in os.walk(pth):
+            dirs.append((root, file_key(os.stat(root))))
+            for name in filenames:
+                fullpth = os.path.join(root, name)
+                try:
+                    files.append((fullpth, os.stat(fullpth)))
+                except OSError:
+                    # Dangling symlink, let get_checksum() report it
+                    files.append((fullpth, None))
+        return dirs, files
+
+    def check_dir(self, entry):
+        """
+        Return the (file, stat) pairs of a recorded tree or None if any of
+        its directories changed, meaning files may have come or gone
+        """
+        dirs, files = entry
+        for root, key in dirs:
+            try:
+                if file_key(os.stat(root)) != key:
+                    return None
+            except OSError:
+                return None
+        result = []
+        for f in files:
+            try:
+                result.append((f, os.stat(f)))
+            except OSError:
+                result.append((f, None))
+        return result
+
+    def get_dir_checksums(self, pth, onerror=None):
+        """
+        Return a list of (file, checksum) for all the files under pth
+        """
+        if pth in self.dir_checksums:
+            return self.dir_checksums[pth]
+
+        files = None
+        entry = self.lookup(1, pth)
+        if entry:
+            files = self.check_dir(entry)
+        if files is None:
+            bb.debug(2, "directory %s changed, walking it" % pth)
+            dirs, files = self.walk_dir(pth)
+            self.cachedata_extras[1][pth] = (dirs, [f for f, st in files])
+
+        if onerror:
+            for f, st in files:
+                if st is None:
+                    onerror(f, OSError(errno.ENOENT, os.strerror(errno.ENOENT), f))
+        checksums = self.get_checksums([(f, st) for f, st in files if st is not None], onerror)
+        self.dir_checksums[pth] = checksums
+        return checksums
+
     def merge_data(self, source, dest):
         for h in source[0]:
-            if h in dest:
-                (smtime, _) = source[0][h]
-                (dmtime, _) = dest[0][h]
-                if smtime > dmtime:
+            if h in dest[0]:
+                (skey, _) = source[0][h]
+                (dkey, _) = dest[0][h]
+                # Keep the newer of the two by mtime
+                if skey[3] > dkey[3]:
                     dest[0][h] = source[0][h]
             else:
                 dest[0][h] = source[0][h]
+        # Directory trees are recorded whenever they change
+        dest[1].update(source[1])
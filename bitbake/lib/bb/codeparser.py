@@ -1,7 +1,11 @@
 import ast
 import codegen
+import collections
+import imp
 import logging
+import marshal
 import os.path
+import time
 import bb.utils, bb.data
 from itertools import chain
 from pysh import pyshyacc, pyshlex, sherrors
@@ -108,14 +112,19 @@ class shellCacheLine(object):
 
 class CodeParserCache(MultiProcessCache):
     cache_file_name = "bb_codeparser.dat"
-    CACHE_VERSION = 7
+    CACHE_VERSION = 9
+    # Number of compiled expressions kept in the cache file, the most
+    # recently used ones are kept
+    expr_maxsize = 20000
 
     def __init__(self):
         MultiProcessCache.__init__(self)
         self.pythoncache = self.cachedata[0]
         self.shellcache = self.cachedata[1]
+        self.exprcache = self.cachedata[2]
         self.pythoncacheextras = self.cachedata_extras[0]
         self.shellcacheextras = self.cachedata_extras[1]
+        self.exprcacheextras = self.cachedata_extras[2]
 
         # To avoid duplication in the codeparser cache, keep
         # a lookup of hashes of objects we already have
@@ -144,11 +153,25 @@ class CodeParserCache(MultiProcessCache):
         # cachedata gets re-assigned in the parent
         self.pythoncache = self.cachedata[0]
         self.shellcache = self.cachedata[1]
+        self.exprcache = self.cachedata[2]
 
     def create_cachedata(self):
-        data = [{}, {}]
+        data = [{}, {}, {}]
         return data
 
+    def merge_data(self, source, dest):
+        MultiProcessCache.merge_data(self, source, dest)
+
+        # Compiled expressions are (key, marshalled code, last use time)
+        exprcache = dest[2]
+        for h, entry in source[2].iteritems():
+            if entry[2] > exprcache[h][2]:
+                exprcache[h] = entry
+        if len(exprcache) > self.expr_maxsize:
+            unused = sorted(exprcache, key=lambda h: exprcache[h][2])
+            for h in unused[:len(exprcache) - self.expr_maxsize]:
+                del exprcache[h]
+
 codeparsercache = CodeParserCache()
 
 def parser_cache_init(d):
@@ -269,6 +292,66 @@ class PythonParser():
 
         codeparsercache.pythoncacheextras[h] = codeparsercache.newPythonCacheLine(self.references, self.execs, self.contains)
 
+class ExpressionCache(object):
+    """
+    Process wide cache of the inline python expressions (${@...}) expanded
+    in the datastore.
+
+    The same few expressions are expanded many times in every recipe, so keep
+    the most recently used code objects along with what they reference. The
+    code objects are also saved marshalled in the codeparser cache so they
+    aren't compiled again by later runs.
+    """
+    def __init__(self, maxsize=10000):
+        self.maxsize = maxsize
+        self.entries = collections.OrderedDict()
+
+    def clear(self):
+        self.entries.clear()
+
+    def get(self, code, name, log):
+        """
+        Return a (code object, pythonCacheLine, parser) tuple for the
+        expression code found in variable name. parser is the PythonParser
+        whose messages have yet to be flushed if the expression had to be
+        parsed, otherwise None.
+        """
+        key = (name, code)
+        entry = self.entries.pop(key, None)
+        parser = None
+        if entry is None:
+            codeobj = self.compile(code, name)
+            parser = PythonParser(name, log)
+            parser.parse_python(code)
+            entry = (codeobj, codeparsercache.newPythonCacheLine(parser.references, parser.execs, parser.contains))
+            if len(self.entries) >= self.maxsize:
+                self.entries.popitem(last=False)
+        self.entries[key] = entry
+        return entry[0], entry[1], parser
+
+    def compile(self, code, name):
+        # Marshalled code is only valid for the same bytecode version
+        key = (imp.get_magic(), name, code)
+        h = hash(key)
+
+        entry = codeparsercache.exprcacheextras.get(h) or codeparsercache.exprcache.get(h)
+        if entry is not None and entry[0] == key:
+            try:
+                codeobj = marshal.loads(entry[1])
+            except (EOFError, ValueError, TypeError):
+                codeobj = None
+            if codeobj is not None:
+                if h not in codeparsercache.exprcacheextras:
+                    # Record the use so the entry survives pruning
+                    codeparsercache.exprcacheextras[h] = (key, entry[1], time.time())
+                return codeobj
+
+        codeobj = compile(code.strip(), name or "<expansion>", "eval")
+        codeparsercache.exprcacheextras[h] = (key, marshal.dumps(codeobj), time.time())
+        return codeobj
+
+expressioncache = ExpressionCache()
+
 class ShellParser():
     def __init__(self, name, log):
         self.funcdefs = set()
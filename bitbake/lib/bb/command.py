@@ -258,7 +258,11 @@ class CommandsSync:
         llevel = params[1]
         debug_domains = params[2]
         mask = params[3]
-        return bb.event.set_UIHmask(handlerNum, llevel, debug_domains, mask)
+        if len(params) > 4:
+            ratelimit = params[4]
+        else:
+            ratelimit = 0
+        return bb.event.set_UIHmask(handlerNum, llevel, debug_domains, mask, ratelimit)
 
     def setFeatures(self, command, params):
         """
@@ -178,6 +178,7 @@ class BBCooker:
         self.state = state.initial
 
         self.parser = None
+        self.idle_workers = {}
 
         signal.signal(signal.SIGTERM, self.sigterm_exception)
         # Let SIGHUP exit as SIGTERM
@@ -1524,6 +1525,7 @@ class BBCooker:
         return
 
     def post_serve(self):
+        bb.runqueue.teardown_idle_workers(self)
         prserv.serv.auto_shutdown(self.data)
         bb.event.fire(CookerExit(), self.expanded_data)
 
@@ -1872,8 +1874,9 @@ class CookerParser(object):
         self.bb_cache = bb.cache.Cache(self.cfgdata, self.cfghash, cooker.caches_array)
         self.fromcache = []
         self.willparse = []
-        for filename in self.filelist:
-            appends = self.cooker.collection.get_file_appends(filename)
+        files = [(filename, self.cooker.collection.get_file_appends(filename)) for filename in self.filelist]
+        self.bb_cache.cacheValidUpdateMany(files, self.num_processes)
+        for filename, appends in files:
             if not self.bb_cache.cacheValid(filename, appends):
                 self.willparse.append((filename, appends, cooker.caches_array))
             else:
@@ -1891,7 +1894,10 @@ class CookerParser(object):
             bb.event.fire(bb.event.ParseStarted(self.toparse), self.cfgdata)
             def init():
                 Parser.cfg = self.cfgdata
+                bb.parse.signature_cache_init(self.cfgdata)
                 multiprocessing.util.Finalize(None, bb.codeparser.parser_cache_save, args=(self.cfgdata,), exitpriority=1)
+                multiprocessing.util.Finalize(None, bb.parse.statement_cache_save, args=(self.cfgdata,), exitpriority=1)
+                multiprocessing.util.Finalize(None, bb.parse.signature_cache_save, args=(self.cfgdata,), exitpriority=1)
                 multiprocessing.util.Finalize(None, bb.fetch.fetcher_parse_save, args=(self.cfgdata,), exitpriority=1)
 
             self.feeder_quit = multiprocessing.Queue(maxsize=1)
@@ -1946,6 +1952,8 @@ class CookerParser(object):
         sync.start()
         multiprocessing.util.Finalize(None, sync.join, exitpriority=-100)
         bb.codeparser.parser_cache_savemerge(self.cooker.data)
+        # Pick up the statements saved by the parser processes
+        bb.parse.statementcache.init_cache(self.cooker.data)
         bb.fetch.fetcher_parse_done(self.cooker.data)
         if self.cooker.configuration.profile:
             profiles = []
@@ -140,6 +140,7 @@ class CookerConfiguration(object):
         self.tracking = False
         self.interface = []
         self.writeeventlog = False
+        self.server_only = False
 
         self.env = {}
 
@@ -315,9 +316,13 @@ class CookerDataBuilder(object):
             return
 
         bb.parse.init_parser(data)
+        bb.parse.statement_cache_save(data)
         data.setVar('BBINCLUDED',bb.parse.get_file_depends(data))
         self.data = data
         self.data_hash = data.get_hash()
+        # Lets the signature generator tell when a recipe is parsed from the
+        # same inputs again
+        data.setVar("__BB_CONFIG_HASH", self.data_hash)
 
 
 
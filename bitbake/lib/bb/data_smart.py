@@ -108,24 +108,23 @@ class VariableParse:
 
     def python_sub(self, match):
             code = match.group()[3:-1]
-            codeobj = compile(code.strip(), self.varname or "<expansion>", "eval")
+            codeobj, parsed, parser = bb.codeparser.expressioncache.get(code, self.varname, logger)
 
-            parser = bb.codeparser.PythonParser(self.varname, logger)
-            parser.parse_python(code)
-            if self.varname:
-                vardeps = self.d.getVarFlag(self.varname, "vardeps", True)
-                if vardeps is None:
+            if parser:
+                if self.varname:
+                    vardeps = self.d.getVarFlag(self.varname, "vardeps", True)
+                    if vardeps is None:
+                        parser.log.flush()
+                else:
                     parser.log.flush()
-            else:
-                parser.log.flush()
-            self.references |= parser.references
-            self.execs |= parser.execs
+            self.references |= parsed.refs
+            self.execs |= parsed.execs
 
-            for k in parser.contains:
+            for k in parsed.contains:
                 if k not in self.contains:
-                    self.contains[k] = parser.contains[k].copy()
+                    self.contains[k] = set(parsed.contains[k])
                 else:
-                    self.contains[k].update(parser.contains[k])
+                    self.contains[k].update(parsed.contains[k])
             value = utils.better_eval(codeobj, DataContext(self.d))
             return str(value)
 
@@ -23,6 +23,7 @@ BitBake build tools.
 # 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
 
 import os, sys
+import time
 import warnings
 try:
     import cPickle as pickle
@@ -140,18 +141,47 @@ def fire_ui_handlers(event, d):
         try:
              if not _ui_logfilters[h].filter(event):
                  continue
-             # We use pickle here since it better handles object instances
-             # which xmlrpc's marshaller does not. Events *must* be serializable
-             # by pickle.
-             if hasattr(_ui_handlers[h].event, "sendpickle"):
-                _ui_handlers[h].event.sendpickle((pickle.dumps(event)))
-             else:
-                _ui_handlers[h].event.send(event)
+             for e in _ui_logfilters[h].coalesce(event):
+                 send_ui_event(h, e)
         except:
             errors.append(h)
     for h in errors:
         del _ui_handlers[h]
 
+def send_ui_event(h, event):
+    # We use pickle here since it better handles object instances
+    # which xmlrpc's marshaller does not. Events *must* be serializable
+    # by pickle.
+    if hasattr(_ui_handlers[h].event, "sendpickle"):
+        _ui_handlers[h].event.sendpickle((pickle.dumps(event)))
+    else:
+        _ui_handlers[h].event.send(event)
+
+def flush_ui_handlers():
+    """
+    Send the events held back by UI rate limits whose interval has passed.
+    Returns the number of seconds until the next held event is due, or None
+    if none are held.
+    """
+    nextdue = None
+    errors = []
+    now = time.time()
+    for h in _ui_handlers:
+        try:
+            for e in _ui_logfilters[h].release(now):
+                send_ui_event(h, e)
+        except:
+            errors.append(h)
+            continue
+        due = _ui_logfilters[h].nextdue()
+        if due is not None and (nextdue is None or due < nextdue):
+            nextdue = due
+    for h in errors:
+        del _ui_handlers[h]
+    if nextdue is None:
+        return None
+    return max(nextdue - now, 0)
+
 def fire(event, d):
     """Fire off an Event"""
 
@@ -228,12 +258,19 @@ def unregister_UIHhandler(handlerNum):
 # Class to allow filtering of events and specific filtering of LogRecords *before* we put them over the IPC
 class UIEventFilter(object):
     def __init__(self, level, debug_domains):
+        self.lastsent = {}
+        self.held = bb.compat.OrderedDict()
+        # Only the process which registered the UI flushes held events
+        self.pid = os.getpid()
         self.update(None, level, debug_domains)
 
-    def update(self, eventmask, level, debug_domains):
+    def update(self, eventmask, level, debug_domains, ratelimit=0):
         self.eventmask = eventmask
         self.stdlevel = level
         self.debug_domains = debug_domains
+        # Minimum interval in seconds between two progress events of the
+        # same class, 0 sends all of them
+        self.ratelimit = ratelimit
 
     def filter(self, event):
         if isinstance(event, logging.LogRecord):
@@ -247,13 +284,59 @@ class UIEventFilter(object):
             return False
         return True
 
-def set_UIHmask(handlerNum, level, debug_domains, mask):
+    def coalesce(self, event):
+        """
+        Return the events to send to the UI for an event which passed the
+        filter. Progress events only report how far an operation got, so
+        one arriving within ratelimit of the last of its class replaces the
+        held back one instead. Other events, log records aside, release the
+        held events ahead of themselves so that e.g. the last progress of
+        an operation still reaches the UI before its completion. Processes
+        forked from the server send all events straight away.
+        """
+        if os.getpid() != self.pid:
+            return [event]
+        if self.ratelimit and isinstance(event, OperationProgress):
+            eid = str(event.__class__)[8:-2]
+            now = time.time()
+            if now - self.lastsent.get(eid, 0) < self.ratelimit:
+                self.held.pop(eid, None)
+                self.held[eid] = event
+                return []
+            self.held.pop(eid, None)
+            self.lastsent[eid] = now
+            return [event]
+        if self.held and not isinstance(event, logging.LogRecord):
+            return self.release() + [event]
+        return [event]
+
+    def release(self, now=None):
+        """
+        Return the held back events, all of them or with now given only
+        those whose rate limit interval has passed
+        """
+        events = []
+        for eid, event in self.held.items():
+            if now is not None and now - self.lastsent[eid] < self.ratelimit:
+                continue
+            del self.held[eid]
+            self.lastsent[eid] = now or time.time()
+            events.append(event)
+        return events
+
+    def nextdue(self):
+        """Return the time the next held back event is due to be sent"""
+        if not self.held:
+            return None
+        return min(self.lastsent[eid] for eid in self.held) + self.ratelimit
+
+def set_UIHmask(handlerNum, level, debug_domains, mask, ratelimit=0):
     if not handlerNum in _ui_handlers:
         return False
     if '*' in mask:
-        _ui_logfilters[handlerNum].update(None, level, debug_domains)
+        _ui_logfilters[handlerNum].update(None, level, debug_domains, ratelimit)
     else:
-        _ui_logfilters[handlerNum].update(mask, level, debug_domains)
+        _ui_logfilters[handlerNum].update(mask, level, debug_domains, ratelimit)
     return True
 
 def getName(e):
@@ -27,13 +27,15 @@ BitBake build tools.
 
 from __future__ import absolute_import
 from __future__ import print_function
-import os, re
+import os, re, sys
 import signal
 import glob
 import logging
 import urllib
 import urlparse
 import operator
+import threading
+import Queue
 import bb.persist_data, bb.utils
 import bb.checksum
 from bb import data
@@ -149,6 +151,9 @@ class NonLocalMethod(Exception):
     def __init__(self):
         Exception.__init__(self)
 
+class SerialDownloadNeeded(Exception):
+    """Exception raised in a download thread when a mirror's fetcher doesn't support parallel downloads"""
+
 
 class URI(object):
     """
@@ -521,6 +526,16 @@ def fetcher_parse_save(d):
 def fetcher_parse_done(d):
     _checksum_cache.save_merge(d)
 
+def fetcher_checksums_done(d):
+    """
+    Save the local file checksums computed since parsing finished
+    """
+    if any(_checksum_cache.cachedata_extras):
+        _checksum_cache.save_extras(d)
+        _checksum_cache.save_merge(d)
+        _checksum_cache.cachedata_extras = _checksum_cache.create_cachedata()
+    _checksum_cache.reset()
+
 def fetcher_compare_revisions(d):
     """
     Compare the revisions in the persistant cache with current values and
@@ -917,6 +932,10 @@ def try_mirror_url(origud, ud, ld, check = False):
                 return found
             return False
 
+        if getattr(threading.current_thread(), "parallel_download", False) and \
+                not ud.method.supports_parallel_download(ud):
+            raise SerialDownloadNeeded()
+
         os.chdir(ld.getVar("DL_DIR", True))
 
         if not verify_donestamp(ud, ld) or ud.method.need_update(ud, ld):
@@ -1111,24 +1130,20 @@ def get_file_checksums(filelist, pn):
 
     """
 
+    def checksum_error(f, e):
+        bb.warn("Unable to get checksum for %s SRC_URI entry %s: %s" % (pn, os.path.basename(f), e))
+
     def checksum_file(f):
         try:
             checksum = _checksum_cache.get_checksum(f)
         except OSError as e:
-            bb.warn("Unable to get checksum for %s SRC_URI entry %s: %s" % (pn, os.path.basename(f), e))
+            checksum_error(f, e)
             return None
         return checksum
 
     def checksum_dir(pth):
         # Handle directories recursively
-        dirchecksums = []
-        for root, dirs, files in os.walk(pth):
-            for name in files:
-                fullpth = os.path.join(root, name)
-                checksum = checksum_file(fullpth)
-                if checksum:
-                    dirchecksums.append((fullpth, checksum))
-        return dirchecksums
+        return _checksum_cache.get_dir_checksums(pth, checksum_error)
 
     checksums = []
     for pth in filelist.split():
@@ -1304,6 +1319,14 @@ class FetchMethod(object):
         """
         return False
 
+    def supports_parallel_download(self, urldata):
+        """
+        Can the url be downloaded in a thread alongside others? Fetchers
+        which change the working directory of the process while they run
+        can't be.
+        """
+        return False
+
     def _strip_leading_slashes(self, relpath):
         """
         Remove leading slash as os.path.join can't cope
@@ -1554,6 +1577,9 @@ class Fetch(object):
     def download(self, urls = []):
         """
         Fetch all urls
+
+        If BB_NUMBER_FETCH_THREADS is greater than one, that many urls are
+        downloaded concurrently, each under its own lockfile as before.
         """
         if len(urls) == 0:
             urls = self.urls
@@ -1561,77 +1587,143 @@ class Fetch(object):
         network = self.d.getVar("BB_NO_NETWORK", True)
         premirroronly = (self.d.getVar("BB_FETCH_PREMIRRORONLY", True) == "1")
 
+        try:
+            numthreads = int(self.d.getVar("BB_NUMBER_FETCH_THREADS", True) or 1)
+        except ValueError:
+            raise FetchError("Invalid BB_NUMBER_FETCH_THREADS value '%s'" % self.d.getVar("BB_NUMBER_FETCH_THREADS", True))
+
+        parallel = []
+        if numthreads > 1:
+            parallel = [u for u in urls if self.ud[u].method.supports_parallel_download(self.ud[u])]
+        if len(parallel) > 1:
+            # The other urls are fetched one at a time once no thread is
+            # running any more
+            self.download_parallel(parallel, min(numthreads, len(parallel)), network, premirroronly)
+            urls = [u for u in urls if u not in parallel]
+
         for u in urls:
-            ud = self.ud[u]
-            ud.setup_localpath(self.d)
-            m = ud.method
-            localpath = ""
+            self.download_url(u, self.d, network, premirroronly)
 
-            lf = bb.utils.lockfile(ud.lockfile)
+    def download_parallel(self, urls, numthreads, network, premirroronly):
+        """
+        Fetch urls using a pool of numthreads threads, the fetchers of all of
+        them have to support parallel downloads. Each url is fetched
+        with its own copy of the datastore since the fetchers set variables
+        such as BB_NO_NETWORK while they run. No new urls are started once one
+        has failed and the error of the first failing url in the list is
+        raised once the running fetches have finished. Urls which turn out to
+        need a mirror with a fetcher that doesn't support parallel downloads
+        are fetched again one at a time afterwards.
+        """
+        pending = Queue.Queue()
+        for u in urls:
+            pending.put((u, self.d.createCopy()))
+        failed = {}
+        serial = []
 
-            try:
-                self.d.setVar("BB_NO_NETWORK", network)
+        def fetch_worker():
+            while not failed:
+                try:
+                    u, localdata = pending.get_nowait()
+                except Queue.Empty:
+                    return
+                try:
+                    self.download_url(u, localdata, network, premirroronly)
+                except SerialDownloadNeeded:
+                    serial.append(u)
+                except Exception:
+                    failed[u] = sys.exc_info()
+
+        threads = [threading.Thread(target=fetch_worker) for i in range(numthreads)]
+        for t in threads:
+            t.parallel_download = True
+            t.start()
+        for t in threads:
+            t.join()
+
+        for u in urls:
+            if u in failed:
+                exc_type, exc_value, exc_tb = failed[u]
+                raise exc_type, exc_value, exc_tb
+
+        for u in urls:
+            if u in serial:
+                self.download_url(u, self.d, network, premirroronly)
+
+    def download_url(self, u, d, network, premirroronly):
+        """
+        Fetch a single url using the datastore d
+        """
+        ud = self.ud[u]
+        ud.setup_localpath(d)
+        m = ud.method
+        localpath = ""
+
+        lf = bb.utils.lockfile(ud.lockfile)
+
+        try:
+            d.setVar("BB_NO_NETWORK", network)
  
-                if verify_donestamp(ud, self.d) and not m.need_update(ud, self.d):
+            if verify_donestamp(ud, d) and not m.need_update(ud, d):
+                localpath = ud.localpath
+            elif m.try_premirror(ud, d):
+                logger.debug(1, "Trying PREMIRRORS")
+                mirrors = mirror_from_string(d.getVar('PREMIRRORS', True))
+                localpath = try_mirrors(d, ud, mirrors, False)
+
+            if premirroronly:
+                d.setVar("BB_NO_NETWORK", "1")
+
+            os.chdir(d.getVar("DL_DIR", True))
+
+            firsterr = None
+            if not localpath and ((not verify_donestamp(ud, d)) or m.need_update(ud, d)):
+                try:
+                    if not trusted_network(d, ud.url):
+                        raise UntrustedUrl(ud.url)
+                    logger.debug(1, "Trying Upstream")
+                    m.download(ud, d)
+                    if hasattr(m, "build_mirror_data"):
+                        m.build_mirror_data(ud, d)
                     localpath = ud.localpath
-                elif m.try_premirror(ud, self.d):
-                    logger.debug(1, "Trying PREMIRRORS")
-                    mirrors = mirror_from_string(self.d.getVar('PREMIRRORS', True))
-                    localpath = try_mirrors(self.d, ud, mirrors, False)
-
-                if premirroronly:
-                    self.d.setVar("BB_NO_NETWORK", "1")
-
-                os.chdir(self.d.getVar("DL_DIR", True))
-
-                firsterr = None
-                if not localpath and ((not verify_donestamp(ud, self.d)) or m.need_update(ud, self.d)):
-                    try:
-                        if not trusted_network(self.d, ud.url):
-                            raise UntrustedUrl(ud.url)
-                        logger.debug(1, "Trying Upstream")
-                        m.download(ud, self.d)
-                        if hasattr(m, "build_mirror_data"):
-                            m.build_mirror_data(ud, self.d)
-                        localpath = ud.localpath
-                        # early checksum verify, so that if checksum mismatched,
-                        # fetcher still have chance to fetch from mirror
-                        update_stamp(ud, self.d)
-
-                    except bb.fetch2.NetworkAccess:
+                    # early checksum verify, so that if checksum mismatched,
+                    # fetcher still have chance to fetch from mirror
+                    update_stamp(ud, d)
+
+                except bb.fetch2.NetworkAccess:
+                    raise
+
+                except BBFetchException as e:
+                    if isinstance(e, ChecksumError):
+                        logger.warn("Checksum failure encountered with download of %s - will attempt other sources if available" % u)
+                        logger.debug(1, str(e))
+                        rename_bad_checksum(ud, e.checksum)
+                    elif isinstance(e, NoChecksumError):
                         raise
+                    else:
+                        logger.warn('Failed to fetch URL %s, attempting MIRRORS if available' % u)
+                        logger.debug(1, str(e))
+                    firsterr = e
+                    # Remove any incomplete fetch
+                    m.clean(ud, d)
+                    logger.debug(1, "Trying MIRRORS")
+                    mirrors = mirror_from_string(d.getVar('MIRRORS', True))
+                    localpath = try_mirrors (d, ud, mirrors)
+
+            if not localpath or ((not os.path.exists(localpath)) and localpath.find("*") == -1):
+                if firsterr:
+                    logger.error(str(firsterr))
+                raise FetchError("Unable to fetch URL from any source.", u)
+
+            update_stamp(ud, d)
+
+        except BBFetchException as e:
+            if isinstance(e, ChecksumError):
+                logger.error("Checksum failure fetching %s" % u)
+            raise
 
-                    except BBFetchException as e:
-                        if isinstance(e, ChecksumError):
-                            logger.warn("Checksum failure encountered with download of %s - will attempt other sources if available" % u)
-                            logger.debug(1, str(e))
-                            rename_bad_checksum(ud, e.checksum)
-                        elif isinstance(e, NoChecksumError):
-                            raise
-                        else:
-                            logger.warn('Failed to fetch URL %s, attempting MIRRORS if available' % u)
-                            logger.debug(1, str(e))
-                        firsterr = e
-                        # Remove any incomplete fetch
-                        m.clean(ud, self.d)
-                        logger.debug(1, "Trying MIRRORS")
-                        mirrors = mirror_from_string(self.d.getVar('MIRRORS', True))
-                        localpath = try_mirrors (self.d, ud, mirrors)
-
-                if not localpath or ((not os.path.exists(localpath)) and localpath.find("*") == -1):
-                    if firsterr:
-                        logger.error(str(firsterr))
-                    raise FetchError("Unable to fetch URL from any source.", u)
-
-                update_stamp(ud, self.d)
-
-            except BBFetchException as e:
-                if isinstance(e, ChecksumError):
-                    logger.error("Checksum failure fetching %s" % u)
-                raise
-
-            finally:
-                bb.utils.unlockfile(lf)
+        finally:
+            bb.utils.unlockfile(lf)
 
     def checkstatus(self, urls = []):
         """
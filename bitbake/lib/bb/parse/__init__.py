@@ -28,11 +28,18 @@ handlers = []
 
 import os
 import stat
+import hashlib
 import logging
 import bb
+import bb.cache
 import bb.utils
 import bb.siggen
 
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+
 logger = logging.getLogger("BitBake.Parsing")
 
 class ParseError(Exception):
@@ -112,8 +119,129 @@ def init(fn, data):
         if h['supports'](fn):
             return h['init'](data)
 
+class StatementCache(object):
+    """
+    Cache of the statements parsed from each file, by absolute path and the
+    name the file was parsed as, which the statements refer to.
+
+    Statements of the files which are parsed many times in a process
+    (classes, includes and configuration files) are kept in memory and
+    checked against the size and mtime of the file. Statements of recipes
+    are stored in a cache file shared by all the parser processes and
+    checked against a hash of the file's contents, so that a reparse only
+    needs to tokenize the recipes which changed.
+    """
+    cache_file_name = "bb_statements.dat"
+    CACHE_VERSION = 2
+
+    def __init__(self):
+        self.cachefile = None
+        self.statements = {}
+        self.extras = {}
+
+    def init_cache(self, d):
+        cachedir = (d.getVar("PERSISTENT_DIR", True) or
+                    d.getVar("CACHE", True))
+        if cachedir in [None, '']:
+            return
+        bb.utils.mkdirhier(cachedir)
+        path = os.path.join(cachedir, self.cache_file_name)
+        if self.cachefile is not None:
+            self.cachefile.close()
+        self.cachefile = bb.cache.IndexedCacheFile(path)
+        try:
+            if self.cachefile.load() != (bb.cache.__cache_version__, bb.__version__):
+                self.cachefile.close()
+        except ValueError:
+            pass
+
+    @staticmethod
+    def filekey(fn):
+        st = os.stat(fn)
+        return (st.st_size, st.st_mtime)
+
+    def lookup_kept(self, fn, name=None):
+        """
+        Return the statements kept for fn parsed as name, which defaults to
+        fn, if the file hasn't changed since
+        """
+        name = name or fn
+        fn = os.path.abspath(fn)
+        entry = self.statements.get(fn)
+        if entry is None:
+            return None
+        key, parsedname, statements = entry
+        if parsedname != name or key != self.filekey(fn):
+            return None
+        return statements
+
+    def keep(self, fn, key, statements, name=None):
+        """
+        Keep the statements parsed from fn as name while the file had the
+        given filekey()
+        """
+        name = name or fn
+        self.statements[os.path.abspath(fn)] = (key, name, statements)
+
+    def stored(self, fn):
+        if fn in self.extras:
+            return pickle.loads(self.extras[fn])
+        if self.cachefile is None or fn not in self.cachefile:
+            return None
+        try:
+            return self.cachefile.get(fn)
+        except Exception:
+            return None
+
+    def lookup(self, fn, data, name=None):
+        """
+        Return the statements stored for fn parsed as name, which defaults to
+        fn, if its contents are still data
+        """
+        name = name or fn
+        fn = os.path.abspath(fn)
+        entry = self.stored(fn)
+        if entry is None or entry[0] != self.CACHE_VERSION:
+            return None
+
+        version, h, parsedname, statements = entry
+        if parsedname != name or h != hashlib.md5(data).hexdigest():
+            return None
+        return statements
+
+    def add(self, fn, data, statements, name=None):
+        """
+        Store the statements parsed from fn as name with contents data when
+        the cache is next saved
+        """
+        name = name or fn
+        fn = os.path.abspath(fn)
+        entry = (self.CACHE_VERSION, hashlib.md5(data).hexdigest(), name, statements)
+        # Pickled right away, the statements take a lot more memory
+        self.extras[fn] = pickle.dumps(entry, pickle.HIGHEST_PROTOCOL)
+
+    def save(self):
+        if self.cachefile is None or not self.extras:
+            return
+        records = self.extras
+        removed = [fn for fn in self.cachefile if fn not in records and not os.path.exists(fn)]
+        self.cachefile.update(records, removed, reload=True)
+        self.extras = {}
+
+statementcache = StatementCache()
+
 def init_parser(d):
     bb.parse.siggen = bb.siggen.init(d)
+    statementcache.init_cache(d)
+
+def statement_cache_save(d):
+    statementcache.save()
+
+def signature_cache_init(d):
+    bb.parse.siggen.init_cache(d)
+
+def signature_cache_save(d):
+    bb.parse.siggen.save_cache()
 
 def resolve_file(fn, d):
     if not os.path.isabs(fn):
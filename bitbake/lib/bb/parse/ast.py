@@ -181,7 +181,9 @@ class MethodFlagsNode(AstNode):
     def __init__(self, filename, lineno, key, m):
         AstNode.__init__(self, filename, lineno)
         self.key = key
-        self.m = m
+        # Only keep what's needed of the match so the node can be pickled
+        self.python = m.group("py") is not None
+        self.fakeroot = m.group("fr") is not None
 
     def eval(self, data):
         if data.getVar(self.key):
@@ -189,11 +191,11 @@ class MethodFlagsNode(AstNode):
             # flags could cause problems
             data.setVarFlag(self.key, 'python', None)
             data.setVarFlag(self.key, 'fakeroot', None)
-        if self.m.group("py") is not None:
+        if self.python:
             data.setVarFlag(self.key, "python", "1")
         else:
             data.delVarFlag(self.key, "python")
-        if self.m.group("fr") is not None:
+        if self.fakeroot:
             data.setVarFlag(self.key, "fakeroot", "1")
         else:
             data.delVarFlag(self.key, "fakeroot")
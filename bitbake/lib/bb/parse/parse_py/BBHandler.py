@@ -27,6 +27,7 @@
 
 from __future__ import absolute_import
 import re, bb, os
+from cStringIO import StringIO
 import logging
 import bb.build, bb.utils
 from bb import data
@@ -53,8 +54,6 @@ __inpython__ = False
 __body__   = []
 __classname__ = ""
 
-cached_statements = {}
-
 # We need to indicate EOF to the feeder. This code is so messy that
 # factoring it out to a close_parse_file method is out of question.
 # We will use the IN_PYTHON_EOF as an indicator to just close the method
@@ -92,29 +91,43 @@ def inherit(files, fn, lineno, d):
             __inherit_cache = d.getVar('__inherit_cache') or []
 
 def get_statements(filename, absolute_filename, base_name):
-    global cached_statements
+    # Classes and includes are parsed over and over, recipes just once
+    keep = filename.endswith(".bbclass") or filename.endswith(".inc")
+    if keep:
+        statements = bb.parse.statementcache.lookup_kept(absolute_filename, filename)
+        if statements is not None:
+            return statements
+        key = bb.parse.statementcache.filekey(absolute_filename)
+
+    with open(absolute_filename, 'r') as f:
+        contents = f.read()
+
+    if not keep:
+        statements = bb.parse.statementcache.lookup(absolute_filename, contents, filename)
+        if statements is not None:
+            return statements
+
+    file = StringIO(contents)
+    statements = ast.StatementGroup()
+
+    lineno = 0
+    while True:
+        lineno = lineno + 1
+        s = file.readline()
+        if not s: break
+        s = s.rstrip()
+        feeder(lineno, s, filename, base_name, statements)
+    if __inpython__:
+        # add a blank line to close out any python definition
+        feeder(IN_PYTHON_EOF, "", filename, base_name, statements)
 
-    try:
-        return cached_statements[absolute_filename]
-    except KeyError:
-        file = open(absolute_filename, 'r')
-        statements = ast.StatementGroup()
-
-        lineno = 0
-        while True:
-            lineno = lineno + 1
-            s = file.readline()
-            if not s: break
-            s = s.rstrip()
-            feeder(lineno, s, filename, base_name, statements)
-        file.close()
-        if __inpython__:
-            # add a blank line to close out any python definition
-            feeder(IN_PYTHON_EOF, "", filename, base_name, statements)
-
-        if filename.endswith(".bbclass") or filename.endswith(".inc"):
-            cached_statements[absolute_filename] = statements
-        return statements
+    # Unterminated functions and lines are only reported once evaluated
+    if not __infunc__ and not __residue__:
+        if keep:
+            bb.parse.statementcache.keep(absolute_filename, key, statements, filename)
+        else:
+            bb.parse.statementcache.add(absolute_filename, contents, statements, filename)
+    return statements
 
 def handle(fn, d, include):
     global __func_start_regexp__, __inherit_regexp__, __export_func_regexp__, __addtask_regexp__, __addhandler_regexp__, __infunc__, __body__, __residue__, __classname__
@@ -26,6 +26,7 @@
 
 import re, os
 import logging
+from cStringIO import StringIO
 import bb.utils
 from bb.parse import ParseError, resolve_file, ast, logger, handle
 
@@ -115,11 +116,33 @@ def handle(fn, data, include):
         oldfile = data.getVar('FILE')
 
     abs_fn = resolve_file(fn, data)
-    f = open(abs_fn, 'r')
 
     if include:
         bb.parse.mark_dependency(data, abs_fn)
 
+    statements = get_statements(fn, abs_fn)
+
+    # DONE WITH PARSING... time to evaluate
+    data.setVar('FILE', abs_fn)
+    statements.eval(data)
+    if oldfile:
+        data.setVar('FILE', oldfile)
+
+    for f in confFilters:
+        f(fn, data)
+
+    return data
+
+def get_statements(fn, abs_fn):
+    statements = bb.parse.statementcache.lookup_kept(abs_fn)
+    if statements is not None:
+        return statements
+    key = bb.parse.statementcache.filekey(abs_fn)
+
+    with open(abs_fn, 'r') as f:
+        contents = f.read()
+
+    f = StringIO(contents)
     statements = ast.StatementGroup()
     lineno = 0
     while True:
@@ -143,18 +166,8 @@ def handle(fn, data, include):
             continue
         feeder(lineno, s, abs_fn, statements)
 
-    # DONE WITH PARSING... time to evaluate
-    data.setVar('FILE', abs_fn)
-    statements.eval(data)
-    if oldfile:
-        data.setVar('FILE', oldfile)
-
-    f.close()
-
-    for f in confFilters:
-        f(fn, data)
-
-    return data
+    bb.parse.statementcache.keep(abs_fn, key, statements)
+    return statements
 
 def feeder(lineno, s, fn, statements):
     m = __config_regexp__.match(s)
@@ -0,0 +1,176 @@
+
+# lib/bb/pysh/pyshtables.py
+# This file is automatically generated. Do not edit.
+_tabversion = '3.2'
+
+_lr_method = 'LALR'
+
+_lr_signature = 'S\xc5=P\x87\x06\x9d\x89~F_:iA\xc5\xcf'
+    
+_lr_action_items = {'For':([0,2,3,8,9,10,11,14,15,16,20,21,22,23,24,25,26,27,28,29,31,32,33,34,35,36,38,39,41,42,43,45,46,47,48,49,50,51,52,53,54,55,56,57,59,60,61,62,63,64,67,68,69,70,71,72,73,74,75,76,77,78,79,80,81,82,83,84,85,87,88,92,93,94,95,99,101,102,103,104,105,106,107,108,110,111,112,113,114,116,117,119,120,121,122,123,124,125,126,127,128,129,131,132,133,134,135,136,137,138,139,140,141,142,143,144,145,146,147,148,151,153,155,156,157,160,167,168,169,170,172,173,174,181,185,187,190,193,195,197,198,199,200,203,],[22,-2,-142,-138,-87,-24,-25,-16,22,22,-126,22,-34,-26,-127,-84,-17,-144,-11,-7,-1,22,-85,-22,-111,22,22,-113,-12,-82,-67,-8,-19,-21,-143,-5,22,-20,22,-14,-23,-79,-59,-145,-146,-122,-115,-121,-116,-117,-3,-99,-93,-103,-75,22,-107,-89,-105,-60,-97,-101,-91,-74,-95,-118,-114,-112,-124,-128,22,-18,-109,-147,-147,-119,-120,-147,-123,-134,-4,-132,22,-131,-13,-88,22,-86,-83,-129,-130,-100,-94,-104,-108,-90,-106,-98,-102,-92,-96,-125,-27,22,-147,-110,22,22,-147,22,-139,-73,22,-68,-141,22,-133,-6,-66,22,-35,22,-9,-10,22,-15,-69,-70,22,22,-62,-140,-76,-44,-36,-71,-61,22,-42,-43,-37,22,22,22,]),'LESS':([0,2,3,8,9,10,11,14,15,16,18,20,21,22,23,24,25,26,27,28,29,31,32,33,34,35,36,38,39,41,42,43,45,46,47,48,49,50,51,52,53,54,55,56,57,59,60,61,62,63,64,67,68,69,70,71,72,73,74,75,76,77,78,79,80,81,82,83,84,85,87,88,92,93,94,95,99,101,102,103,104,105,106,107,108,110,111,112,113,114,116,117,119,120,121,122,123,124,125,126,127,128,129,131,132,133,134,135,136,138,139,140,141,142,143,144,145,146,147,148,151,153,155,156,160,167,168,169,170,172,173,174,181,185,187,190,193,195,197,198,199,200,203,],[5,-2,-142,-138,-87,-24,-25,-16,5,5,5,-126,5,-34,-26,-127,-84,5,-144,-11,-7,-1,5,-85,-22,-111,5,5,-113,-12,-82,-67,-8,-19,-21,-143,-5,5,-20,5,-14,-23,5,-59,-145,-146,-122,-115,-121,-116,-117,-3,-99,-93,-103,-75,5,-107,-89,-105,-60,-97,-101,-91,-74,-95,-118,-114,-112,-124,-128,5,5,-109,-147,-147,-119,-120,-147,-123,-134,-4,-132,5,-131,-13,-88,5,-86,-83,-129,-130,-100,-94,-104,-108,-90,-106,-98,-102,-92,-96,-125,-27,5,-147,-110,5,5,5,-139,-73,5,-68,-141,5,-133,-6,-66,5,-35,5,-9,-10,-15,-69,5,5,5,-62,-140,-76,-44,-36,5,-61,5,-42,-43,-37,5,5,5,]),'HERENAME':([19,44,],[86,86,]),'ASSIGNMENT_WORD':([0,2,3,8,9,10,11,14,15,16,20,21,22,23,24,25,26,27,28,29,31,32,33,34,35,36,38,39,41,42,43,45,46,47,48,49,50,51,52,53,54,55,56,57,59,60,61,62,63,64,67,68,69,70,71,72,73,74,75,76,77,78,79,80,81,82,83,84,85,87,88,92,93,94,95,99,101,102,103,104,105,106,107,108,110,111,112,113,114,116,117,119,120,121,122,123,124,125,126,127,128,129,131,132,133,134,135,136,138,139,140,141,142,143,144,145,146,147,148,151,153,155,156,160,167,168,169,170,172,173,174,181,185,187,190,193,195,197,198,199,200,203,],[25,-2,-142,-138,-87,-24,-25,-16,25,25,-126,25,-34,-26,-127,-84,-17,-144,-11,-7,-1,25,-85,-22,-111,25,25,-113,-12,-82,-67,-8,-19,-21,-143,-5,25,-20,25,-14,-23,25,-59,-145,-146,-122,-115,-121,-116,-117,-3,-99,-93,-103,-75,25,-107,-89,-105,-60,-97,-101,-91,-74,-95,-118,-114,-112,-124,-128,25,-18,-109,-147,-147,-119,-120,-147,-123,-134,-4,-132,25,-131,-13,-88,25,-86,-83,-129,-130,-100,-94,-104,-108,-90,-106,-98,-102,-92,-96,-125,-27,25,-147,-110,25,25,25,-139,-73,25,-68,-141,25,-133,-6,-66,25,-35,25,-9,-10,-15,-69,-70,25,25,-62,-140,-76,-44,-36,-71,-61,25,-42,-43,-37,25,25,25,]),'CLOBBER':([0,2,3,8,9,10,11,14,15,16,18,20,21,22,23,24,25,26,27,28,29,31,32,33,34,35,36,38,39,41,42,43,45,46,47,48,49,50,51,52,53,54,55,56,57,59,60,61,62,63,64,67,68,69,70,71,72,73,74,75,76,77,78,79,80,81,82,83,84,85,87,88,92,93,94,95,99,101,102,103,104,105,106,107,108,110,111,112,113,114,116,117,119,120,121,122,123,124,125,126,127,128,129,131,132,133,134,135,136,138,139,140,141,142,143,144,145,146,147,148,151,153,155,156,160,167,168,169,170,172,173,174,181,185,187,190,193,195,197,198,199,200,203,],[6,-2,-142,-138,-87,-24,-25,-16,6,6,6,-126,6,-34,-26,-127,-84,6,-144,-11,-7,-1,6,-85,-22,-111,6,6,-113,-12,-82,-67,-8,-19,-21,-143,-5,6,-20,6,-14,-23,6,-59,-145,-146,-122,-115,-121,-116,-117,-3,-99,-93,-103,-75,6,-107,-89,-105,-60,-97,-101,-91,-74,-95,-118,-114,-112,-124,-128,6,6,-109,-147,-147,-119,-120,-147,-123,-134,-4,-132,6,-131,-13,-88,6,-86,-83,-129,-130,-100,-94,-104,-108,-90,-106,-98,-102,-92,-96,-125,-27,6,-147,-110,6,6,6,-139,-73,6,-68,-141,6,-133,-6,-66,6,-35,6,-9,-10,-15,-69,6,6,6,-62,-140,-76,-44,-36,6,-61,6,-42,-43,-37,6,6,6,]),'DSEMI':([9,10,11,14,16,22,23,24,25,26,28,33,34,35,39,41,42,43,45,46,47,48,51,53,54,55,56,57,59,60,61,62,63,64,68,69,70,71,72,73,74,75,76,77,78,79,80,81,82,83,84,85,87,89,91,92,93,99,101,103,104,106,108,110,111,112,113,114,116,117,119,120,121,122,123,124,125,126,127,128,129,130,131,132,133,134,140,142,145,147,148,151,153,154,155,156,160,167,168,172,173,174,181,185,187,190,193,195,197,198,200,202,203,204,206,207,],[-87,-24,-25,-16,-81,-34,-26,-127,-84,-17,-11,-85,-22,-111,-113,-12,-82,-67,-8,-19,-21,-143,-20,-14,-23,-79,-59,-145,-146,-122,-115,-121,-116,-117,-99,-93,-103,-75,-80,-107,-89,-105,-60,-97,-101,-91,-74,-95,-118,-114,-112,-124,-128,-33,-28,-18,-109,-119,-120,-123,-134,-132,-131,-13,-88,-78,-86,-83,-129,-130,-100,-94,-104,-108,-90,-106,-98,-102,-92,-96,-125,-29,-27,-30,-147,-110,-73,-68,-133,-66,-77,-35,-31,-32,-9,-10,-15,-69,-70,-62,-140,-76,-44,-36,-71,-61,-147,-42,-43,-37,-147,208,-129,210,212,214,]),'Esac':([9,10,11,14,16,22,23,24,25,26,28,33,34,35,39,41,42,43,45,46,47,48,51,53,54,55,56,57,59,60,61,62,63,64,68,69,70,71,72,73,74,75,76,77,78,79,80,81,82,83,84,85,87,89,91,92,93,99,101,103,104,106,108,110,111,112,113,114,116,117,119,120,121,122,123,124,125,126,127,128,129,130,131,132,133,134,140,142,145,147,148,149,150,151,153,154,155,156,160,161,167,168,172,173,174,177,178,180,181,182,185,187,190,193,194,195,196,197,198,200,202,203,204,206,207,208,209,210,212,213,214,215,216,217,218,],[-87,-24,-25,-16,-81,-34,-26,-127,-84,-17,-11,-85,-22,-111,-113,-12,-82,-67,-8,-19,-21,-143,-20,-14,-23,-79,-59,-145,-146,-122,-115,-121,-116,-117,-99,-93,-103,-75,-80,-107,-89,-105,-60,-97,-101,-91,-74,-95,-118,-114,-112,-124,-128,-33,-28,-18,-109,-119,-120,-123,-134,-132,-131,-13,-88,-78,-86,-83,-129,-130,-100,-94,-104,-108,-90,-106,-98,-102,-92,-96,-125,-29,-27,-30,-147,-110,-73,-68,-133,-66,-77,-39,-147,-35,-31,-32,-9,-10,-15,181,-69,-70,-62,-140,-76,195,197,-46,-44,-48,-36,-71,-61,-147,-45,-42,-47,-43,-37,-147,-49,-129,-147,-51,-147,-147,-50,-147,-147,-52,-147,-53,-54,-55,-56,]),'GREATAND':([0,2,3,8,9,10,11,14,15,16,18,20,21,22,23,24,25,26,27,28,29,31,32,33,34,35,36,38,39,41,42,43,45,46,47,48,49,50,51,52,53,54,55,56,57,59,60,61,62,63,64,67,68,69,70,71,72,73,74,75,76,77,78,79,80,81,82,83,84,85,87,88,92,93,94,95,99,101,102,103,104,105,106,107,108,110,111,112,113,114,116,117,119,120,121,122,123,124,125,126,127,128,129,131,132,133,134,135,136,138,139,140,141,142,143,144,145,146,147,148,151,153,155,156,160,167,168,169,170,172,173,174,181,185,187,190,193,195,197,198,199,200,203,],[17,-2,-142,-138,-87,-24,-25,-16,17,17,17,-126,17,-34,-26,-127,-84,17,-144,-11,-7,-1,17,-85,-22,-111,17,17,-113,-12,-82,-67,-8,-19,-21,-143,-5,17,-20,17,-14,-23,17,-59,-145,-146,-122,-115,-121,-116,-117,-3,-99,-93,-103,-75,17,-107,-89,-105,-60,-97,-101,-91,-74,-95,-118,-114,-112,-124,-128,17,17,-109,-147,-147,-119,-120,-147,-123,-134,-4,-132,17,-131,-13,-88,17,-86,-83,-129,-130,-100,-94,-104,-108,-90,-106,-98,-102,-92,-96,-125,-27,17,-147,-110,17,17,17,-139,-73,17,-68,-141,17,-133,-6,-66,17,-35,17,-9,-10,-15,-69,17,17,17,-62,-140,-76,-44,-36,17,-61,17,-42,-43,-37,17,17,17,]),'Until':([0,2,3,8,9,10,11,14,15,16,20,21,22,23,24,25,26,27,28,29,31,32,33,34,35,36,38,39,41,42,43,45,46,47,48,49,50,51,52,53,54,55,56,57,59,60,61,62,63,64,67,68,69,70,71,72,73,74,75,76,77,78,79,80,81,82,83,84,85,87,88,92,93,94,95,99,101,102,103,104,105,106,107,108,110,111,112,113,114,116,117,119,120,121,122,123,124,125,126,127,128,129,131,132,133,134,135,136,137,138,139,140,141,142,143,144,145,146,147,148,151,153,155,156,157,160,167,168,169,170,172,173,174,181,185,187,190,193,195,197,198,199,200,203,],[43,-2,-142,-138,-87,-24,-25,-16,43,43,-126,43,-34,-26,-127,-84,-17,-144,-11,-7,-1,43,-85,-22,-111,43,43,-113,-12,-82,-67,-8,-19,-21,-143,-5,43,-20,43,-14,-23,-79,-59,-145,-146,-122,-115,-121,-116,-117,-3,-99,-93,-103,-75,43,-107,-89,-105,-60,-97,-101,-91,-74,-95,-118,-114,-112,-124,-128,43,-18,-109,-147,-147,-119,-120,-147,-123,-134,-4,-132,43,-131,-13,-88,43,-86,-83,-129,-130,-100,-94,-104,-108,-90,-106,-98,-102,-92,-96,-125,-27,43,-147,-110,43,43,-147,43,-139,-73,43,-68,-141,43,-133,-6,-66,43,-35,43,-9,-10,43,-15,-69,-70,43,43,-62,-140,-76,-44,-36,-71,-61,43,-42,-43,-37,43,43,43,]),'Then':([9,10,11,14,16,22,23,24,25,26,28,33,34,35,39,41,42,43,45,46,47,48,51,53,54,55,56,57,59,60,61,62,63,64,68,69,70,71,72,73,74,75,76,77,78,79,80,81,82,83,84,85,87,89,91,92,93,97,99,101,103,104,106,108,110,111,112,113,114,116,117,119,120,121,122,123,124,125,126,127,128,129,130,131,132,133,134,140,142,145,147,148,151,153,154,155,156,160,167,168,172,173,174,181,185,187,188,190,195,197,198,],[-87,-24,-25,-16,76,-34,-26,-127,-84,-17,-11,-85,-22,-111,-113,-12,-82,-67,-8,-19,-21,-143,-20,-14,-23,-79,-59,-145,-146,-122,-115,-121,-116,-117,-99,-93,-103,-75,76,-107,-89,-105,-60,-97,-101,-91,-74,-95,-118,-114,-112,-124,-128,-33,-28,-18,-109,76,-119,-120,-123,-134,-132,-131,-13,-88,76,-86,-83,-129,-130,-100,-94,-104,-108,-90,-106,-98,-102,-92,-96,-125,-29,-27,-30,-147,-110,-73,-68,-133,-66,76,-35,-31,-32,-9,-10,-15,-69,-70,-62,-140,-76,-44,-36,-71,76,-61,-42,-43,-37,]),'LPARENS':([0,2,3,8,9,10,11,14,15,16,20,21,22,23,24,25,26,27,28,29,30,31,32,33,34,35,36,38,39,41,42,43,45,46,47,48,49,50,51,52,53,54,55,56,57,59,60,61,62,63,64,67,68,69,70,71,72,73,74,75,76,77,78,79,80,81,82,83,84,85,87,88,92,93,94,95,99,101,102,103,104,105,106,107,108,110,111,112,113,114,116,117,119,120,121,122,123,124,125,126,127,128,129,131,132,133,134,135,136,137,138,139,140,141,142,143,144,145,146,147,148,149,150,151,153,155,156,157,160,161,167,168,169,170,172,173,174,177,181,182,185,187,190,193,195,196,197,198,199,200,203,208,210,212,214,215,216,217,218,],[21,-2,-142,-138,-87,-24,-25,-16,21,-81,-126,21,-34,-26,-127,-84,-17,-144,-11,-7,96,-1,21,-85,-22,-111,21,21,-113,-12,-72,-67,-8,-19,-21,-143,-5,21,-20,21,-14,-23,-79,-59,-145,-146,-122,-115,-121,-116,-117,-3,-99,-93,-103,-75,-80,-107,-89,-105,-60,-97,-101,-91,-74,-95,-118,-114,-112,-124,-128,21,-18,-109,-147,-147,-119,-120,-147,-123,-134,-4,-132,21,-131,-13,-88,-78,-86,-83,-129,-130,-100,-94,-104,-108,-90,-106,-98,-102,-92,-96,-125,-27,21,-147,-110,21,21,-147,21,-139,-73,21,-68,-141,21,-133,-6,-66,-77,-39,-147,-35,21,-9,-10,21,-15,175,-69,-70,21,21,-62,-140,-76,175,-44,-48,-36,-71,-61,21,-42,-47,-43,-37,21,21,21,-147,-147,-147,-147,-53,-54,-55,-56,]),'RPARENS':([9,10,11,14,16,22,23,24,25,26,28,33,34,35,39,41,42,43,45,46,47,48,51,53,54,55,56,57,59,60,61,62,63,64,68,69,70,71,72,73,74,75,76,77,78,79,80,81,82,83,84,85,87,89,90,91,92,93,96,99,101,103,104,106,108,110,111,112,113,114,116,117,119,120,121,122,123,124,125,126,127,128,129,130,131,132,133,134,140,142,145,147,148,151,153,154,155,156,160,167,168,172,173,174,176,179,181,185,187,190,191,195,197,198,201,],[-87,-24,-25,-16,-81,-34,-26,-127,-84,-17,-11,-85,-22,-111,-113,-12,-82,-67,-8,-19,-21,-143,-20,-14,-23,-79,-59,-145,-146,-122,-115,-121,-116,-117,-99,-93,-103,-75,-80,-107,-89,-105,-60,-97,-101,-91,-74,-95,-118,-114,-112,-124,-128,-33,131,-28,-18,-109,137,-119,-120,-123,-134,-132,-131,-13,-88,-78,-86,-83,-129,-130,-100,-94,-104,-108,-90,-106,-98,-102,-92,-96,-125,-29,-27,-30,-147,-110,-73,-68,-133,-66,-77,-35,-31,-32,-9,-10,-15,-69,-70,-62,-140,-76,193,-57,-44,-36,-71,-61,200,-42,-43,-37,-58,]),'NEWLINE':([0,3,8,9,10,11,14,16,20,21,22,23,24,25,26,28,29,32,33,34,35,36,38,39,41,42,43,45,46,47,48,49,50,51,53,54,55,56,57,58,59,60,61,62,63,64,65,66,68,69,70,71,72,73,74,75,76,77,78,79,80,81,82,83,84,85,87,88,89,91,92,93,94,95,99,101,102,103,104,106,107,108,110,111,112,113,114,116,117,119,120,121,122,123,124,125,126,127,128,129,130,131,132,133,134,137,138,139,140,141,142,143,145,146,147,148,149,150,151,152,153,154,155,156,160,162,163,165,166,167,168,169,170,172,173,174,181,184,185,187,190,193,195,197,198,199,200,203,204,207,208,210,212,214,],[24,-142,-138,-87,-24,-25,-16,-81,87,24,-34,-26,-127,-84,-17,-11,-7,24,-85,-22,-111,24,24,-113,-12,-82,-67,-8,-19,-21,-143,24,24,-20,-14,-23,-79,-59,-145,24,-146,-122,-115,-121,-116,-117,24,-38,-99,-93,-103,-75,-80,-107,-89,-105,-60,-97,-101,-91,-74,-95,-118,-114,-112,-124,-128,87,-33,24,-18,-109,24,24,-119,-120,24,-123,87,-132,24,-131,-13,-88,-78,-86,-83,87,-130,-100,-94,-104,-108,-90,-106,-98,-102,-92,-96,-125,24,-27,-30,24,-110,24,24,-139,-73,24,-68,-141,-133,-6,-66,-77,-39,24,-35,24,-31,-32,-9,-10,-15,24,87,-41,24,-69,-70,24,24,-62,-140,-76,-44,-40,-36,-71,-61,24,-42,-43,-37,24,24,87,24,24,24,24,24,24,]),'DGREAT':([0,2,3,8,9,10,11,14,15,16,18,20,21,22,23,24,25,26,27,28,29,31,32,33,34,35,36,38,39,41,42,43,45,46,47,48,49,50,51,52,53,54,55,56,57,59,60,61,62,63,64,67,68,69,70,71,72,73,74,75,76,77,78,79,80,81,82,83,84,85,87,88,92,93,94,95,99,101,102,103,104,105,106,107,108,110,111,112,113,114,116,117,119,120,121,122,123,124,125,126,127,128,129,131,132,133,134,135,136,138,139,140,141,142,143,144,145,146,147,148,151,153,155,156,160,167,168,169,170,172,173,174,181,185,187,190,193,195,197,198,199,200,203,],[37,-2,-142,-138,-87,-24,-25,-16,37,37,37,-126,37,-34,-26,-127,-84,37,-144,-11,-7,-1,37,-85,-22,-111,37,37,-113,-12,-82,-67,-8,-19,-21,-143,-5,37,-20,37,-14,-23,37,-59,-145,-146,-122,-115,-121,-116,-117,-3,-99,-93,-103,-75,37,-107,-89,-105,-60,-97,-101,-91,-74,-95,-118,-114,-112,-124,-128,37,37,-109,-147,-147,-119,-120,-147,-123,-134,-4,-132,37,-131,-13,-88,37,-86,-83,-129,-130,-100,-94,-104,-108,-90,-106,-98,-102,-92,-96,-125,-27,37,-147,-110,37,37,37,-139,-73,37,-68,-141,37,-133,-6,-66,37,-35,37,-9,-10,-15,-69,37,37,37,-62,-140,-76,-44,-36,37,-61,37,-42,-43,-37,37,37,37,]),'Else':([9,10,11,14,16,22,23,24,25,26,28,33,34,35,39,41,42,43,45,46,47,48,51,53,54,55,56,57,59,60,61,62,63,64,68,69,70,71,72,73,74,75,76,77,78,79,80,81,82,83,84,85,87,89,91,92,93,99,101,103,104,106,108,110,111,112,113,114,116,117,119,120,121,122,123,124,125,126,127,128,129,130,131,132,133,134,140,142,145,147,148,151,153,154,155,156,158,160,167,168,172,173,174,181,185,187,190,195,197,198,205,],[-87,-24,-25,-16,-81,-34,-26,-127,-84,-17,-11,-85,-22,-111,-113,-12,-82,-67,-8,-19,-21,-143,-20,-14,-23,-79,-59,-145,-146,-122,-115,-121,-116,-117,-99,-93,-103,-75,-80,-107,-89,-105,-60,-97,-101,-91,-74,-95,-118,-114,-112,-124,-128,-33,-28,-18,-109,-119,-120,-123,-134,-132,-131,-13,-88,-78,-86,-83,-129,-130,-100,-94,-104,-108,-90,-106,-98,-102,-92,-96,-125,-29,-27,-30,-147,-110,-73,-68,-133,-66,-77,-35,-31,-32,-9,-10,170,-15,-69,-70,-62,-140,-76,-44,-36,-71,-61,-42,-43,-37,170,]),'PIPE':([9,10,11,14,16,22,23,25,26,28,33,34,35,39,41,42,43,46,47,48,51,53,54,55,56,57,59,60,61,62,63,64,68,69,70,71,72,73,74,75,76,77,78,79,80,81,82,83,84,85,92,93,99,101,103,110,111,112,113,114,119,120,121,122,123,124,125,126,127,128,129,131,134,140,142,147,148,151,160,167,168,172,173,174,176,179,181,185,187,190,191,195,197,198,201,],[-87,-24,-25,-16,-81,-34,-26,-84,-17,-11,-85,-22,-111,-113,102,-82,-67,-19,-21,-143,-20,-14,-23,-79,-59,-145,-146,-122,-115,-121,-116,-117,-99,-93,-103,-75,-80,-107,-89,-105,-60,-97,-101,-91,-74,-95,-118,-114,-112,-124,-18,-109,-119,-120,-123,102,-88,-78,-86,-83,-100,-94,-104,-108,-90,-106,-98,-102,-92,-96,-125,-27,-110,-73,-68,-66,-77,-35,-15,-69,-70,-62,-140,-76,192,-57,-44,-36,-71,-61,192,-42,-43,-37,-58,]),'Bang':([0,2,3,8,9,10,11,14,15,16,20,21,22,23,24,25,26,28,29,31,32,33,34,35,36,38,39,41,42,43,45,46,47,48,49,50,51,53,54,55,56,57,59,60,61,62,63,64,67,68,69,70,71,72,73,74,75,76,77,78,79,80,81,82,83,84,85,87,88,92,93,94,95,99,101,103,104,105,106,107,108,110,111,112,113,114,116,117,119,120,121,122,123,124,125,126,127,128,129,131,132,133,134,135,136,138,139,140,141,142,143,145,146,147,148,151,153,155,156,160,167,168,169,170,172,173,174,181,185,187,190,193,195,197,198,199,200,203,],[28,-2,-142,-138,-87,-24,-25,-16,28,28,-126,28,-34,-26,-127,-84,-17,-11,-7,-1,28,-85,-22,-111,28,28,-113,-12,-82,-67,-8,-19,-21,-143,-5,28,-20,-14,-23,-79,-59,-145,-146,-122,-115,-121,-116,-117,-3,-99,-93,-103,-75,28,-107,-89,-105,-60,-97,-101,-91,-74,-95,-118,-114,-112,-124,-128,28,-18,-109,-147,-147,-119,-120,-123,-134,-4,-132,28,-131,-13,-88,28,-86,-83,-129,-130,-100,-94,-104,-108,-90,-106,-98,-102,-92,-96,-125,-27,28,-147,-110,28,28,28,-139,-73,28,-68,-141,-133,-6,-66,28,-35,28,-9,-10,-15,-69,-70,28,28,-62,-140,-76,-44,-36,-71,-61,28,-42,-43,-37,28,28,28,]),'COMMA':([9,10,11,14,16,22,23,25,26,28,29,33,34,35,39,41,42,43,45,46,47,48,49,51,53,54,55,56,57,59,60,61,62,63,64,68,69,70,71,72,73,74,75,76,77,78,79,80,81,82,83,84,85,89,91,92,93,99,101,103,110,111,112,113,114,119,120,121,122,123,124,125,126,127,128,129,130,131,134,140,142,146,147,148,149,151,152,154,155,156,160,162,165,167,168,172,173,174,181,184,185,187,190,195,197,198,],[-87,-24,-25,-16,-81,-34,-26,-84,-17,-11,-7,-85,-22,-111,-113,-12,-82,-67,-8,-19,-21,-143,108,-20,-14,-23,-79,-59,-145,-146,-122,-115,-121,-116,-117,-99,-93,-103,-75,-80,-107,-89,-105,-60,-97,-101,-91,-74,-95,-118,-114,-112,-124,-33,108,-18,-109,-119,-120,-123,-13,-88,-78,-86,-83,-100,-94,-104,-108,-90,-106,-98,-102,-92,-96,-125,108,-27,-110,-73,-68,-6,-66,-77,-39,-35,166,-32,-9,-10,-15,166,-41,-69,-70,-62,-140,-76,-44,-40,-36,-71,-61,-42,-43,-37,]),'Fi':([1,4,9,10,11,13,14,16,22,23,24,25,26,28,33,34,35,39,41,42,43,45,46,47,48,51,53,54,55,56,57,59,60,61,62,63,64,68,69,70,71,72,73,74,75,76,77,78,79,80,81,82,83,84,85,87,89,91,92,93,99,101,103,104,106,108,110,111,112,113,114,116,117,119,120,121,122,123,124,125,126,127,128,129,130,131,132,133,134,140,142,145,147,148,149,150,151,152,153,154,155,156,158,160,161,162,165,167,168,171,172,173,174,175,177,181,182,184,185,187,189,190,192,195,196,197,198,205,208,210,211,212,214,215,216,217,218,],[59,-137,-87,-24,-25,59,-16,59,-34,-26,-127,-84,-17,-11,-85,-22,-111,-113,-12,-82,-67,-8,-19,-21,-143,-20,-14,-23,59,-59,-145,-146,-122,-115,-121,-116,-117,-99,-93,-103,-75,59,-107,-89,-105,-60,-97,-101,-91,-74,-95,-118,-114,-112,-124,-128,-33,-28,-18,-109,-119,-120,-123,-134,-132,-131,-13,-88,59,-86,-83,-129,-130,-100,-94,-104,-108,-90,-106,-98,-102,-92,-96,-125,-29,-27,-30,-147,-110,-73,-68,-133,-66,59,-39,-147,-35,59,-31,-32,-9,-10,172,-15,59,59,-41,-69,-70,190,-62,-140,-76,59,59,-44,-48,-40,-36,-71,-65,-61,59,-42,-47,-43,-37,-64,-147,-147,-63,-147,-147,-53,-54,-55,-56,]),'$end':([2,9,10,11,14,15,16,20,22,23,24,25,26,28,29,31,33,34,35,39,41,42,43,45,46,47,48,49,51,53,54,55,56,57,59,60,61,62,63,64,67,68,69,70,71,72,73,74,75,76,77,78,79,80,81,82,83,84,85,87,92,93,99,101,103,104,105,106,107,108,110,111,112,113,114,116,117,119,120,121,122,123,124,125,126,127,128,129,131,134,140,142,145,146,147,148,151,155,156,160,167,168,172,173,174,181,185,187,190,195,197,198,],[-2,-87,-24,-25,-16,0,-81,-126,-34,-26,-127,-84,-17,-11,-7,-1,-85,-22,-111,-113,-12,-82,-67,-8,-19,-21,-143,-5,-20,-14,-23,-79,-59,-145,-146,-122,-115,-121,-116,-117,-3,-99,-93,-103,-75,-80,-107,-89,-105,-60,-97,-101,-91,-74,-95,-118,-114,-112,-124,-128,-18,-109,-119,-120,-123,-134,-4,-132,-147,-131,-13,-88,-78,-86,-83,-129,-130,-100,-94,-104,-108,-90,-106,-98,-102,-92,-96,-125,-27,-110,-73,-68,-133,-6,-66,-77,-35,-9,-10,-15,-69,-70,-62,-140,-76,-44,-36,-71,-61,-42,-43,-37,]),'Case':([0,2,3,8,9,10,11,14,15,16,20,21,22,23,24,25,26,27,28,29,31,32,33,34,35,36,38,39,41,42,43,45,46,47,48,49,50,51,52,53,54,55,56,57,59,60,61,62,63,64,67,68,69,70,71,72,73,74,75,76,77,78,79,80,81,82,83,84,85,87,88,92,93,94,95,99,101,102,103,104,105,106,107,108,110,111,112,113,114,116,117,119,120,121,122,123,124,125,126,127,128,129,131,132,133,134,135,136,137,138,139,140,141,142,143,144,145,146,147,148,151,153,155,156,157,160,167,168,169,170,172,173,174,181,185,187,190,193,195,197,198,199,200,203,],[1,-2,-142,-138,-87,-24,-25,-16,1,-81,-126,1,-34,-26,-127,-84,-17,-144,-11,-7,-1,1,-85,-22,-111,1,1,-113,-12,-82,-67,-8,-19,-21,-143,-5,1,-20,1,-14,-23,-79,-59,-145,-146,-122,-115,-121,-116,-117,-3,-99,-93,-103,-75,-80,-107,-89,-105,-60,-97,-101,-91,-74,-95,-118,-114,-112,-124,-128,1,-18,-109,-147,-147,-119,-120,-147,-123,-134,-4,-132,1,-131,-13,-88,-78,-86,-83,-129,-130,-100,-94,-104,-108,-90,-106,-98,-102,-92,-96,-125,-27,1,-147,-110,1,1,-147,1,-139,-73,1,-68,-141,1,-133,-6,-66,-77,-35,1,-9,-10,1,-15,-69,-70,1,1,-62,-140,-76,-44,-36,-71,-61,1,-42,-43,-37,1,1,1,]),'LESSAND':([0,2,3,8,9,10,11,14,15,16,18,20,21,22,23,24,25,26,27,28,29,31,32,33,34,35,36,38,39,41,42,43,45,46,47,48,49,50,51,52,53,54,55,56,57,59,60,61,62,63,64,67,68,69,70,71,72,73,74,75,76,77,78,79,80,81,82,83,84,85,87,88,92,93,94,95,99,101,102,103,104,105,106,107,108,110,111,112,113,114,116,117,119,120,121,122,123,124,125,126,127,128,129,131,132,133,134,135,136,138,139,140,141,142,143,144,145,146,147,148,151,153,155,156,160,167,168,169,170,172,173,174,181,185,187,190,193,195,197,198,199,200,203,],[7,-2,-142,-138,-87,-24,-25,-16,7,7,7,-126,7,-34,-26,-127,-84,7,-144,-11,-7,-1,7,-85,-22,-111,7,7,-113,-12,-82,-67,-8,-19,-21,-143,-5,7,-20,7,-14,-23,7,-59,-145,-146,-122,-115,-121,-116,-117,-3,-99,-93,-103,-75,7,-107,-89,-105,-60,-97,-101,-91,-74,-95,-118,-114,-112,-124,-128,7,7,-109,-147,-147,-119,-120,-147,-123,-134,-4,-132,7,-131,-13,-88,7,-86,-83,-129,-130,-100,-94,-104,-108,-90,-106,-98,-102,-92,-96,-125,-27,7,-147,-110,7,7,7,-139,-73,7,-68,-141,7,-133,-6,-66,7,-35,7,-9,-10,-15,-69,7,7,7,-62,-140,-76,-44,-36,7,-61,7,-42,-43,-37,7,7,7,]),'DLESS':([0,2,3,8,9,10,11,14,15,16,18,20,21,22,23,24,25,26,27,28,29,31,32,33,34,35,36,38,39,41,42,43,45,46,47,48,49,50,51,52,53,54,55,56,57,59,60,61,62,63,64,67,68,69,70,71,72,73,74,75,76,77,78,79,80,81,82,83,84,85,87,88,92,93,94,95,99,101,102,103,104,105,106,107,108,110,111,112,113,114,116,117,119,120,121,122,123,124,125,126,127,128,129,131,132,133,134,135,136,138,139,140,141,142,143,144,145,146,147,148,151,153,155,156,160,167,168,169,170,172,173,174,181,185,187,190,193,195,197,198,199,200,203,],[44,-2,-142,-138,-87,-24,-25,-16,44,44,44,-126,44,-34,-26,-127,-84,44,-144,-11,-7,-1,44,-85,-22,-111,44,44,-113,-12,-82,-67,-8,-19,-21,-143,-5,44,-20,44,-14,-23,44,-59,-145,-146,-122,-115,-121,-116,-117,-3,-99,-93,-103,-75,44,-107,-89,-105,-60,-97,-101,-91,-74,-95,-118,-114,-112,-124,-128,44,44,-109,-147,-147,-119,-120,-147,-123,-134,-4,-132,44,-131,-13,-88,44,-86,-83,-129,-130,-100,-94,-104,-108,-90,-106,-98,-102,-92,-96,-125,-27,44,-147,-110,44,44,44,-139,-73,44,-68,-141,44,-133,-6,-66,44,-35,44,-9,-10,-15,-69,44,44,44,-62,-140,-76,-44,-36,44,-61,44,-42,-43,-37,44,44,44,]),'Lbrace':([0,2,3,8,9,10,11,14,15,16,20,21,22,23,24,25,26,27,28,29,31,32,33,34,35,36,38,39,41,42,43,45,46,47,48,49,50,51,52,53,54,55,56,57,59,60,61,62,63,64,67,68,69,70,71,72,73,74,75,76,77,78,79,80,81,82,83,84,85,87,88,92,93,94,95,99,101,102,103,104,105,106,107,108,110,111,112,113,114,116,117,119,120,121,122,123,124,125,126,127,128,129,131,132,133,134,135,136,137,138,139,140,141,142,143,144,145,146,147,148,151,153,155,156,157,160,167,168,169,170,172,173,174,181,185,187,190,193,195,197,198,199,200,203,],[36,-2,-142,-138,-87,-24,-25,-16,36,-81,-126,36,-34,-26,-127,-84,-17,-144,-11,-7,-1,36,-85,-22,-111,36,36,-113,-12,-82,-67,-8,-19,-21,-143,-5,36,-20,36,-14,-23,-79,-59,-145,-146,-122,-115,-121,-116,-117,-3,-99,-93,-103,-75,-80,-107,-89,-105,-60,-97,-101,-91,-74,-95,-118,-114,-112,-124,-128,36,-18,-109,-147,-147,-119,-120,-147,-123,-134,-4,-132,36,-131,-13,-88,-78,-86,-83,-129,-130,-100,-94,-104,-108,-90,-106,-98,-102,-92,-96,-125,-27,36,-147,-110,36,36,-147,36,-139,-73,36,-68,-141,36,-133,-6,-66,-77,-35,36,-9,-10,36,-15,-69,-70,36,36,-62,-140,-76,-44,-36,-71,-61,36,-42,-43,-37,36,36,36,]),'IO_NUMBER':([0,2,3,8,9,10,11,14,15,16,20,21,22,23,24,25,26,27,28,29,31,32,33,34,35,36,38,39,41,42,43,45,46,47,48,49,50,51,52,53,54,55,56,57,59,60,61,62,63,64,67,68,69,70,71,72,73,74,75,76,77,78,79,80,81,82,83,84,85,87,88,92,93,94,95,99,101,102,103,104,105,106,107,108,110,111,112,113,114,116,117,119,120,121,122,123,124,125,126,127,128,129,131,132,133,134,135,136,138,139,140,141,142,143,144,145,146,147,148,151,153,155,156,160,167,168,169,170,172,173,174,181,185,187,190,193,195,197,198,199,200,203,],[18,-2,-142,-138,-87,-24,-25,-16,18,18,-126,18,-34,-26,-127,-84,18,-144,-11,-7,-1,18,-85,-22,-111,18,18,-113,-12,-82,-67,-8,-19,-21,-143,-5,18,-20,18,-14,-23,18,-59,-145,-146,-122,-115,-121,-116,-117,-3,-99,-93,-103,-75,18,-107,-89,-105,-60,-97,-101,-91,-74,-95,-118,-114,-112,-124,-128,18,18,-109,-147,-147,-119,-120,-147,-123,-134,-4,-132,18,-131,-13,-88,18,-86,-83,-129,-130,-100,-94,-104,-108,-90,-106,-98,-102,-92,-96,-125,-27,18,-147,-110,18,18,18,-139,-73,18,-68,-141,18,-133,-6,-66,18,-35,18,-9,-10,-15,-69,18,18,18,-62,-140,-76,-44,-36,18,-61,18,-42,-43,-37,18,18,18,]),'Do':([9,10,11,14,16,22,23,24,25,26,28,33,34,35,39,41,42,43,45,46,47,48,51,53,54,55,56,57,59,60,61,62,63,64,65,66,68,69,70,71,72,73,74,75,76,77,78,79,80,81,82,83,84,85,87,89,91,92,93,99,100,101,103,104,106,108,109,110,111,112,113,114,116,117,118,119,120,121,122,123,124,125,126,127,128,129,130,131,132,133,134,140,142,145,147,148,151,153,154,155,156,160,163,164,166,167,168,172,173,174,181,183,185,186,187,190,195,197,198,],[-87,-24,-25,-16,71,-34,-26,-127,-84,-17,-11,-85,-22,-111,-113,-12,-82,-67,-8,-19,-21,-143,-20,-14,-23,-79,-59,-145,-146,-122,-115,-121,-116,-117,-147,-38,-99,-93,-103,-75,71,-107,-89,-105,-60,-97,-101,-91,-74,-95,-118,-114,-112,-124,-128,-33,-28,-18,-109,-119,71,-120,-123,-134,-132,-131,71,-13,-88,71,-86,-83,-129,-130,71,-100,-94,-104,-108,-90,-106,-98,-102,-92,-96,-125,-29,-27,-30,-147,-110,-73,-68,-133,-66,71,-35,-31,-32,-9,-10,-15,-136,71,-147,-69,-70,-62,-140,-76,-44,71,-36,-135,-71,-61,-42,-43,-37,]),'OR_IF':([9,10,11,14,16,22,23,25,26,28,29,33,34,35,39,41,42,43,45,46,47,48,51,53,54,55,56,57,59,60,61,62,63,64,68,69,70,71,72,73,74,75,76,77,78,79,80,81,82,83,84,85,89,92,93,99,101,103,110,111,112,113,114,119,120,121,122,123,124,125,126,127,128,129,131,134,140,142,146,147,148,151,154,155,156,160,167,168,172,173,174,181,185,187,190,195,197,198,],[-87,-24,-25,-16,-81,-34,-26,-84,-17,-11,95,-85,-22,-111,-113,-12,-82,-67,-8,-19,-21,-143,-20,-14,-23,-79,-59,-145,-146,-122,-115,-121,-116,-117,-99,-93,-103,-75,-80,-107,-89,-105,-60,-97,-101,-91,-74,-95,-118,-114,-112,-124,95,-18,-109,-119,-120,-123,-13,-88,-78,-86,-83,-100,-94,-104,-108,-90,-106,-98,-102,-92,-96,-125,-27,-110,-73,-68,95,-66,-77,-35,95,-9,-10,-15,-69,-70,-62,-140,-76,-44,-36,-71,-61,-42,-43,-37,]),'LESSGREAT':([0,2,3,8,9,10,11,14,15,16,18,20,21,22,23,24,25,26,27,28,29,31,32,33,34,35,36,38,39,41,42,43,45,46,47,48,49,50,51,52,53,54,55,56,57,59,60,61,62,63,64,67,68,69,70,71,72,73,74,75,76,77,78,79,80,81,82,83,84,85,87,88,92,93,94,95,99,101,102,103,104,105,106,107,108,110,111,112,113,114,116,117,119,120,121,122,123,124,125,126,127,128,129,131,132,133,134,135,136,138,139,140,141,142,143,144,145,146,147,148,151,153,155,156,160,167,168,169,170,172,173,174,181,185,187,190,193,195,197,198,199,200,203,],[40,-2,-142,-138,-87,-24,-25,-16,40,40,40,-126,40,-34,-26,-127,-84,40,-144,-11,-7,-1,40,-85,-22,-111,40,40,-113,-12,-82,-67,-8,-19,-21,-143,-5,40,-20,40,-14,-23,40,-59,-145,-146,-122,-115,-121,-116,-117,-3,-99,-93,-103,-75,40,-107,-89,-105,-60,-97,-101,-91,-74,-95,-118,-114,-112,-124,-128,40,40,-109,-147,-147,-119,-120,-147,-123,-134,-4,-132,40,-131,-13,-88,40,-86,-83,-129,-130,-100,-94,-104,-108,-90,-106,-98,-102,-92,-96,-125,-27,40,-147,-110,40,40,40,-139,-73,40,-68,-141,40,-133,-6,-66,40,-35,40,-9,-10,-15,-69,40,40,40,-62,-140,-76,-44,-36,40,-61,40,-42,-43,-37,40,40,40,]),'AND_IF':([9,10,11,14,16,22,23,25,26,28,29,33,34,35,39,41,42,43,45,46,47,48,51,53,54,55,56,57,59,60,61,62,63,64,68,69,70,71,72,73,74,75,76,77,78,79,80,81,82,83,84,85,89,92,93,99,101,103,110,111,112,113,114,119,120,121,122,123,124,125,126,127,128,129,131,134,140,142,146,147,148,151,154,155,156,160,167,168,172,173,174,181,185,187,190,195,197,198,],[-87,-24,-25,-16,-81,-34,-26,-84,-17,-11,94,-85,-22,-111,-113,-12,-82,-67,-8,-19,-21,-143,-20,-14,-23,-79,-59,-145,-146,-122,-115,-121,-116,-117,-99,-93,-103,-75,-80,-107,-89,-105,-60,-97,-101,-91,-74,-95,-118,-114,-112,-124,94,-18,-109,-119,-120,-123,-13,-88,-78,-86,-83,-100,-94,-104,-108,-90,-106,-98,-102,-92,-96,-125,-27,-110,-73,-68,94,-66,-77,-35,94,-9,-10,-15,-69,-70,-62,-140,-76,-44,-36,-71,-61,-42,-43,-37,]),'While':([0,2,3,8,9,10,11,14,15,16,20,21,22,23,24,25,26,27,28,29,31,32,33,34,35,36,38,39,41,42,43,45,46,47,48,49,50,51,52,53,54,55,56,57,59,60,61,62,63,64,67,68,69,70,71,72,73,74,75,76,77,78,79,80,81,82,83,84,85,87,88,92,93,94,95,99,101,102,103,104,105,106,107,108,110,111,112,113,114,116,117,119,120,121,122,123,124,125,126,127,128,129,131,132,133,134,135,136,137,138,139,140,141,142,143,144,145,146,147,148,151,153,155,156,157,160,167,168,169,170,172,173,174,181,185,187,190,193,195,197,198,199,200,203,],[50,-2,-142,-138,-87,-24,-25,-16,50,-81,-126,50,-34,-26,-127,-84,-17,-144,-11,-7,-1,50,-85,-22,-111,50,50,-113,-12,-82,-67,-8,-19,-21,-143,-5,50,-20,50,-14,-23,-79,-59,-145,-146,-122,-115,-121,-116,-117,-3,-99,-93,-103,-75,-80,-107,-89,-105,-60,-97,-101,-91,-74,-95,-118,-114,-112,-124,-128,50,-18,-109,-147,-147,-119,-120,-147,-123,-134,-4,-132,50,-131,-13,-88,-78,-86,-83,-129,-130,-100,-94,-104,-108,-90,-106,-98,-102,-92,-96,-125,-27,50,-147,-110,50,50,-147,50,-139,-73,50,-68,-141,50,-133,-6,-66,-77,-35,50,-9,-10,50,-15,-69,-70,50,50,-62,-140,-76,-44,-36,-71,-61,50,-42,-43,-37,50,50,50,]),'DLESSDASH':([0,2,3,8,9,10,11,14,15,16,18,20,21,22,23,24,25,26,27,28,29,31,32,33,34,35,36,38,39,41,42,43,45,46,47,48,49,50,51,52,53,54,55,56,57,59,60,61,62,63,64,67,68,69,70,71,72,73,74,75,76,77,78,79,80,81,82,83,84,85,87,88,92,93,94,95,99,101,102,103,104,105,106,107,108,110,111,112,113,114,116,117,119,120,121,122,123,124,125,126,127,128,129,131,132,133,134,135,136,138,139,140,141,142,143,144,145,146,147,148,151,153,155,156,160,167,168,169,170,172,173,174,181,185,187,190,193,195,197,198,199,200,203,],[19,-2,-142,-138,-87,-24,-25,-16,19,19,19,-126,19,-34,-26,-127,-84,19,-144,-11,-7,-1,19,-85,-22,-111,19,19,-113,-12,-82,-67,-8,-19,-21,-143,-5,19,-20,19,-14,-23,19,-59,-145,-146,-122,-115,-121,-116,-117,-3,-99,-93,-103,-75,19,-107,-89,-105,-60,-97,-101,-91,-74,-95,-118,-114,-112,-124,-128,19,19,-109,-147,-147,-119,-120,-147,-123,-134,-4,-132,19,-131,-13,-88,19,-86,-83,-129,-130,-100,-94,-104,-108,-90,-106,-98,-102,-92,-96,-125,-27,19,-147,-110,19,19,19,-139,-73,19,-68,-141,19,-133,-6,-66,19,-35,19,-9,-10,-15,-69,19,19,19,-62,-140,-76,-44,-36,19,-61,19,-42,-43,-37,19,19,19,]),'AMP':([9,10,11,14,16,22,23,25,26,28,29,33,34,35,39,41,42,43,45,46,47,48,49,51,53,54,55,56,57,59,60,61,62,63,64,68,69,70,71,72,73,74,75,76,77,78,79,80,81,82,83,84,85,89,91,92,93,99,101,103,110,111,112,113,114,119,120,121,122,123,124,125,126,127,128,129,130,131,134,140,142,146,147,148,151,154,155,156,160,167,168,172,173,174,181,185,187,190,195,197,198,],[-87,-24,-25,-16,-81,-34,-26,-84,-17,-11,-7,-85,-22,-111,-113,-12,-82,-67,-8,-19,-21,-143,106,-20,-14,-23,-79,-59,-145,-146,-122,-115,-121,-116,-117,-99,-93,-103,-75,-80,-107,-89,-105,-60,-97,-101,-91,-74,-95,-118,-114,-112,-124,-33,106,-18,-109,-119,-120,-123,-13,-88,-78,-86,-83,-100,-94,-104,-108,-90,-106,-98,-102,-92,-96,-125,106,-27,-110,-73,-68,-6,-66,-77,-35,-32,-9,-10,-15,-69,-70,-62,-140,-76,-44,-36,-71,-61,-42,-43,-37,]),'Rbrace':([9,10,11,14,16,22,23,24,25,26,28,33,34,35,39,41,42,43,45,46,47,48,51,53,54,55,56,57,59,60,61,62,63,64,68,69,70,71,72,73,74,75,76,77,78,79,80,81,82,83,84,85,87,89,91,92,93,98,99,101,103,104,106,108,110,111,112,113,114,116,117,119,120,121,122,123,124,125,126,127,128,129,130,131,132,133,134,140,142,145,147,148,151,153,154,155,156,160,167,168,172,173,174,181,185,187,190,195,197,198,],[-87,-24,-25,-16,-81,-34,-26,-127,-84,-17,-11,-85,-22,-111,-113,-12,-82,-67,-8,-19,-21,-143,-20,-14,-23,-79,-59,-145,-146,-122,-115,-121,-116,-117,-99,-93,-103,-75,-80,-107,-89,-105,-60,-97,-101,-91,-74,-95,-118,-114,-112,-124,-128,-33,-28,-18,-109,140,-119,-120,-123,-134,-132,-131,-13,-88,-78,-86,-83,-129,-130,-100,-94,-104,-108,-90,-106,-98,-102,-92,-96,-125,-29,-27,-30,-147,-110,-73,-68,-133,-66,-77,-35,-31,-32,-9,-10,-15,-69,-70,-62,-140,-76,-44,-36,-71,-61,-42,-43,-37,]),'Elif':([9,10,11,14,16,22,23,24,25,26,28,33,34,35,39,41,42,43,45,46,47,48,51,53,54,55,56,57,59,60,61,62,63,64,68,69,70,71,72,73,74,75,76,77,78,79,80,81,82,83,84,85,87,89,91,92,93,99,101,103,104,106,108,110,111,112,113,114,116,117,119,120,121,122,123,124,125,126,127,128,129,130,131,132,133,134,140,142,145,147,148,151,153,154,155,156,158,160,167,168,172,173,174,181,185,187,190,195,197,198,205,],[-87,-24,-25,-16,-81,-34,-26,-127,-84,-17,-11,-85,-22,-111,-113,-12,-82,-67,-8,-19,-21,-143,-20,-14,-23,-79,-59,-145,-146,-122,-115,-121,-116,-117,-99,-93,-103,-75,-80,-107,-89,-105,-60,-97,-101,-91,-74,-95,-118,-114,-112,-124,-128,-33,-28,-18,-109,-119,-120,-123,-134,-132,-131,-13,-88,-78,-86,-83,-129,-130,-100,-94,-104,-108,-90,-106,-98,-102,-92,-96,-125,-29,-27,-30,-147,-110,-73,-68,-133,-66,-77,-35,-31,-32,-9,-10,169,-15,-69,-70,-62,-140,-76,-44,-36,-71,-61,-42,-43,-37,169,]),'GREATER':([0,2,3,8,9,10,11,14,15,16,18,20,21,22,23,24,25,26,27,28,29,31,32,33,34,35,36,38,39,41,42,43,45,46,47,48,49,50,51,52,53,54,55,56,57,59,60,61,62,63,64,67,68,69,70,71,72,73,74,75,76,77,78,79,80,81,82,83,84,85,87,88,92,93,94,95,99,101,102,103,104,105,106,107,108,110,111,112,113,114,116,117,119,120,121,122,123,124,125,126,127,128,129,131,132,133,134,135,136,138,139,140,141,142,143,144,145,146,147,148,151,153,155,156,160,167,168,169,170,172,173,174,181,185,187,190,193,195,197,198,199,200,203,],[12,-2,-142,-138,-87,-24,-25,-16,12,12,12,-126,12,-34,-26,-127,-84,12,-144,-11,-7,-1,12,-85,-22,-111,12,12,-113,-12,-82,-67,-8,-19,-21,-143,-5,12,-20,12,-14,-23,12,-59,-145,-146,-122,-115,-121,-116,-117,-3,-99,-93,-103,-75,12,-107,-89,-105,-60,-97,-101,-91,-74,-95,-118,-114,-112,-124,-128,12,12,-109,-147,-147,-119,-120,-147,-123,-134,-4,-132,12,-131,-13,-88,12,-86,-83,-129,-130,-100,-94,-104,-108,-90,-106,-98,-102,-92,-96,-125,-27,12,-147,-110,12,12,12,-139,-73,12,-68,-141,12,-133,-6,-66,12,-35,12,-9,-10,-15,-69,12,12,12,-62,-140,-76,-44,-36,12,-61,12,-42,-43,-37,12,12,12,]),'TOKEN':([0,1,2,3,4,5,6,7,8,9,10,11,12,13,14,15,16,17,20,21,22,23,24,25,26,27,28,29,31,32,33,34,35,36,37,38,39,40,41,42,43,45,46,47,48,49,50,51,52,53,54,55,56,57,59,60,61,62,63,64,67,68,69,70,71,72,73,74,75,76,77,78,79,80,81,82,83,84,85,86,87,88,92,93,94,95,99,101,102,103,104,105,106,107,108,110,111,112,113,114,116,117,119,120,121,122,123,124,125,126,127,128,129,131,132,133,134,135,136,138,139,140,141,142,143,144,145,146,147,148,149,150,151,152,153,155,156,160,161,162,165,167,168,169,170,172,173,174,175,177,181,182,184,185,187,190,192,193,195,196,197,198,199,200,203,208,210,212,214,215,216,217,218,],[42,57,-2,-142,-137,60,60,60,-138,-87,-24,-25,60,57,-16,42,57,60,-126,42,-34,-26,-127,-84,-17,-144,-11,-7,-1,42,-85,-22,-111,42,60,42,-113,60,-12,-82,-67,-8,-19,-21,-143,-5,42,-20,42,-14,-23,57,-59,-145,-146,-122,-115,-121,-116,-117,-3,-99,-93,-103,-75,57,-107,-89,-105,-60,-97,-101,-91,-74,-95,-118,-114,-112,-124,129,-128,42,-18,-109,-147,-147,-119,-120,-147,-123,-134,-4,-132,42,-131,-13,-88,57,-86,-83,-129,-130,-100,-94,-104,-108,-90,-106,-98,-102,-92,-96,-125,-27,42,-147,-110,42,42,42,-139,-73,42,-68,-141,42,-133,-6,-66,57,-39,-147,-35,57,42,-9,-10,-15,57,57,-41,-69,-70,42,42,-62,-140,-76,57,57,-44,-48,-40,-36,-71,-61,57,42,-42,-47,-43,-37,42,42,42,-147,-147,-147,-147,-53,-54,-55,-56,]),'Done':([9,10,11,14,16,22,23,24,25,26,28,33,34,35,39,41,42,43,45,46,47,48,51,53,54,55,56,57,59,60,61,62,63,64,68,69,70,71,72,73,74,75,76,77,78,79,80,81,82,83,84,85,87,89,91,92,93,99,101,103,104,106,108,110,111,112,113,114,116,117,119,120,121,122,123,124,125,126,127,128,129,130,131,132,133,134,140,142,145,147,148,151,153,154,155,156,159,160,167,168,172,173,174,181,185,187,190,195,197,198,],[-87,-24,-25,-16,80,-34,-26,-127,-84,-17,-11,-85,-22,-111,-113,-12,-82,-67,-8,-19,-21,-143,-20,-14,-23,-79,-59,-145,-146,-122,-115,-121,-116,-117,-99,-93,-103,-75,80,-107,-89,-105,-60,-97,-101,-91,-74,-95,-118,-114,-112,-124,-128,-33,-28,-18,-109,-119,-120,-123,-134,-132,-131,-13,-88,80,-86,-83,-129,-130,-100,-94,-104,-108,-90,-106,-98,-102,-92,-96,-125,-29,-27,-30,-147,-110,-73,-68,-133,-66,80,-35,-31,-32,-9,-10,80,-15,-69,-70,-62,-140,-76,-44,-36,-71,-61,-42,-43,-37,]),'In':([24,57,58,59,65,66,87,115,116,117,118,],[-127,-145,-147,-146,-147,-38,-128,149,-129,-130,149,]),'If':([0,2,3,8,9,10,11,14,15,16,20,21,22,23,24,25,26,27,28,29,31,32,33,34,35,36,38,39,41,42,43,45,46,47,48,49,50,51,52,53,54,55,56,57,59,60,61,62,63,64,67,68,69,70,71,72,73,74,75,76,77,78,79,80,81,82,83,84,85,87,88,92,93,94,95,99,101,102,103,104,105,106,107,108,110,111,112,113,114,116,117,119,120,121,122,123,124,125,126,127,128,129,131,132,133,134,135,136,137,138,139,140,141,142,143,144,145,146,147,148,151,153,155,156,157,160,167,168,169,170,172,173,174,181,185,187,190,193,195,197,198,199,200,203,],[56,-2,-142,-138,-87,-24,-25,-16,56,56,-126,56,-34,-26,-127,-84,-17,-144,-11,-7,-1,56,-85,-22,-111,56,56,-113,-12,-82,-67,-8,-19,-21,-143,-5,56,-20,56,-14,-23,-79,-59,-145,-146,-122,-115,-121,-116,-117,-3,-99,-93,-103,-75,56,-107,-89,-105,-60,-97,-101,-91,-74,-95,-118,-114,-112,-124,-128,56,-18,-109,-147,-147,-119,-120,-147,-123,-134,-4,-132,56,-131,-13,-88,56,-86,-83,-129,-130,-100,-94,-104,-108,-90,-106,-98,-102,-92,-96,-125,-27,56,-147,-110,56,56,-147,56,-139,-73,56,-68,-141,56,-133,-6,-66,56,-35,56,-9,-10,56,-15,-69,-70,56,56,-62,-140,-76,-44,-36,-71,-61,56,-42,-43,-37,56,56,56,]),}
+
+_lr_action = { }
+for _k, _v in _lr_action_items.items():
+   for _x,_y in zip(_v[0],_v[1]):
+      if not _x in _lr_action:  _lr_action[_x] = { }
+      _lr_action[_x][_k] = _y
+del _lr_action_items
+
+_lr_goto_items = {'linebreak':([58,65,94,95,102,107,133,137,150,166,193,200,204,207,208,210,212,214,],[115,118,135,136,144,145,145,157,161,186,202,206,209,213,215,216,217,218,]),'maybe_until_word':([0,15,16,21,32,36,38,50,52,72,88,107,112,132,135,136,138,141,144,148,153,157,169,170,193,199,200,203,],[3,3,68,3,3,3,3,3,3,119,3,3,68,3,3,3,3,3,3,119,3,3,3,3,3,3,3,3,]),'maybe_for_word':([0,15,16,21,32,36,38,50,52,72,88,107,112,132,135,136,138,141,144,148,153,157,169,170,193,199,200,203,],[4,4,69,4,4,4,4,4,4,120,4,4,69,4,4,4,4,4,4,120,4,4,4,4,4,4,4,4,]),'redirect_list':([26,168,],[92,187,]),'maybe_if_word':([0,15,16,21,32,36,38,50,52,72,88,107,112,132,135,136,138,141,144,148,153,157,169,170,193,199,200,203,],[8,8,70,8,8,8,8,8,8,121,8,8,70,8,8,8,8,8,8,121,8,8,8,8,8,8,8,8,]),'assignment_word':([0,15,21,32,36,38,50,52,55,88,107,132,135,136,138,141,144,153,169,170,193,199,200,203,],[9,9,9,9,9,9,9,9,111,9,9,9,9,9,9,9,9,9,9,9,9,9,9,9,]),'if_clause':([0,15,21,32,36,38,50,52,88,107,132,135,136,138,141,144,153,157,169,170,193,199,200,203,],[10,10,10,10,10,10,10,10,10,10,10,10,10,10,10,10,10,10,10,10,10,10,10,10,]),'while_clause':([0,15,21,32,36,38,50,52,88,107,132,135,136,138,141,144,153,157,169,170,193,199,200,203,],[11,11,11,11,11,11,11,11,11,11,11,11,11,11,11,11,11,11,11,11,11,11,11,11,]),'in':([115,118,],[150,152,]),'for_word':([0,15,21,32,36,38,50,52,88,107,132,135,136,138,141,144,153,157,169,170,193,199,200,203,],[13,13,13,13,13,13,13,13,13,13,13,13,13,13,13,13,13,13,13,13,13,13,13,13,]),'simple_command':([0,15,21,32,36,38,50,52,88,107,132,135,136,138,141,144,153,169,170,193,199,200,203,],[14,14,14,14,14,14,14,14,14,14,14,14,14,14,14,14,14,14,14,14,14,14,14,]),'filename':([5,6,7,12,17,37,40,],[61,62,63,64,82,99,101,]),'multiple_commands':([0,],[15,]),'cmd_name':([0,15,21,32,36,38,50,52,88,107,132,135,136,138,141,144,153,169,170,193,199,200,203,],[16,16,16,16,16,16,16,16,16,16,16,16,16,16,16,16,16,16,16,16,16,16,16,]),'do_word':([100,109,118,164,183,],[141,141,141,141,141,]),'case_list':([161,],[177,]),'newline_list':([0,21,32,36,38,49,50,58,65,91,94,95,102,107,130,133,137,138,141,150,152,162,166,169,170,193,199,200,204,207,208,210,212,214,],[20,88,88,88,88,104,88,116,116,104,116,116,116,116,104,116,116,88,88,116,163,163,116,88,88,203,88,203,116,116,116,116,116,116,]),'until_clause':([0,15,21,32,36,38,50,52,88,107,132,135,136,138,141,144,153,157,169,170,193,199,200,203,],[23,23,23,23,23,23,23,23,23,23,23,23,23,23,23,23,23,23,23,23,23,23,23,23,]),'complete_command':([0,15,],[2,67,]),'separator':([49,91,130,],[105,132,153,]),'compound_command':([0,15,21,32,36,38,50,52,88,107,132,135,136,138,141,144,153,157,169,170,193,199,200,203,],[26,26,26,26,26,26,26,26,26,26,26,26,26,26,26,26,26,168,26,26,26,26,26,26,]),'cmd_suffix':([16,112,],[72,148,]),'maybe_bang_word':([0,15,16,21,32,36,38,50,72,88,107,112,132,135,136,138,141,148,153,169,170,193,199,200,203,],[27,27,73,27,27,27,27,27,122,27,27,73,27,27,27,27,27,122,27,27,27,27,27,27,27,]),'then_word':([97,188,],[138,199,]),'separator_op':([49,91,130,],[107,133,133,]),'and_or':([0,15,21,32,36,38,50,88,107,132,138,141,153,169,170,193,199,200,203,],[29,29,89,89,89,89,89,89,146,154,89,89,154,89,89,89,89,89,89,]),'case_item_ns':([161,177,],[180,194,]),'done_word':([159,],[174,]),'fname':([0,15,21,32,36,38,50,52,88,107,132,135,136,138,141,144,153,169,170,193,199,200,203,],[30,30,30,30,30,30,30,30,30,30,30,30,30,30,30,30,30,30,30,30,30,30,30,]),'cmd_word':([55,],[112,]),'here_end':([19,44,],[85,103,]),'command':([0,15,21,32,36,38,50,52,88,107,132,135,136,138,141,144,153,169,170,193,199,200,203,],[53,53,53,53,53,53,53,53,53,53,53,53,53,53,53,160,53,53,53,53,53,53,53,]),'io_redirect':([0,15,16,21,26,32,36,38,50,52,55,72,88,92,107,112,132,135,136,138,141,144,148,153,168,169,170,187,193,199,200,203,],[33,33,74,33,93,33,33,33,33,33,113,123,33,134,33,74,33,33,33,33,33,33,123,33,93,33,33,134,33,33,33,33,]),'maybe_then_word':([16,72,97,112,148,188,],[75,124,139,75,124,139,]),'case_item':([161,177,],[182,196,]),'wordlist':([152,],[162,]),'io_file':([0,15,16,18,21,26,32,36,38,50,52,55,72,88,92,107,112,132,135,136,138,141,144,148,153,168,169,170,187,193,199,200,203,],[35,35,35,84,35,35,35,35,35,35,35,35,35,35,35,35,35,35,35,35,35,35,35,35,35,35,35,35,35,35,35,35,35,]),'until_word':([0,15,21,32,36,38,50,52,88,107,132,135,136,138,141,144,153,157,169,170,193,199,200,203,],[38,38,38,38,38,38,38,38,38,38,38,38,38,38,38,38,38,38,38,38,38,38,38,38,]),'sequential_sep':([152,162,],[164,183,]),'case_list_ns':([161,],[178,]),'io_here':([0,15,16,18,21,26,32,36,38,50,52,55,72,88,92,107,112,132,135,136,138,141,144,148,153,168,169,170,187,193,199,200,203,],[39,39,39,83,39,39,39,39,39,39,39,39,39,39,39,39,39,39,39,39,39,39,39,39,39,39,39,39,39,39,39,39,39,]),'else_part':([158,205,],[171,211,]),'pipe_sequence':([0,15,21,32,36,38,50,52,88,107,132,135,136,138,141,153,169,170,193,199,200,203,],[41,41,41,41,41,41,41,110,41,41,41,41,41,41,41,41,41,41,41,41,41,41,]),'pattern':([161,175,177,],[176,191,176,]),'term':([21,32,36,38,50,88,138,141,169,170,193,199,200,203,],[91,91,91,91,91,130,91,91,91,91,91,91,91,130,]),'maybe_done_word':([16,72,112,148,159,],[81,128,81,128,173,]),'maybe_do_word':([16,72,100,109,112,118,148,164,183,],[77,125,143,143,77,143,125,143,143,]),'compound_list':([21,32,36,38,50,138,141,169,170,193,199,200,],[90,97,98,100,109,158,159,188,189,204,205,207,]),'if_word':([0,15,21,32,36,38,50,52,88,107,132,135,136,138,141,144,153,157,169,170,193,199,200,203,],[32,32,32,32,32,32,32,32,32,32,32,32,32,32,32,32,32,32,32,32,32,32,32,32,]),'pipeline':([0,15,21,32,36,38,50,88,107,132,135,136,138,141,153,169,170,193,199,200,203,],[45,45,45,45,45,45,45,45,45,45,155,156,45,45,45,45,45,45,45,45,45,]),'function_definition':([0,15,21,32,36,38,50,52,88,107,132,135,136,138,141,144,153,169,170,193,199,200,203,],[46,46,46,46,46,46,46,46,46,46,46,46,46,46,46,46,46,46,46,46,46,46,46,]),'subshell':([0,15,21,32,36,38,50,52,88,107,132,135,136,138,141,144,153,157,169,170,193,199,200,203,],[47,47,47,47,47,47,47,47,47,47,47,47,47,47,47,47,47,47,47,47,47,47,47,47,]),'name':([13,],[65,]),'maybe_assignment_word':([0,15,16,21,32,36,38,50,52,55,72,88,107,112,132,135,136,138,141,144,148,153,169,170,193,199,200,203,],[48,48,78,48,48,48,48,48,48,48,126,48,48,78,48,48,48,48,48,48,126,48,48,48,48,48,48,48,]),'list':([0,15,],[49,49,]),'brace_group':([0,15,21,32,36,38,50,52,88,107,132,135,136,138,141,144,153,157,169,170,193,199,200,203,],[51,51,51,51,51,51,51,51,51,51,51,51,51,51,51,51,51,51,51,51,51,51,51,51,]),'do_group':([100,109,118,164,183,],[142,147,151,185,198,]),'bang_word':([0,15,21,32,36,38,50,88,107,132,135,136,138,141,153,169,170,193,199,200,203,],[52,52,52,52,52,52,52,52,52,52,52,52,52,52,52,52,52,52,52,52,52,]),'token':([1,13,16,55,72,112,148,152,161,162,175,177,192,],[58,66,79,114,127,79,127,165,179,184,179,179,201,]),'empty':([58,65,94,95,102,107,133,137,150,166,193,200,204,207,208,210,212,214,],[117,117,117,117,117,117,117,117,117,117,117,117,117,117,117,117,117,117,]),'newline_sequence':([0,],[31,]),'for_clause':([0,15,21,32,36,38,50,52,88,107,132,135,136,138,141,144,153,157,169,170,193,199,200,203,],[34,34,34,34,34,34,34,34,34,34,34,34,34,34,34,34,34,34,34,34,34,34,34,34,]),'case_clause':([0,15,21,32,36,38,50,52,88,107,132,135,136,138,141,144,153,157,169,170,193,199,200,203,],[54,54,54,54,54,54,54,54,54,54,54,54,54,54,54,54,54,54,54,54,54,54,54,54,]),'cmd_prefix':([0,15,21,32,36,38,50,52,88,107,132,135,136,138,141,144,153,169,170,193,199,200,203,],[55,55,55,55,55,55,55,55,55,55,55,55,55,55,55,55,55,55,55,55,55,55,55,]),'function_body':([157,],[167,]),}
+
+_lr_goto = { }
+for _k, _v in _lr_goto_items.items():
+   for _x,_y in zip(_v[0],_v[1]):
+       if not _x in _lr_goto: _lr_goto[_x] = { }
+       _lr_goto[_x][_k] = _y
+del _lr_goto_items
+_lr_productions = [
+  ("S' -> multiple_commands","S'",1,None,None,None),
+  ('multiple_commands -> newline_sequence','multiple_commands',1,'p_multiple_commands','lib/bb/pysh/pyshyacc.py',128),
+  ('multiple_commands -> complete_command','multiple_commands',1,'p_multiple_commands','lib/bb/pysh/pyshyacc.py',129),
+  ('multiple_commands -> multiple_commands complete_command','multiple_commands',2,'p_multiple_commands','lib/bb/pysh/pyshyacc.py',130),
+  ('complete_command -> list separator','complete_command',2,'p_complete_command','lib/bb/pysh/pyshyacc.py',140),
+  ('complete_command -> list','complete_command',1,'p_complete_command','lib/bb/pysh/pyshyacc.py',141),
+  ('list -> list separator_op and_or','list',3,'p_list','lib/bb/pysh/pyshyacc.py',148),
+  ('list -> and_or','list',1,'p_list','lib/bb/pysh/pyshyacc.py',149),
+  ('and_or -> pipeline','and_or',1,'p_and_or','lib/bb/pysh/pyshyacc.py',158),
+  ('and_or -> and_or AND_IF linebreak pipeline','and_or',4,'p_and_or','lib/bb/pysh/pyshyacc.py',159),
+  ('and_or -> and_or OR_IF linebreak pipeline','and_or',4,'p_and_or','lib/bb/pysh/pyshyacc.py',160),
+  ('maybe_bang_word -> Bang','maybe_bang_word',1,'p_maybe_bang_word','lib/bb/pysh/pyshyacc.py',167),
+  ('pipeline -> pipe_sequence','pipeline',1,'p_pipeline','lib/bb/pysh/pyshyacc.py',171),
+  ('pipeline -> bang_word pipe_sequence','pipeline',2,'p_pipeline','lib/bb/pysh/pyshyacc.py',172),
+  ('pipe_sequence -> command','pipe_sequence',1,'p_pipe_sequence','lib/bb/pysh/pyshyacc.py',179),
+  ('pipe_sequence -> pipe_sequence PIPE linebreak command','pipe_sequence',4,'p_pipe_sequence','lib/bb/pysh/pyshyacc.py',180),
+  ('command -> simple_command','command',1,'p_command','lib/bb/pysh/pyshyacc.py',187),
+  ('command -> compound_command','command',1,'p_command','lib/bb/pysh/pyshyacc.py',188),
+  ('command -> compound_command redirect_list','command',2,'p_command','lib/bb/pysh/pyshyacc.py',189),
+  ('command -> function_definition','command',1,'p_command','lib/bb/pysh/pyshyacc.py',190),
+  ('compound_command -> brace_group','compound_command',1,'p_compound_command','lib/bb/pysh/pyshyacc.py',209),
+  ('compound_command -> subshell','compound_command',1,'p_compound_command','lib/bb/pysh/pyshyacc.py',210),
+  ('compound_command -> for_clause','compound_command',1,'p_compound_command','lib/bb/pysh/pyshyacc.py',211),
+  ('compound_command -> case_clause','compound_command',1,'p_compound_command','lib/bb/pysh/pyshyacc.py',212),
+  ('compound_command -> if_clause','compound_command',1,'p_compound_command','lib/bb/pysh/pyshyacc.py',213),
+  ('compound_command -> while_clause','compound_command',1,'p_compound_command','lib/bb/pysh/pyshyacc.py',214),
+  ('compound_command -> until_clause','compound_command',1,'p_compound_command','lib/bb/pysh/pyshyacc.py',215),
+  ('subshell -> LPARENS compound_list RPARENS','subshell',3,'p_subshell','lib/bb/pysh/pyshyacc.py',219),
+  ('compound_list -> term','compound_list',1,'p_compound_list','lib/bb/pysh/pyshyacc.py',223),
+  ('compound_list -> newline_list term','compound_list',2,'p_compound_list','lib/bb/pysh/pyshyacc.py',224),
+  ('compound_list -> term separator','compound_list',2,'p_compound_list','lib/bb/pysh/pyshyacc.py',225),
+  ('compound_list -> newline_list term separator','compound_list',3,'p_compound_list','lib/bb/pysh/pyshyacc.py',226),
+  ('term -> term separator and_or','term',3,'p_term','lib/bb/pysh/pyshyacc.py',238),
+  ('term -> and_or','term',1,'p_term','lib/bb/pysh/pyshyacc.py',239),
+  ('maybe_for_word -> For','maybe_for_word',1,'p_maybe_for_word','lib/bb/pysh/pyshyacc.py',249),
+  ('for_clause -> for_word name linebreak do_group','for_clause',4,'p_for_clause','lib/bb/pysh/pyshyacc.py',254),
+  ('for_clause -> for_word name linebreak in sequential_sep do_group','for_clause',6,'p_for_clause','lib/bb/pysh/pyshyacc.py',255),
+  ('for_clause -> for_word name linebreak in wordlist sequential_sep do_group','for_clause',7,'p_for_clause','lib/bb/pysh/pyshyacc.py',256),
+  ('name -> token','name',1,'p_name','lib/bb/pysh/pyshyacc.py',273),
+  ('in -> In','in',1,'p_in','lib/bb/pysh/pyshyacc.py',277),
+  ('wordlist -> wordlist token','wordlist',2,'p_wordlist','lib/bb/pysh/pyshyacc.py',281),
+  ('wordlist -> token','wordlist',1,'p_wordlist','lib/bb/pysh/pyshyacc.py',282),
+  ('case_clause -> Case token linebreak in linebreak case_list Esac','case_clause',7,'p_case_clause','lib/bb/pysh/pyshyacc.py',289),
+  ('case_clause -> Case token linebreak in linebreak case_list_ns Esac','case_clause',7,'p_case_clause','lib/bb/pysh/pyshyacc.py',290),
+  ('case_clause -> Case token linebreak in linebreak Esac','case_clause',6,'p_case_clause','lib/bb/pysh/pyshyacc.py',291),
+  ('case_list_ns -> case_list case_item_ns','case_list_ns',2,'p_case_list_ns','lib/bb/pysh/pyshyacc.py',300),
+  ('case_list_ns -> case_item_ns','case_list_ns',1,'p_case_list_ns','lib/bb/pysh/pyshyacc.py',301),
+  ('case_list -> case_list case_item','case_list',2,'p_case_list','lib/bb/pysh/pyshyacc.py',305),
+  ('case_list -> case_item','case_list',1,'p_case_list','lib/bb/pysh/pyshyacc.py',306),
+  ('case_item_ns -> pattern RPARENS linebreak','case_item_ns',3,'p_case_item_ns','lib/bb/pysh/pyshyacc.py',313),
+  ('case_item_ns -> pattern RPARENS compound_list linebreak','case_item_ns',4,'p_case_item_ns','lib/bb/pysh/pyshyacc.py',314),
+  ('case_item_ns -> LPARENS pattern RPARENS linebreak','case_item_ns',4,'p_case_item_ns','lib/bb/pysh/pyshyacc.py',315),
+  ('case_item_ns -> LPARENS pattern RPARENS compound_list linebreak','case_item_ns',5,'p_case_item_ns','lib/bb/pysh/pyshyacc.py',316),
+  ('case_item -> pattern RPARENS linebreak DSEMI linebreak','case_item',5,'p_case_item','lib/bb/pysh/pyshyacc.py',320),
+  ('case_item -> pattern RPARENS compound_list DSEMI linebreak','case_item',5,'p_case_item','lib/bb/pysh/pyshyacc.py',321),
+  ('case_item -> LPARENS pattern RPARENS linebreak DSEMI linebreak','case_item',6,'p_case_item','lib/bb/pysh/pyshyacc.py',322),
+  ('case_item -> LPARENS pattern RPARENS compound_list DSEMI linebreak','case_item',6,'p_case_item','lib/bb/pysh/pyshyacc.py',323),
+  ('pattern -> token','pattern',1,'p_pattern','lib/bb/pysh/pyshyacc.py',337),
+  ('pattern -> pattern PIPE token','pattern',3,'p_pattern','lib/bb/pysh/pyshyacc.py',338),
+  ('maybe_if_word -> If','maybe_if_word',1,'p_maybe_if_word','lib/bb/pysh/pyshyacc.py',345),
+  ('maybe_then_word -> Then','maybe_then_word',1,'p_maybe_then_word','lib/bb/pysh/pyshyacc.py',350),
+  ('if_clause -> if_word compound_list then_word compound_list else_part Fi','if_clause',6,'p_if_clause','lib/bb/pysh/pyshyacc.py',355),
+  ('if_clause -> if_word compound_list then_word compound_list Fi','if_clause',5,'p_if_clause','lib/bb/pysh/pyshyacc.py',356),
+  ('else_part -> Elif compound_list then_word compound_list else_part','else_part',5,'p_else_part','lib/bb/pysh/pyshyacc.py',363),
+  ('else_part -> Elif compound_list then_word compound_list','else_part',4,'p_else_part','lib/bb/pysh/pyshyacc.py',364),
+  ('else_part -> Else compound_list','else_part',2,'p_else_part','lib/bb/pysh/pyshyacc.py',365),
+  ('while_clause -> While compound_list do_group','while_clause',3,'p_while_clause','lib/bb/pysh/pyshyacc.py',375),
+  ('maybe_until_word -> Until','maybe_until_word',1,'p_maybe_until_word','lib/bb/pysh/pyshyacc.py',379),
+  ('until_clause -> until_word compound_list do_group','until_clause',3,'p_until_clause','lib/bb/pysh/pyshyacc.py',384),
+  ('function_definition -> fname LPARENS RPARENS linebreak function_body','function_definition',5,'p_function_definition','lib/bb/pysh/pyshyacc.py',388),
+  ('function_body -> compound_command','function_body',1,'p_function_body','lib/bb/pysh/pyshyacc.py',392),
+  ('function_body -> compound_command redirect_list','function_body',2,'p_function_body','lib/bb/pysh/pyshyacc.py',393),
+  ('fname -> TOKEN','fname',1,'p_fname','lib/bb/pysh/pyshyacc.py',399),
+  ('brace_group -> Lbrace compound_list Rbrace','brace_group',3,'p_brace_group','lib/bb/pysh/pyshyacc.py',403),
+  ('maybe_done_word -> Done','maybe_done_word',1,'p_maybe_done_word','lib/bb/pysh/pyshyacc.py',407),
+  ('maybe_do_word -> Do','maybe_do_word',1,'p_maybe_do_word','lib/bb/pysh/pyshyacc.py',412),
+  ('do_group -> do_word compound_list done_word','do_group',3,'p_do_group','lib/bb/pysh/pyshyacc.py',416),
+  ('simple_command -> cmd_prefix cmd_word cmd_suffix','simple_command',3,'p_simple_command','lib/bb/pysh/pyshyacc.py',421),
+  ('simple_command -> cmd_prefix cmd_word','simple_command',2,'p_simple_command','lib/bb/pysh/pyshyacc.py',422),
+  ('simple_command -> cmd_prefix','simple_command',1,'p_simple_command','lib/bb/pysh/pyshyacc.py',423),
+  ('simple_command -> cmd_name cmd_suffix','simple_command',2,'p_simple_command','lib/bb/pysh/pyshyacc.py',424),
+  ('simple_command -> cmd_name','simple_command',1,'p_simple_command','lib/bb/pysh/pyshyacc.py',425),
+  ('cmd_name -> TOKEN','cmd_name',1,'p_cmd_name','lib/bb/pysh/pyshyacc.py',445),
+  ('cmd_word -> token','cmd_word',1,'p_cmd_word','lib/bb/pysh/pyshyacc.py',449),
+  ('maybe_assignment_word -> ASSIGNMENT_WORD','maybe_assignment_word',1,'p_maybe_assignment_word','lib/bb/pysh/pyshyacc.py',453),
+  ('cmd_prefix -> io_redirect','cmd_prefix',1,'p_cmd_prefix','lib/bb/pysh/pyshyacc.py',458),
+  ('cmd_prefix -> cmd_prefix io_redirect','cmd_prefix',2,'p_cmd_prefix','lib/bb/pysh/pyshyacc.py',459),
+  ('cmd_prefix -> assignment_word','cmd_prefix',1,'p_cmd_prefix','lib/bb/pysh/pyshyacc.py',460),
+  ('cmd_prefix -> cmd_prefix assignment_word','cmd_prefix',2,'p_cmd_prefix','lib/bb/pysh/pyshyacc.py',461),
+  ('cmd_suffix -> io_redirect','cmd_suffix',1,'p_cmd_suffix','lib/bb/pysh/pyshyacc.py',475),
+  ('cmd_suffix -> cmd_suffix io_redirect','cmd_suffix',2,'p_cmd_suffix','lib/bb/pysh/pyshyacc.py',476),
+  ('cmd_suffix -> token','cmd_suffix',1,'p_cmd_suffix','lib/bb/pysh/pyshyacc.py',477),
+  ('cmd_suffix -> cmd_suffix token','cmd_suffix',2,'p_cmd_suffix','lib/bb/pysh/pyshyacc.py',478),
+  ('cmd_suffix -> maybe_for_word','cmd_suffix',1,'p_cmd_suffix','lib/bb/pysh/pyshyacc.py',479),
+  ('cmd_suffix -> cmd_suffix maybe_for_word','cmd_suffix',2,'p_cmd_suffix','lib/bb/pysh/pyshyacc.py',480),
+  ('cmd_suffix -> maybe_done_word','cmd_suffix',1,'p_cmd_suffix','lib/bb/pysh/pyshyacc.py',481),
+  ('cmd_suffix -> cmd_suffix maybe_done_word','cmd_suffix',2,'p_cmd_suffix','lib/bb/pysh/pyshyacc.py',482),
+  ('cmd_suffix -> maybe_do_word','cmd_suffix',1,'p_cmd_suffix','lib/bb/pysh/pyshyacc.py',483),
+  ('cmd_suffix -> cmd_suffix maybe_do_word','cmd_suffix',2,'p_cmd_suffix','lib/bb/pysh/pyshyacc.py',484),
+  ('cmd_suffix -> maybe_until_word','cmd_suffix',1,'p_cmd_suffix','lib/bb/pysh/pyshyacc.py',485),
+  ('cmd_suffix -> cmd_suffix maybe_until_word','cmd_suffix',2,'p_cmd_suffix','lib/bb/pysh/pyshyacc.py',486),
+  ('cmd_suffix -> maybe_assignment_word','cmd_suffix',1,'p_cmd_suffix','lib/bb/pysh/pyshyacc.py',487),
+  ('cmd_suffix -> cmd_suffix maybe_assignment_word','cmd_suffix',2,'p_cmd_suffix','lib/bb/pysh/pyshyacc.py',488),
+  ('cmd_suffix -> maybe_if_word','cmd_suffix',1,'p_cmd_suffix','lib/bb/pysh/pyshyacc.py',489),
+  ('cmd_suffix -> cmd_suffix maybe_if_word','cmd_suffix',2,'p_cmd_suffix','lib/bb/pysh/pyshyacc.py',490),
+  ('cmd_suffix -> maybe_then_word','cmd_suffix',1,'p_cmd_suffix','lib/bb/pysh/pyshyacc.py',491),
+  ('cmd_suffix -> cmd_suffix maybe_then_word','cmd_suffix',2,'p_cmd_suffix','lib/bb/pysh/pyshyacc.py',492),
+  ('cmd_suffix -> maybe_bang_word','cmd_suffix',1,'p_cmd_suffix','lib/bb/pysh/pyshyacc.py',493),
+  ('cmd_suffix -> cmd_suffix maybe_bang_word','cmd_suffix',2,'p_cmd_suffix','lib/bb/pysh/pyshyacc.py',494),
+  ('redirect_list -> io_redirect','redirect_list',1,'p_redirect_list','lib/bb/pysh/pyshyacc.py',512),
+  ('redirect_list -> redirect_list io_redirect','redirect_list',2,'p_redirect_list','lib/bb/pysh/pyshyacc.py',513),
+  ('io_redirect -> io_file','io_redirect',1,'p_io_redirect','lib/bb/pysh/pyshyacc.py',520),
+  ('io_redirect -> IO_NUMBER io_file','io_redirect',2,'p_io_redirect','lib/bb/pysh/pyshyacc.py',521),
+  ('io_redirect -> io_here','io_redirect',1,'p_io_redirect','lib/bb/pysh/pyshyacc.py',522),
+  ('io_redirect -> IO_NUMBER io_here','io_redirect',2,'p_io_redirect','lib/bb/pysh/pyshyacc.py',523),
+  ('io_file -> LESS filename','io_file',2,'p_io_file','lib/bb/pysh/pyshyacc.py',530),
+  ('io_file -> LESSAND filename','io_file',2,'p_io_file','lib/bb/pysh/pyshyacc.py',531),
+  ('io_file -> GREATER filename','io_file',2,'p_io_file','lib/bb/pysh/pyshyacc.py',532),
+  ('io_file -> GREATAND filename','io_file',2,'p_io_file','lib/bb/pysh/pyshyacc.py',533),
+  ('io_file -> DGREAT filename','io_file',2,'p_io_file','lib/bb/pysh/pyshyacc.py',534),
+  ('io_file -> LESSGREAT filename','io_file',2,'p_io_file','lib/bb/pysh/pyshyacc.py',535),
+  ('io_file -> CLOBBER filename','io_file',2,'p_io_file','lib/bb/pysh/pyshyacc.py',536),
+  ('filename -> TOKEN','filename',1,'p_filename','lib/bb/pysh/pyshyacc.py',542),
+  ('io_here -> DLESS here_end','io_here',2,'p_io_here','lib/bb/pysh/pyshyacc.py',547),
+  ('io_here -> DLESSDASH here_end','io_here',2,'p_io_here','lib/bb/pysh/pyshyacc.py',548),
+  ('here_end -> HERENAME TOKEN','here_end',2,'p_here_end','lib/bb/pysh/pyshyacc.py',552),
+  ('newline_sequence -> newline_list','newline_sequence',1,'p_newline_sequence','lib/bb/pysh/pyshyacc.py',556),
+  ('newline_list -> NEWLINE','newline_list',1,'p_newline_list','lib/bb/pysh/pyshyacc.py',562),
+  ('newline_list -> newline_list NEWLINE','newline_list',2,'p_newline_list','lib/bb/pysh/pyshyacc.py',563),
+  ('linebreak -> newline_list','linebreak',1,'p_linebreak','lib/bb/pysh/pyshyacc.py',567),
+  ('linebreak -> empty','linebreak',1,'p_linebreak','lib/bb/pysh/pyshyacc.py',568),
+  ('separator_op -> COMMA','separator_op',1,'p_separator_op','lib/bb/pysh/pyshyacc.py',572),
+  ('separator_op -> AMP','separator_op',1,'p_separator_op','lib/bb/pysh/pyshyacc.py',573),
+  ('separator -> separator_op linebreak','separator',2,'p_separator','lib/bb/pysh/pyshyacc.py',577),
+  ('separator -> newline_list','separator',1,'p_separator','lib/bb/pysh/pyshyacc.py',578),
+  ('sequential_sep -> COMMA linebreak','sequential_sep',2,'p_sequential_sep','lib/bb/pysh/pyshyacc.py',587),
+  ('sequential_sep -> newline_list','sequential_sep',1,'p_sequential_sep','lib/bb/pysh/pyshyacc.py',588),
+  ('for_word -> maybe_for_word','for_word',1,'p_for_word','lib/bb/pysh/pyshyacc.py',595),
+  ('if_word -> maybe_if_word','if_word',1,'p_if_word','lib/bb/pysh/pyshyacc.py',599),
+  ('then_word -> maybe_then_word','then_word',1,'p_then_word','lib/bb/pysh/pyshyacc.py',603),
+  ('done_word -> maybe_done_word','done_word',1,'p_done_word','lib/bb/pysh/pyshyacc.py',607),
+  ('do_word -> maybe_do_word','do_word',1,'p_do_word','lib/bb/pysh/pyshyacc.py',611),
+  ('until_word -> maybe_until_word','until_word',1,'p_until_word','lib/bb/pysh/pyshyacc.py',615),
+  ('assignment_word -> maybe_assignment_word','assignment_word',1,'p_assignment_word','lib/bb/pysh/pyshyacc.py',619),
+  ('bang_word -> maybe_bang_word','bang_word',1,'p_bang_word','lib/bb/pysh/pyshyacc.py',623),
+  ('token -> TOKEN','token',1,'p_token','lib/bb/pysh/pyshyacc.py',627),
+  ('token -> Fi','token',1,'p_token','lib/bb/pysh/pyshyacc.py',628),
+  ('empty -> <empty>','empty',0,'p_empty','lib/bb/pysh/pyshyacc.py',632),
+]
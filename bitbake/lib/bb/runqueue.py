@@ -35,6 +35,10 @@ import bb
 from bb import msg, data, event
 from bb import monitordisk
 import subprocess
+import heapq
+import time
+import struct
+import multiprocessing
 
 try:
     import cPickle as pickle
@@ -44,7 +48,7 @@ except ImportError:
 bblogger = logging.getLogger("BitBake")
 logger = logging.getLogger("BitBake.RunQueue")
 
-__find_md5__ = re.compile( r'(?i)(?<![a-z0-9])[a-f0-9]{32}(?![a-z0-9])' )
+__find_hash__ = re.compile( r'(?i)(?<![a-z0-9])[a-f0-9]{32,128}(?![a-z0-9])' )
 
 class RunQueueStats:
     """
@@ -117,34 +121,49 @@ class RunQueueScheduler(object):
 
         self.rev_prio_map = None
 
-    def next_buildable_task(self):
+    def build_rev_prio_map(self):
         """
-        Return the id of the first task we find that is buildable
+        Invert prio_map (index -> taskid) into rev_prio_map (taskid -> index)
+        and seed the buildable heap from the tasks already marked buildable.
+        This is deferred until the first call to next_buildable_task() since
+        subclasses replace prio_map after the base constructor has run.
         """
-        self.buildable = [x for x in self.buildable if not self.rq.runq_running[x] == 1]
-        if not self.buildable:
-            return None
-        if len(self.buildable) == 1:
-            taskid = self.buildable[0]
-            stamp = self.stamps[taskid]
-            if stamp not in self.rq.build_stamps.itervalues():
-                return taskid
-
-        if not self.rev_prio_map:
-            self.rev_prio_map = range(self.numTasks)
-            for taskid in xrange(self.numTasks):
-                self.rev_prio_map[self.prio_map[taskid]] = taskid
+        self.rev_prio_map = range(self.numTasks)
+        for prio, taskid in enumerate(self.prio_map):
+            self.rev_prio_map[taskid] = prio
+
+        self.buildable = [(self.rev_prio_map[taskid], taskid) for taskid in self.buildable]
+        heapq.heapify(self.buildable)
 
+    def next_buildable_task(self):
+        """
+        Return the id of the highest priority buildable task whose stamp
+        is not already in use by a running task
+        """
+        if self.rev_prio_map is None:
+            self.build_rev_prio_map()
+
+        # Tasks are never removed from the heap when they start running, they
+        # are discarded lazily here instead. Entries whose stamp is busy stay
+        # queued and are pushed back once a candidate has been found.
+        buildable = self.buildable
+        running = self.rq.runq_running
+        active_stamps = self.rq.build_stamps2
+        deferred = []
         best = None
-        bestprio = None
-        for taskid in self.buildable:
-            prio = self.rev_prio_map[taskid]
-            if bestprio is None or bestprio > prio:
-                stamp = self.stamps[taskid]
-                if stamp in self.rq.build_stamps.itervalues():
-                    continue
-                bestprio = prio
-                best = taskid
+        while buildable:
+            taskid = buildable[0][1]
+            if running[taskid] == 1:
+                heapq.heappop(buildable)
+                continue
+            if self.stamps[taskid] in active_stamps:
+                deferred.append(heapq.heappop(buildable))
+                continue
+            best = taskid
+            break
+
+        for entry in deferred:
+            heapq.heappush(buildable, entry)
 
         return best
 
@@ -156,7 +175,10 @@ class RunQueueScheduler(object):
             return self.next_buildable_task()
 
     def newbuilable(self, task):
-        self.buildable.append(task)
+        if self.rev_prio_map is None:
+            self.buildable.append(task)
+        else:
+            heapq.heappush(self.buildable, (self.rev_prio_map[task], task))
 
 class RunQueueSchedulerSpeed(RunQueueScheduler):
     """
@@ -171,16 +193,9 @@ class RunQueueSchedulerSpeed(RunQueueScheduler):
         """
         RunQueueScheduler.__init__(self, runqueue, rqdata)
 
-        sortweight = sorted(copy.deepcopy(self.rqdata.runq_weight))
-        copyweight = copy.deepcopy(self.rqdata.runq_weight)
-        self.prio_map = []
-
-        for weight in sortweight:
-            idx = copyweight.index(weight)
-            self.prio_map.append(idx)
-            copyweight[idx] = -1
-
-        self.prio_map.reverse()
+        # Heaviest first, tasks of equal weight in descending task order
+        weight = self.rqdata.runq_weight
+        self.prio_map = sorted(xrange(self.numTasks), key=lambda taskid: (weight[taskid], taskid), reverse=True)
 
 class RunQueueSchedulerCompletion(RunQueueSchedulerSpeed):
     """
@@ -198,21 +213,148 @@ class RunQueueSchedulerCompletion(RunQueueSchedulerSpeed):
         #FIXME - whilst this groups all fnids together it does not reorder the
         #fnid groups optimally.
 
-        basemap = copy.deepcopy(self.prio_map)
-        self.prio_map = []
-        while (len(basemap) > 0):
-            entry = basemap.pop(0)
-            self.prio_map.append(entry)
-            fnid = self.rqdata.runq_fnid[entry]
-            todel = []
-            for entry in basemap:
-                entry_fnid = self.rqdata.runq_fnid[entry]
-                if entry_fnid == fnid:
-                    todel.append(basemap.index(entry))
-                    self.prio_map.append(entry)
-            todel.reverse()
-            for idx in todel:
-                del basemap[idx]
+        # Each fnid is placed where its highest priority task was, the stable
+        # sort keeping its tasks in their original relative order
+        fnids = self.rqdata.runq_fnid
+        fnidprio = {}
+        for prio, taskid in enumerate(self.prio_map):
+            fnidprio.setdefault(fnids[taskid], prio)
+        self.prio_map.sort(key=lambda taskid: fnidprio[fnids[taskid]])
+
+class RunQueueSchedulerMakespan(RunQueueSchedulerSpeed):
+    """
+    A scheduler optimised to minimise the total build time. Each task is
+    weighted by the length in seconds of the longest chain of tasks that
+    depends on it, using task durations recorded by previous builds, so
+    long running tasks on the critical path are started as early as possible.
+    Tasks with no recorded duration are assumed to take the mean recorded
+    duration of tasks of the same name, or of all tasks if no task of that
+    name was recorded. Ties are broken using the normal task weights.
+    """
+    name = "makespan"
+
+    def __init__(self, runqueue, rqdata):
+        RunQueueSchedulerSpeed.__init__(self, runqueue, rqdata)
+
+        durations = self.get_durations()
+        if not durations:
+            # Nothing recorded yet, stay with the "speed" ordering
+            return
+
+        estimates = self.estimate_durations(durations)
+        pathlen = []
+        deps_left = []
+        for taskid in xrange(self.numTasks):
+            fn = self.rqdata.taskData.fn_index[self.rqdata.runq_fnid[taskid]]
+            taskname = self.rqdata.runq_task[taskid]
+            key = task_duration_key(self.rqdata.dataCache, fn, taskname)
+            if key in durations:
+                pathlen.append(durations[key])
+            else:
+                pathlen.append(estimates.get(taskname, estimates[None]))
+            deps_left.append(len(self.rqdata.runq_revdeps[taskid]))
+
+        # Walk back from the endpoints, a task's remaining path being its own
+        # duration plus the longest remaining path of anything depending on it
+        endpoints = [taskid for taskid in xrange(self.numTasks) if not deps_left[taskid]]
+        longest = [0.0] * self.numTasks
+        while endpoints:
+            next_points = []
+            for taskid in endpoints:
+                pathlen[taskid] += longest[taskid]
+                for dep in self.rqdata.runq_depends[taskid]:
+                    if pathlen[taskid] > longest[dep]:
+                        longest[dep] = pathlen[taskid]
+                    deps_left[dep] -= 1
+                    if not deps_left[dep]:
+                        next_points.append(dep)
+            endpoints = next_points
+
+        weight = self.rqdata.runq_weight
+        self.prio_map = sorted(xrange(self.numTasks), key=lambda taskid: (pathlen[taskid], weight[taskid]), reverse=True)
+
+    @staticmethod
+    def estimate_durations(durations):
+        """
+        Return the mean of the recorded durations for each task name, and
+        of all of them under None
+        """
+        totals = {}
+        for key, duration in durations.iteritems():
+            taskname = key.rsplit(":", 1)[1]
+            for name in (taskname, None):
+                total, count = totals.get(name, (0.0, 0))
+                totals[name] = (total + duration, count + 1)
+        return dict((name, total / count) for name, (total, count) in totals.iteritems())
+
+    def get_durations(self):
+        """
+        Return a dict of task durations in seconds recorded by previous builds
+        """
+        store = task_duration_store(self.rq.cfgData)
+        if store is None:
+            return {}
+        durations = {}
+        for key, value in store.iteritems():
+            try:
+                durations[key] = float(value)
+            except ValueError:
+                continue
+        return durations
+
+def task_duration_key(dataCache, fn, taskname):
+    return "%s:%s" % (dataCache.pkg_fn[fn], taskname)
+
+def task_duration_store(d):
+    """
+    Return the persistent table holding task durations from previous builds,
+    or None if no persistent storage location is configured
+    """
+    if not (d.getVar("PERSISTENT_DIR", True) or d.getVar("CACHE", True)):
+        return None
+    return bb.persist_data.persist('BB_TASK_DURATIONS', d)
+
+taskhash_datacache = None
+
+def taskhash_init(dataCache, cfgData):
+    """
+    Set up a task hashing process forked from the cooker
+    """
+    global taskhash_datacache
+    taskhash_datacache = dataCache
+    multiprocessing.util.Finalize(None, bb.fetch2.fetcher_parse_save, args=(cfgData,), exitpriority=1)
+
+def taskstate_supported(siggen):
+    """
+    Can the per task state of siggen be moved between processes? The
+    get_taskstate() and set_taskstate() it uses have to be overridden by
+    the class which calculates its task hashes, or a subclass of it, or
+    state kept by that class would be lost.
+    """
+    def definedby(name):
+        for cls in type(siggen).__mro__:
+            if name in vars(cls):
+                return cls
+
+    hashclass = definedby("get_taskhash")
+    for name in ("get_taskstate", "set_taskstate"):
+        cls = definedby(name)
+        if cls is bb.siggen.SignatureGenerator or not issubclass(cls, hashclass):
+            return False
+    return True
+
+def taskhash_batch(batch):
+    """
+    Hash a batch of tasks given the hashes of everything they depend on
+    """
+    tasks, dephashes = batch
+    siggen = bb.parse.siggen
+    siggen.taskhash.update(dephashes)
+    results = []
+    for (task, fn, taskname, procdep) in tasks:
+        h = siggen.get_taskhash(fn, taskname, procdep, taskhash_datacache)
+        results.append((task, h, siggen.get_taskstate(fn, taskname)))
+    return results
 
 class RunQueueData:
     """
@@ -796,20 +938,85 @@ class RunQueueData:
                     invalidate_task(fn, "do_%s" % st, True)
 
         # Iterate over the task list and call into the siggen code
-        dealtwith = set()
-        todeal = set(range(len(self.runq_fnid)))
-        while len(todeal) > 0:
-            for task in todeal.copy():
-                if len(self.runq_depends[task] - dealtwith) == 0:
-                    dealtwith.add(task)
-                    todeal.remove(task)
-                    procdep = []
-                    for dep in self.runq_depends[task]:
-                        procdep.append(self.taskData.fn_index[self.runq_fnid[dep]] + "." + self.runq_task[dep])
-                    self.runq_hash[task] = bb.parse.siggen.get_taskhash(self.taskData.fn_index[self.runq_fnid[task]], self.runq_task[task], procdep, self.dataCache)
+        num_processes = int(self.cooker.data.getVar("BB_NUMBER_HASH_THREADS", True) or 1)
+        self.calculate_task_hashes(num_processes)
+
+        # Keep the checksums of any local files for next time
+        bb.fetch2.fetcher_checksums_done(self.cooker.data)
 
         return len(self.runq_fnid)
 
+    def hash_levels(self):
+        """
+        Group the tasks into levels where every task only depends on
+        tasks in earlier levels
+        """
+        pending = [len(deps) for deps in self.runq_depends]
+        level = [task for task in xrange(len(self.runq_fnid)) if not pending[task]]
+        levels = []
+        while level:
+            levels.append(level)
+            nextlevel = []
+            for task in level:
+                for revdep in self.runq_revdeps[task]:
+                    pending[revdep] -= 1
+                    if not pending[revdep]:
+                        nextlevel.append(revdep)
+            level = nextlevel
+        return levels
+
+    def taskhash_args(self, task):
+        procdep = []
+        for dep in self.runq_depends[task]:
+            procdep.append(self.taskData.fn_index[self.runq_fnid[dep]] + "." + self.runq_task[dep])
+        return (task, self.taskData.fn_index[self.runq_fnid[task]], self.runq_task[task], procdep)
+
+    def calculate_task_hashes(self, num_processes, min_parallel=100):
+        """
+        Compute the hash of every task one dependency level at a time.
+        Levels of at least min_parallel tasks are split into batches
+        which are hashed by a pool of forked processes; their results
+        are merged back into the signature generator so everything
+        matches what hashing the tasks in this process would give. Only
+        signature generators which can hand over their per task state
+        that way are used in parallel.
+        """
+        siggen = bb.parse.siggen
+        if not taskstate_supported(siggen):
+            num_processes = 1
+        pool = None
+        try:
+            for level in self.hash_levels():
+                if num_processes < 2 or len(level) < min_parallel:
+                    for task in level:
+                        (task, fn, taskname, procdep) = self.taskhash_args(task)
+                        self.runq_hash[task] = siggen.get_taskhash(fn, taskname, procdep, self.dataCache)
+                    continue
+
+                if not pool:
+                    pool = multiprocessing.Pool(num_processes, taskhash_init, (self.dataCache, self.cooker.data))
+                batchsize = (len(level) + num_processes * 2 - 1) / (num_processes * 2)
+                batches = []
+                for i in xrange(0, len(level), batchsize):
+                    tasks = [self.taskhash_args(task) for task in level[i:i + batchsize]]
+                    dephashes = {}
+                    for (task, fn, taskname, procdep) in tasks:
+                        for dep in procdep:
+                            if dep in siggen.taskhash:
+                                dephashes[dep] = siggen.taskhash[dep]
+                    batches.append((tasks, dephashes))
+
+                for results in pool.map(taskhash_batch, batches, 1):
+                    for (task, h, state) in results:
+                        siggen.set_taskstate(self.taskData.fn_index[self.runq_fnid[task]], self.runq_task[task], state)
+                        self.runq_hash[task] = h
+        finally:
+            if pool:
+                pool.close()
+                pool.join()
+                # Pick up the file checksums calculated by the pool
+                bb.fetch2.fetcher_parse_done(self.cooker.data)
+
     def dump_data(self, taskQueue):
         """
         Dump some debug information on the internal data structures
@@ -857,7 +1064,24 @@ class RunQueue:
         self.fakeworker = None
         self.fakeworkerpipe = None
 
+    def _keep_workers(self):
+        # A memory resident server keeps its workers between builds so they
+        # don't have to parse the base configuration again
+        return self.cooker.configuration.server_only and not self.cooker.configuration.profile
+
     def _start_worker(self, fakeroot = False, rqexec = None):
+        idle = self.cooker.idle_workers.pop(fakeroot, None)
+        if idle:
+            data_hash, worker, workerpipe = idle
+            if data_hash == self.cooker.data_hash and worker.poll() is None and self._keep_workers():
+                logger.debug(1, "Reusing bitbake-worker %s", worker.pid)
+                workerpipe.d = self.cfgData
+                workerpipe.rq = self
+                workerpipe.rqexec = rqexec
+                self._send_worker_config(worker)
+                return worker, workerpipe
+            self._teardown_worker(worker, workerpipe)
+
         logger.debug(1, "Starting bitbake-worker")
         magic = "decafbad"
         if self.cooker.configuration.profile:
@@ -873,7 +1097,11 @@ class RunQueue:
             worker = subprocess.Popen(["bitbake-worker", magic], stdout=subprocess.PIPE, stdin=subprocess.PIPE)
         bb.utils.nonblockingfd(worker.stdout)
         workerpipe = runQueuePipe(worker.stdout, None, self.cfgData, self, rqexec)
+        self._send_worker_config(worker)
+
+        return worker, workerpipe
 
+    def _send_worker_config(self, worker):
         workerdata = {
             "taskdeps" : self.rqdata.dataCache.task_deps,
             "fakerootenv" : self.rqdata.dataCache.fakerootenv,
@@ -895,7 +1123,16 @@ class RunQueue:
         worker.stdin.write("<workerdata>" + pickle.dumps(workerdata) + "</workerdata>")
         worker.stdin.flush()
 
-        return worker, workerpipe
+    def _idle_worker(self, fakeroot, worker, workerpipe):
+        if not worker:
+            return
+        if not self._keep_workers() or worker.poll() is not None:
+            self._teardown_worker(worker, workerpipe)
+            return
+        logger.debug(1, "Keeping bitbake-worker %s for the next build", worker.pid)
+        while workerpipe.read():
+            continue
+        self.cooker.idle_workers[fakeroot] = (self.cooker.data_hash, worker, workerpipe)
 
     def _teardown_worker(self, worker, workerpipe):
         if not worker:
@@ -925,10 +1162,10 @@ class RunQueue:
 
     def teardown_workers(self):
         self.teardown = True
-        self._teardown_worker(self.worker, self.workerpipe)
+        self._idle_worker(False, self.worker, self.workerpipe)
         self.worker = None
         self.workerpipe = None
-        self._teardown_worker(self.fakeworker, self.fakeworkerpipe)
+        self._idle_worker(True, self.fakeworker, self.fakeworkerpipe)
         self.fakeworker = None
         self.fakeworkerpipe = None
 
@@ -1068,6 +1305,8 @@ class RunQueue:
 
         if (self.state is runQueueComplete or self.state is runQueueFailed) and self.rqexe:
             self.teardown_workers()
+            if isinstance(self.rqexe, RunQueueExecuteTasks):
+                self.rqexe.save_task_durations()
             if self.rqexe.stats.failed:
                 logger.info("Tasks Summary: Attempted %d tasks of which %d didn't need to be rerun and %d failed.", self.rqexe.stats.completed + self.rqexe.stats.failed, self.rqexe.stats.skipped, self.rqexe.stats.failed)
             else:
@@ -1244,10 +1483,18 @@ class RunQueue:
             matches = {k : v for k, v in matches.iteritems() if h not in k}
             if matches:
                 latestmatch = sorted(matches.keys(), key=lambda f: matches[f])[-1]
-                prevh = __find_md5__.search(latestmatch).group(0)
+                prevh = __find_hash__.search(latestmatch).group(0)
                 output = bb.siggen.compare_sigfiles(latestmatch, match, recursecb)
                 bb.plain("\nTask %s:%s couldn't be used from the cache because:\n  We need hash %s, closest matching task was %s\n  " % (pn, taskname, h, prevh) + '\n  '.join(output))
 
+def teardown_idle_workers(cooker):
+    """
+    Stop the workers a memory resident server kept between builds
+    """
+    for fakeroot in list(cooker.idle_workers):
+        data_hash, worker, workerpipe = cooker.idle_workers.pop(fakeroot)
+        workerpipe.rq._teardown_worker(worker, workerpipe)
+
 class RunQueueExecute:
 
     def __init__(self, rq):
@@ -1264,7 +1511,8 @@ class RunQueueExecute:
         self.runq_complete = []
 
         self.build_stamps = {}
-        self.build_stamps2 = []
+        # Stamps of the tasks currently running, checked by the schedulers
+        self.build_stamps2 = set()
         self.failed_fnids = []
 
         self.stampcache = {}
@@ -1277,7 +1525,7 @@ class RunQueueExecute:
 
         # self.build_stamps[pid] may not exist when use shared work directory.
         if task in self.build_stamps:
-            self.build_stamps2.remove(self.build_stamps[task])
+            self.build_stamps2.discard(self.build_stamps[task])
             del self.build_stamps[task]
 
         if status != 0:
@@ -1357,6 +1605,11 @@ class RunQueueExecuteTasks(RunQueueExecute):
 
         self.stampcache = {}
 
+        self.task_starttime = {}
+        # Durations of the tasks run in this build, written to the
+        # persistent store at the end of the build
+        self.task_durations = {}
+
         initial_covered = self.rq.scenequeue_covered.copy()
 
         # Mark initial buildable tasks
@@ -1499,8 +1752,41 @@ class RunQueueExecuteTasks(RunQueueExecute):
     def task_complete(self, task):
         self.stats.taskCompleted()
         bb.event.fire(runQueueTaskCompleted(task, self.stats, self.rq), self.cfgData)
+        self.record_task_duration(task)
         self.task_completeoutright(task)
 
+    def record_task_duration(self, task):
+        """
+        Store how long a successfully executed task took for use by the
+        makespan scheduler in later builds
+        """
+        starttime = self.task_starttime.pop(task, None)
+        if starttime is None:
+            return
+        fn = self.rqdata.taskData.fn_index[self.rqdata.runq_fnid[task]]
+        key = task_duration_key(self.rqdata.dataCache, fn, self.rqdata.runq_task[task])
+        self.task_durations[key] = time.time() - starttime
+
+    def save_task_durations(self):
+        """
+        Write the durations of the tasks run in this build to the persistent
+        store, averaged with the ones recorded before
+        """
+        if not self.task_durations:
+            return
+        store = task_duration_store(self.cfgData)
+        if store is None:
+            return
+        with store:
+            for key, duration in self.task_durations.iteritems():
+                try:
+                    # Smooth out the odd slow or fast run
+                    duration = (duration + float(store[key])) / 2
+                except (KeyError, ValueError):
+                    pass
+                store[key] = "%.3f" % duration
+        self.task_durations = {}
+
     def task_fail(self, task, exitcode):
         """
         Called when a task has failed
@@ -1578,7 +1864,9 @@ class RunQueueExecuteTasks(RunQueueExecute):
                 self.rq.worker.stdin.flush()
 
             self.build_stamps[task] = bb.build.stampfile(taskname, self.rqdata.dataCache, fn)
-            self.build_stamps2.append(self.build_stamps[task]) 
+            self.build_stamps2.add(self.build_stamps[task])
+            if not self.cooker.configuration.dry_run:
+                self.task_starttime[task] = time.time()
             self.runq_running[task] = 1
             self.stats.taskActive()
             if self.stats.active < self.number_tasks:
@@ -2106,6 +2394,76 @@ class runQueueTaskSkipped(runQueueEvent):
         runQueueEvent.__init__(self, task, stats, rq)
         self.reason = reason
 
+# Messages sent from bitbake-worker to the server are framed as a one byte
+# message type and a four byte payload length followed by the pickled payload
+workerMsgEvent = "e"
+workerMsgExitcode = "x"
+
+_frame_header = struct.Struct("!cI")
+
+def frame_worker_msg(msgtype, obj):
+    """
+    Return obj pickled and framed as a message of type msgtype
+    """
+    data = pickle.dumps(obj, pickle.HIGHEST_PROTOCOL)
+    return _frame_header.pack(msgtype, len(data)) + data
+
+class WorkerFrameBuffer(object):
+    """
+    Receive buffer splitting data read from a worker pipe into frames
+    """
+    def __init__(self):
+        self.buf = bytearray()
+
+    def __len__(self):
+        return len(self.buf)
+
+    def feed(self, data):
+        self.buf.extend(data)
+
+    def _complete(self):
+        """
+        Return the offsets of all the complete frames at the start of the
+        buffer and the end of the last one
+        """
+        offsets = []
+        pos = 0
+        end = len(self.buf)
+        headersize = _frame_header.size
+        while end - pos >= headersize:
+            msgtype, length = _frame_header.unpack_from(self.buf, pos)
+            if end - pos - headersize < length:
+                break
+            offsets.append((msgtype, pos + headersize, pos + headersize + length))
+            pos += headersize + length
+        return offsets, pos
+
+    def frames(self):
+        """
+        Remove all complete frames from the buffer and return them as a list
+        of (msgtype, payload) tuples
+        """
+        offsets, pos = self._complete()
+        if not offsets:
+            return []
+        view = memoryview(self.buf)
+        try:
+            frames = [(msgtype, view[start:end].tobytes()) for msgtype, start, end in offsets]
+        finally:
+            # The buffer can't be resized whilst the view exists
+            del view
+        del self.buf[:pos]
+        return frames
+
+    def raw_frames(self):
+        """
+        Remove all complete frames from the buffer and return them unparsed
+        """
+        _, pos = self._complete()
+        data = str(self.buf[:pos])
+        del self.buf[:pos]
+        return data
+
 class runQueuePipe():
     """
     Abstraction for a pipe between a worker thread and the server
@@ -2115,7 +2473,7 @@ class runQueuePipe():
         if pipeout:
             pipeout.close()
         bb.utils.nonblockingfd(self.input)
-        self.queue = ""
+        self.queue = WorkerFrameBuffer()
         self.d = d
         self.rq = rq
         self.rqexec = rqexec
@@ -2137,41 +2495,33 @@ class runQueuePipe():
                 bb.error("%s process (%s) exited unexpectedly (%s), shutting down..." % (name, w.pid, str(w.returncode)))
                 self.rq.finish_runqueue(True)
 
-        start = len(self.queue)
+        data = None
         try:
-            self.queue = self.queue + self.input.read(102400)
+            data = self.input.read(102400)
         except (OSError, IOError) as e:
             if e.errno != errno.EAGAIN:
                 raise
-        end = len(self.queue)
-        found = True
-        while found and len(self.queue):
-            found = False
-            index = self.queue.find("</event>")
-            while index != -1 and self.queue.startswith("<event>"):
-                try:
-                    event = pickle.loads(self.queue[7:index])
-                except ValueError as e:
-                    bb.msg.fatal("RunQueue", "failed load pickle '%s': '%s'" % (e, self.queue[7:index]))
-                bb.event.fire_from_worker(event, self.d)
-                found = True
-                self.queue = self.queue[index+8:]
-                index = self.queue.find("</event>")
-            index = self.queue.find("</exitcode>")
-            while index != -1 and self.queue.startswith("<exitcode>"):
-                try:
-                    task, status = pickle.loads(self.queue[10:index])
-                except ValueError as e:
-                    bb.msg.fatal("RunQueue", "failed load pickle '%s': '%s'" % (e, self.queue[10:index]))
+        if not data:
+            return False
+
+        self.queue.feed(data)
+        for msgtype, payload in self.queue.frames():
+            try:
+                msg = pickle.loads(payload)
+            except ValueError as e:
+                bb.msg.fatal("RunQueue", "failed load pickle '%s': '%s'" % (e, payload))
+            if msgtype == workerMsgEvent:
+                bb.event.fire_from_worker(msg, self.d)
+            elif msgtype == workerMsgExitcode:
+                task, status = msg
                 self.rqexec.runqueue_process_waitpid(task, status)
-                found = True
-                self.queue = self.queue[index+11:]
-                index = self.queue.find("</exitcode>")
-        return (end > start)
+            else:
+                bb.msg.fatal("RunQueue", "unknown message type '%s' from worker" % msgtype)
+        return True
 
     def close(self):
         while self.read():
             continue
         if len(self.queue) > 0:
-            print("Warning, worker left partial message: %s" % self.queue)
+            print("Warning, worker left partial message: %s" % str(self.queue.buf))
         self.input.close()
@@ -22,15 +22,21 @@
 
 import bb
 import bb.event
+import collections
 import itertools
 import logging
 import multiprocessing
 import os
 import signal
 import sys
+import threading
 import time
 import select
 from Queue import Empty
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
 from multiprocessing import Event, Process, util, Queue, Pipe, queues, Manager
 
 from . import BitBakeBaseServer, BitBakeBaseServerConnection, BaseImplServer
@@ -67,13 +73,79 @@ class EventAdapter():
     """
     Adapter to wrap our event queue since the caller (bb.event) expects to
     call a send() method, but our actual queue only has put()
+
+    Events are put on the queue in pickled batches, once batch_size of
+    them are waiting, when the server goes idle or at the latest
+    batch_delay seconds after the first of them was sent. Processes forked
+    from the server have no flusher thread and put their events on the
+    queue one at a time.
     """
+    batch_size = 256
+    batch_delay = 0.05
+
     def __init__(self, queue):
         self.queue = queue
+        self.batch = []
+        self.cond = threading.Condition()
+        self.flusher = None
+        self.pid = None
+
+    def start(self):
+        self.pid = os.getpid()
+        self.flusher = threading.Thread(target=self.flush_delayed)
+        self.flusher.daemon = True
+        self.flusher.start()
 
     def send(self, event):
+        if os.getpid() != self.pid:
+            # The batch and lock were copied from the server at fork time
+            self._send([event])
+            return
+        with self.cond:
+            self.batch.append(event)
+            if len(self.batch) == 1:
+                self.cond.notify()
+            elif len(self.batch) >= self.batch_size:
+                self._put()
+
+    def flush(self):
+        if os.getpid() != self.pid:
+            return
+        with self.cond:
+            if self.batch:
+                self._put()
+
+    def flush_delayed(self):
+        while True:
+            with self.cond:
+                while not self.batch:
+                    self.cond.wait()
+            time.sleep(self.batch_delay)
+            self.flush()
+
+    def _put(self):
+        # Called with the lock held so batches can't overtake each other
+        batch = self.batch
+        self.batch = []
+        self._send(batch)
+
+    def _send(self, events):
+        try:
+            data = pickle.dumps(events, pickle.HIGHEST_PROTOCOL)
+        except Exception:
+            # Only drop the events which can't be pickled
+            good = []
+            for event in events:
+                try:
+                    pickle.dumps(event, pickle.HIGHEST_PROTOCOL)
+                    good.append(event)
+                except Exception as err:
+                    print("EventAdapter puked: %s" % str(err))
+            if not good:
+                return
+            data = pickle.dumps(good, pickle.HIGHEST_PROTOCOL)
         try:
-            self.queue.put(event)
+            self.queue.put(data)
         except Exception as err:
             print("EventAdapter puked: %s" % str(err))
 
@@ -95,8 +167,9 @@ class ProcessServer(Process, BaseImplServer):
         self.event_handle = multiprocessing.Value("i")
 
     def run(self):
+        self.event.start()
         for event in bb.event.ui_queue:
-            self.event_queue.put(event)
+            self.event.send(event)
         self.event_handle.value = bb.event.register_UIHhandler(self)
 
         bb.cooker.server_main(self.cooker, self.main)
@@ -106,40 +179,47 @@ class ProcessServer(Process, BaseImplServer):
         # the UI and communicated to us
         self.quitin.close()
         signal.signal(signal.SIGINT, signal.SIG_IGN)
+        fds = [self.command_channel, self.quitout]
         while not self.quit:
             try:
-                if self.command_channel.poll():
+                ready = self.idle_commands(fds)
+                if self.command_channel in ready:
                     command = self.command_channel.recv()
                     self.runCommand(command)
-                if self.quitout.poll():
+                if self.quitout in ready:
                     self.quitout.recv()
                     self.quit = True
-
-                self.idle_commands(.1, [self.command_channel, self.quitout])
             except Exception:
                 logger.exception('Running command %s', command)
 
+        self.event.flush()
         self.event_queue.close()
         bb.event.unregister_UIHhandler(self.event_handle.value)
         self.command_channel.close()
         self.cooker.shutdown(True)
 
-    def idle_commands(self, delay, fds = []):
-        nextsleep = delay
+    def idle_commands(self, fds):
+        """
+        Run the idle functions once, then wait until one of fds, or of the
+        file descriptors they return, becomes readable or the earliest
+        timeout they asked for passes. Waiting events are sent to the UI
+        before going to sleep. Returns the readable objects of fds.
+        """
+        busy = False
+        nextsleep = None
+        fds = list(fds)
 
         for function, data in self._idlefuns.items():
             try:
                 retval = function(self, data, False)
                 if retval is False:
                     del self._idlefuns[function]
-                    nextsleep = None
+                    busy = True
                 elif retval is True:
-                    nextsleep = None
+                    busy = True
                 elif isinstance(retval, float):
-                    if (retval < nextsleep):
+                    if nextsleep is None or retval < nextsleep:
                         nextsleep = retval
-                elif nextsleep is None:
-                    continue
                 else:
                     fds = fds + retval
             except SystemExit:
@@ -149,8 +229,15 @@ class ProcessServer(Process, BaseImplServer):
                 del self._idlefuns[function]
                 self.quit = True
 
-        if nextsleep is not None:
-            select.select(fds,[],[],nextsleep)
+        due = bb.event.flush_ui_handlers()
+        if busy:
+            nextsleep = 0
+        elif due is not None and (nextsleep is None or due < nextsleep):
+            nextsleep = due
+        if nextsleep != 0:
+            self.event.flush()
+
+        return select.select(fds, [], [], nextsleep)[0]
 
     def runCommand(self, command):
         """
@@ -178,8 +265,10 @@ class BitBakeProcessServerConnection(BitBakeBaseServerConnection):
         def flushevents():
             while True:
                 try:
-                    event = self.event_queue.get(block=False)
-                except (Empty, IOError):
+                    event = self.event_queue.getEvent()
+                except IOError:
+                    break
+                if event is None:
                     break
                 if isinstance(event, logging.LogRecord):
                     logger.handle(event)
@@ -200,27 +289,34 @@ class ProcessEventQueue(multiprocessing.queues.Queue):
     def __init__(self, maxsize):
         multiprocessing.queues.Queue.__init__(self, maxsize)
         self.exit = False
+        self.pending = collections.deque()
 
     def setexit(self):
         self.exit = True
 
+    def nextEvent(self, block, timeout=None):
+        # The server puts pickled lists of events on the queue
+        while not self.pending:
+            self.pending.extend(pickle.loads(self.get(block, timeout)))
+        return self.pending.popleft()
+
     def waitEvent(self, timeout):
         if self.exit:
             sys.exit(1)
         try:
-            if not self.server.is_alive():
+            if not self.pending and not self.server.is_alive():
                 self.setexit()
                 return None
-            return self.get(True, timeout)
+            return self.nextEvent(True, timeout)
         except Empty:
             return None
 
     def getEvent(self):
         try:
-            if not self.server.is_alive():
+            if not self.pending and not self.server.is_alive():
                 self.setexit()
                 return None
-            return self.get(False)
+            return self.nextEvent(False)
         except Empty:
             return None
 
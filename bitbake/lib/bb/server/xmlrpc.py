@@ -257,6 +257,10 @@ class XMLRPCServer(SimpleXMLRPCServer, BaseImplServer):
                         del self._idlefuns[function]
                     pass
 
+            due = bb.event.flush_ui_handlers()
+            if due is not None and due < nextsleep:
+                nextsleep = due
+
             socktimeout = self.socket.gettimeout() or nextsleep
             socktimeout = min(socktimeout, nextsleep)
             # Mirror what BaseServer handle_request would do
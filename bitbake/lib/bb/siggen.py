@@ -1,8 +1,10 @@
 import hashlib
 import logging
+import marshal
 import os
 import re
 import tempfile
+import bb.cache
 import bb.data
 
 logger = logging.getLogger('BitBake.SigGen')
@@ -41,12 +43,24 @@ class SignatureGenerator(object):
     def finalise(self, fn, d, varient):
         return
 
+    def init_cache(self, d):
+        return
+
+    def save_cache(self):
+        return
+
     def get_taskhash(self, fn, task, deps, dataCache):
         return "0"
 
     def set_taskdata(self, hashes, deps, checksum):
         return
 
+    def get_taskstate(self, fn, task):
+        return None
+
+    def set_taskstate(self, fn, task, state):
+        return
+
     def stampfile(self, stampbase, file_name, taskname, extrainfo):
         return ("%s.%s.%s" % (stampbase, taskname, extrainfo)).rstrip('.')
 
@@ -69,6 +83,75 @@ class SignatureGenerator(object):
         self.runtaskdeps, self.taskhash, self.file_checksum_values = data
 
 
+class BaseHashCache(object):
+    """
+    Cache of the base task hashes of each recipe, checked against a hash of
+    the recipe's parse inputs: the configuration hash and the files the
+    recipe was parsed from.
+
+    Only the hashes are kept, not the variable data they were computed
+    from, so this can only be used where no signature data gets written.
+    """
+    cache_file_name = "bb_basehash.dat"
+    CACHE_VERSION = 1
+
+    def __init__(self):
+        self.cachefile = None
+        self.extras = {}
+
+    def init_cache(self, d):
+        cachedir = (d.getVar("PERSISTENT_DIR", True) or
+                    d.getVar("CACHE", True))
+        if cachedir in [None, '']:
+            return
+        bb.utils.mkdirhier(cachedir)
+        path = os.path.join(cachedir, self.cache_file_name)
+        if self.cachefile is not None:
+            self.cachefile.close()
+        self.cachefile = bb.cache.IndexedCacheFile(path)
+        try:
+            if self.cachefile.load() != (bb.cache.__cache_version__, bb.__version__):
+                self.cachefile.close()
+        except ValueError:
+            pass
+
+    def inputs_hash(self, d):
+        """
+        Return a hash of what d was parsed from, or None if it can't be
+        cached
+        """
+        if self.cachefile is None or d.getVar("__BB_DONT_CACHE", False):
+            return None
+        confighash = d.getVar("__BB_CONFIG_HASH", False)
+        if not confighash:
+            return None
+        depends = sorted(d.getVar("__depends", False) or [])
+        return hashlib.md5(str((confighash, depends))).hexdigest()
+
+    def lookup(self, fn, inputs):
+        """
+        Return the base hashes of the tasks of fn if it was last parsed from
+        the same inputs
+        """
+        if fn not in self.cachefile:
+            return None
+        try:
+            version, h, basehash = marshal.loads(self.cachefile.raw(fn))
+        except Exception:
+            return None
+        if version != self.CACHE_VERSION or h != inputs:
+            return None
+        return basehash
+
+    def add(self, fn, inputs, basehash):
+        self.extras[fn] = marshal.dumps((self.CACHE_VERSION, inputs, basehash))
+
+    def save(self):
+        if self.cachefile is None or not self.extras:
+            return
+        self.cachefile.update(self.extras, (), reload=True)
+        self.extras = {}
+
 class SignatureGeneratorBasic(SignatureGenerator):
     """
     """
@@ -82,8 +165,14 @@ class SignatureGeneratorBasic(SignatureGenerator):
         self.file_checksum_values = {}
         self.gendeps = {}
         self.lookupcache = {}
+        self.basehashcache = BaseHashCache()
         self.pkgnameextract = re.compile("(?P<fn>.*)\..*")
         self.basewhitelist = set((data.getVar("BB_HASHBASE_WHITELIST", True) or "").split())
+        self.hashalgorithm = data.getVar("BB_HASHALGORITHM", True) or "md5"
+        if self.hashalgorithm not in hashlib.algorithms:
+            bb.fatal("Invalid BB_HASHALGORITHM '%s', available algorithms: %s" %
+                     (self.hashalgorithm, ", ".join(hashlib.algorithms)))
+        self.newhash = getattr(hashlib, self.hashalgorithm)
         self.taskwhitelist = None
         self.init_rundepcheck(data)
 
@@ -94,8 +183,30 @@ class SignatureGeneratorBasic(SignatureGenerator):
         else:
             self.twl = None
 
+    def init_cache(self, d):
+        """
+        Reuse the base hashes of recipes parsed from unchanged inputs. The
+        variable data is then never computed, so signature data can't be
+        written for those recipes.
+        """
+        self.basehashcache.init_cache(d)
+
+    def save_cache(self):
+        self.basehashcache.save()
+
     def _build_data(self, fn, d):
 
+        inputs = self.basehashcache.inputs_hash(d)
+        if inputs:
+            basehash = self.basehashcache.lookup(fn, inputs)
+            if basehash is not None:
+                for task in basehash:
+                    self.basehash[fn + "." + task] = basehash[task]
+                self.taskdeps.pop(fn, None)
+                self.gendeps.pop(fn, None)
+                self.lookupcache.pop(fn, None)
+                return basehash
+
         tasklist, gendeps, lookupcache = bb.data.generate_dependencies(d)
 
         taskdeps = {}
@@ -107,6 +218,8 @@ class SignatureGeneratorBasic(SignatureGenerator):
             if data is None:
                 bb.error("Task %s from %s seems to be empty?!" % (task, fn))
                 data = ''
+                # Keep reporting it
+                inputs = None
 
             gendeps[task] -= self.basewhitelist
             newdeps = gendeps[task]
@@ -123,18 +236,23 @@ class SignatureGeneratorBasic(SignatureGenerator):
                 newdeps -= seen
 
             alldeps = sorted(seen)
+            h = self.newhash(data)
             for dep in alldeps:
-                data = data + dep
+                h.update(dep)
                 var = lookupcache[dep]
                 if var is not None:
-                    data = data + str(var)
-            self.basehash[fn + "." + task] = hashlib.md5(data).hexdigest()
+                    h.update(str(var))
+            basehash[task] = h.hexdigest()
+            self.basehash[fn + "." + task] = basehash[task]
             taskdeps[task] = alldeps
 
         self.taskdeps[fn] = taskdeps
         self.gendeps[fn] = gendeps
         self.lookupcache[fn] = lookupcache
 
+        if inputs:
+            self.basehashcache.add(fn, inputs, basehash)
+
         return taskdeps
 
     def finalise(self, fn, d, variant):
@@ -175,7 +293,7 @@ class SignatureGeneratorBasic(SignatureGenerator):
 
     def get_taskhash(self, fn, task, deps, dataCache):
         k = fn + "." + task
-        data = dataCache.basetaskhash[k]
+        h = self.newhash(dataCache.basetaskhash[k])
         self.runtaskdeps[k] = []
         self.file_checksum_values[k] = {}
         recipename = dataCache.pkg_fn[fn]
@@ -185,7 +303,7 @@ class SignatureGeneratorBasic(SignatureGenerator):
                 continue
             if dep not in self.taskhash:
                 bb.fatal("%s is not in taskhash, caller isn't calling in dependency order?", dep)
-            data = data + self.taskhash[dep]
+            h.update(self.taskhash[dep])
             self.runtaskdeps[k].append(dep)
 
         if task in dataCache.file_checksums[fn]:
@@ -193,24 +311,32 @@ class SignatureGeneratorBasic(SignatureGenerator):
             for (f,cs) in checksums:
                 self.file_checksum_values[k][f] = cs
                 if cs:
-                    data = data + cs
+                    h.update(cs)
 
         taskdep = dataCache.task_deps[fn]
         if 'nostamp' in taskdep and task in taskdep['nostamp']:
             # Nostamp tasks need an implicit taint so that they force any dependent tasks to run
             import uuid
-            data = data + str(uuid.uuid4())
+            h.update(str(uuid.uuid4()))
 
         taint = self.read_taint(fn, task, dataCache.stamp[fn])
         if taint:
-            data = data + taint
+            h.update(taint)
             logger.warn("%s is tainted from a forced run" % k)
 
-        h = hashlib.md5(data).hexdigest()
+        h = h.hexdigest()
         self.taskhash[k] = h
         #d.setVar("BB_TASKHASH_task-%s" % task, taskhash[task])
         return h
 
+    def get_taskstate(self, fn, task):
+        k = fn + "." + task
+        return (self.taskhash[k], self.runtaskdeps[k], self.file_checksum_values[k])
+
+    def set_taskstate(self, fn, task, state):
+        k = fn + "." + task
+        self.taskhash[k], self.runtaskdeps[k], self.file_checksum_values[k] = state
+
     def dump_sigtask(self, fn, task, stampbase, runtime):
         k = fn + "." + task
         if runtime == "customfile":
@@ -225,6 +351,7 @@ class SignatureGeneratorBasic(SignatureGenerator):
         data = {}
         data['basewhitelist'] = self.basewhitelist
         data['taskwhitelist'] = self.taskwhitelist
+        data['hashalgorithm'] = self.hashalgorithm
         data['taskdeps'] = self.taskdeps[fn][task]
         data['basehash'] = self.basehash[k]
         data['gendeps'] = {}
@@ -383,6 +510,11 @@ def compare_sigfiles(a, b, recursecb = None):
         if a_data['taskwhitelist'] and b_data['taskwhitelist']:
             output.append("changed items: %s" % a_data['taskwhitelist'].symmetric_difference(b_data['taskwhitelist']))
 
+    a_algorithm = a_data.get('hashalgorithm', 'md5')
+    b_algorithm = b_data.get('hashalgorithm', 'md5')
+    if a_algorithm != b_algorithm:
+        output.append("Hash algorithm changed from %s to %s" % (a_algorithm, b_algorithm))
+
     if a_data['taskdeps'] != b_data['taskdeps']:
         output.append("Task dependencies changed from:\n%s\nto:\n%s" % (sorted(a_data['taskdeps']), sorted(b_data['taskdeps'])))
 
@@ -510,17 +642,16 @@ def dump_sigfile(a):
     if 'taint' in a_data:
         output.append("Tainted (by forced/invalidated task): %s" % a_data['taint'])
 
-    data = a_data['basehash']
+    h = hashlib.new(a_data.get('hashalgorithm', 'md5'), a_data['basehash'])
     for dep in a_data['runtaskdeps']:
-        data = data + a_data['runtaskhashes'][dep]
+        h.update(a_data['runtaskhashes'][dep])
 
     for c in a_data['file_checksum_values']:
-        data = data + c[1]
+        h.update(c[1])
 
     if 'taint' in a_data:
-        data = data + a_data['taint']
+        h.update(a_data['taint'])
 
-    h = hashlib.md5(data).hexdigest()
-    output.append("Computed Hash is %s" % h)
+    output.append("Computed Hash is %s" % h.hexdigest())
 
     return output
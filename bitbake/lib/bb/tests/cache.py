@@ -0,0 +1,229 @@
+# ex:ts=4:sw=4:sts=4:et
+# -*- tab-width: 4; c-basic-offset: 4; indent-tabs-mode: nil -*-
+#
+# BitBake Tests for cache.py
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 2 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+
+import unittest
+import tempfile
+import shutil
+import os
+import bb
+import bb.cache
+import bb.parse
+from bb.cache import pickle
+
+def dumps(obj):
+    return pickle.dumps(obj, pickle.HIGHEST_PROTOCOL)
+
+class IndexedCacheFileTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tempdir, "bb_cache.dat.abc")
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def reload(self):
+        cachefile = bb.cache.IndexedCacheFile(self.path)
+        self.assertEqual(cachefile.load(), (bb.cache.__cache_version__, bb.__version__))
+        return cachefile
+
+    def test_missing(self):
+        cachefile = bb.cache.IndexedCacheFile(self.path)
+        self.assertRaises(ValueError, cachefile.load)
+
+    def test_invalid(self):
+        with open(self.path, "wb") as f:
+            pickle.dump(bb.cache.__cache_version__, f)
+            pickle.dump(bb.__version__, f)
+        cachefile = bb.cache.IndexedCacheFile(self.path)
+        self.assertRaises(ValueError, cachefile.load)
+
+    def test_roundtrip(self):
+        bb.cache.IndexedCacheFile(self.path).update({"a.bb" : dumps(["a"]), "b.bb" : dumps(["b"])}, set())
+        cachefile = self.reload()
+        self.assertEqual(sorted(cachefile), ["a.bb", "b.bb"])
+        self.assertEqual(cachefile.get("a.bb"), ["a"])
+        self.assertEqual(cachefile.get("b.bb"), ["b"])
+
+    def test_append(self):
+        bb.cache.IndexedCacheFile(self.path).update(dict(("%d.bb" % i, dumps(str(i) * 100)) for i in range(10)), set())
+        size = os.path.getsize(self.path)
+        inode = os.stat(self.path).st_ino
+
+        cachefile = self.reload()
+        cachefile.update({"3.bb" : dumps("three"), "new.bb" : dumps("new")}, set(["5.bb"]))
+        self.assertTrue(os.path.getsize(self.path) > size)
+        self.assertEqual(os.stat(self.path).st_ino, inode)
+
+        cachefile = self.reload()
+        self.assertEqual(len(cachefile), 10)
+        self.assertFalse("5.bb" in cachefile)
+        self.assertEqual(cachefile.get("3.bb"), "three")
+        self.assertEqual(cachefile.get("4.bb"), "4" * 100)
+        self.assertEqual(cachefile.get("new.bb"), "new")
+
+    def test_compact(self):
+        bb.cache.IndexedCacheFile(self.path).update({"a.bb" : dumps("a" * 1000), "b.bb" : dumps("b")}, set())
+        for i in range(10):
+            self.reload().update({"a.bb" : dumps(str(i) * 1000)}, set())
+        self.assertTrue(os.path.getsize(self.path) < 3000)
+        cachefile = self.reload()
+        self.assertEqual(cachefile.get("a.bb"), "9" * 1000)
+        self.assertEqual(cachefile.get("b.bb"), "b")
+
+    def test_changed_underneath(self):
+        bb.cache.IndexedCacheFile(self.path).update({"a.bb" : dumps("a")}, set())
+        first = self.reload()
+        self.reload().update({"b.bb" : dumps("b")}, set())
+        first.update({"c.bb" : dumps("c")}, set())
+        cachefile = self.reload()
+        self.assertEqual(sorted(cachefile), ["a.bb", "c.bb"])
+
+class RecipeInfoMapTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        paths = [os.path.join(self.tempdir, name) for name in ("core", "extra")]
+        bb.cache.IndexedCacheFile(paths[0]).update({"a.bb" : dumps("core-a"), "b.bb" : dumps("core-b")}, set())
+        bb.cache.IndexedCacheFile(paths[1]).update({"a.bb" : dumps("extra-a")}, set())
+        self.infomap = bb.cache.RecipeInfoMap()
+        for path in paths:
+            cachefile = bb.cache.IndexedCacheFile(path)
+            cachefile.load()
+            self.infomap.add_file(cachefile)
+
+    def tearDown(self):
+        self.infomap.close()
+        shutil.rmtree(self.tempdir)
+
+    def test_lazy(self):
+        self.assertTrue("a.bb" in self.infomap)
+        self.assertFalse("c.bb" in self.infomap)
+        self.assertEqual(self.infomap.loaded, {})
+        self.assertEqual(self.infomap.get_core("a.bb"), "core-a")
+        self.assertEqual(self.infomap.loaded, {})
+        self.assertEqual(self.infomap["a.bb"], ["core-a", "extra-a"])
+        self.assertEqual(self.infomap["b.bb"], ["core-b"])
+        self.assertRaises(KeyError, self.infomap.get_core, "c.bb")
+
+    def test_changes(self):
+        self.infomap["c.bb"] = ["core-c"]
+        del self.infomap["b.bb"]
+        self.assertEqual(sorted(self.infomap), ["a.bb", "c.bb"])
+        self.assertEqual(len(self.infomap), 2)
+        self.assertEqual(self.infomap.changed, set(["c.bb"]))
+        self.assertEqual(self.infomap.removed, set(["b.bb"]))
+        self.assertFalse("b.bb" in self.infomap)
+
+class FakeRecipeInfo(object):
+    def __init__(self, timestamp):
+        self.timestamp = timestamp
+        self.file_depends = []
+        self.appends = []
+        self.variants = [""]
+
+class CacheValidTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        d = bb.data.init()
+        d.setVar("CACHE", os.path.join(self.tempdir, "cache"))
+        self.cache = bb.cache.Cache(d, "abc", [bb.cache.CoreRecipeInfo])
+        self.files = []
+        for i in range(200):
+            fn = os.path.join(self.tempdir, "recipe%d.bb" % i)
+            open(fn, "w").close()
+            mtime = bb.parse.cached_mtime_noerror(fn)
+            # Every third recipe has changed since it was cached
+            if i % 3 == 0:
+                mtime = mtime - 10
+            self.cache.depends_cache[fn] = [FakeRecipeInfo(mtime)]
+            self.files.append((fn, []))
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def check(self, num_processes):
+        self.cache.cacheValidUpdateMany(self.files, num_processes)
+        for i, (fn, appends) in enumerate(self.files):
+            self.assertTrue(fn in self.cache.checked)
+            self.assertEqual(self.cache.cacheValid(fn, appends), i % 3 != 0)
+            self.assertEqual(fn in self.cache.depends_cache, i % 3 != 0)
+
+    def test_serial(self):
+        self.check(1)
+
+    def test_parallel(self):
+        self.check(4)
+
+class ExtraRecipeInfo(bb.cache.RecipeInfoCommon):
+    cachefile = "bb_extracache.dat"
+
+    @classmethod
+    def init_cacheData(cls, cachedata):
+        pass
+
+class CacheLoadTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.d = bb.data.init()
+        self.d.setVar("CACHE", self.tempdir)
+        self.caches = [bb.cache.CoreRecipeInfo, ExtraRecipeInfo]
+        self.opened = []
+        self.events = []
+        opened = self.opened
+        base = self.origcachefile = bb.cache.IndexedCacheFile
+        class RecordingCacheFile(base):
+            def load(self):
+                opened.append(self)
+                return base.load(self)
+        self.origfire = bb.event.fire
+        bb.cache.IndexedCacheFile = RecordingCacheFile
+        bb.event.fire = lambda event, d: self.events.append(event)
+
+    def tearDown(self):
+        bb.cache.IndexedCacheFile = self.origcachefile
+        bb.event.fire = self.origfire
+        shutil.rmtree(self.tempdir)
+
+    def write(self, cachefile):
+        path = bb.cache.getCacheFile(self.tempdir, cachefile, "abc")
+        self.origcachefile(path).update({"a.bb" : dumps(["a"]), "b.bb" : dumps(["b"])}, set())
+
+    def test_progress(self):
+        self.write("bb_cache.dat")
+        self.write("bb_extracache.dat")
+        cache = bb.cache.Cache(self.d, "abc", self.caches)
+        self.assertEqual(len(cache.depends_cache.files), 2)
+        progress = [e for e in self.events if isinstance(e, bb.event.CacheLoadProgress)]
+        self.assertEqual(len(progress), 2)
+        self.assertEqual(progress[-1].current, progress[-1].total)
+        self.assertIsInstance(self.events[-1], bb.event.CacheLoadCompleted)
+
+    def test_invalid(self):
+        self.write("bb_cache.dat")
+        with open(bb.cache.getCacheFile(self.tempdir, "bb_extracache.dat", "abc"), "w") as f:
+            f.write("not a cache file")
+        cache = bb.cache.Cache(self.d, "abc", self.caches)
+        self.assertEqual(cache.depends_cache.files, [])
+        self.assertEqual(self.events, [])
+        # The file loaded before the invalid one isn't left mapped
+        self.assertEqual(len(self.opened), 2)
+        self.assertIsNone(self.opened[0].map)
@@ -0,0 +1,120 @@
+# ex:ts=4:sw=4:sts=4:et
+# -*- tab-width: 4; c-basic-offset: 4; indent-tabs-mode: nil -*-
+#
+# BitBake Tests for checksum.py
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 2 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+
+import unittest
+import tempfile
+import shutil
+import os
+import bb
+import bb.checksum
+
+class FileChecksumCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.srcdir = os.path.join(self.tempdir, "src")
+        self.d = bb.data.init()
+        self.d.setVar("PERSISTENT_DIR", os.path.join(self.tempdir, "persist"))
+        for i in range(40):
+            self.write("sub%d/file%d" % (i % 4, i), "contents %d" % i)
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def write(self, name, data):
+        path = os.path.join(self.srcdir, name)
+        bb.utils.mkdirhier(os.path.dirname(path))
+        with open(path, "w") as f:
+            f.write(data)
+        return path
+
+    def new_cache(self):
+        cache = bb.checksum.FileChecksumCache()
+        cache.init_cache(self.d)
+        return cache
+
+    def expected(self):
+        result = []
+        for root, dirs, files in os.walk(self.srcdir):
+            for name in files:
+                path = os.path.join(root, name)
+                if os.path.exists(path):
+                    result.append((path, bb.utils.md5_file(path)))
+        return sorted(result)
+
+    def test_file(self):
+        cache = self.new_cache()
+        path = self.write("single", "one")
+        self.assertEqual(cache.get_checksum(path), bb.utils.md5_file(path))
+        # Same mtime, different size
+        st = os.stat(path)
+        self.write("single", "three")
+        os.utime(path, (st.st_atime, st.st_mtime))
+        self.assertEqual(cache.get_checksum(path), bb.utils.md5_file(path))
+
+    def test_dir(self):
+        cache = self.new_cache()
+        self.assertEqual(sorted(cache.get_dir_checksums(self.srcdir)), self.expected())
+
+    def test_serial(self):
+        cache = self.new_cache()
+        cache.parallel_threshold = 1000
+        self.assertEqual(sorted(cache.get_dir_checksums(self.srcdir)), self.expected())
+
+    def test_persist(self):
+        cache = self.new_cache()
+        cache.get_dir_checksums(self.srcdir)
+        cache.save_extras(self.d)
+        cache.save_merge(self.d)
+
+        # An unchanged tree isn't listed again
+        cache = self.new_cache()
+        def walk_dir(pth):
+            self.fail("unchanged tree walked")
+        cache.walk_dir = walk_dir
+        self.assertEqual(sorted(cache.get_dir_checksums(self.srcdir)), self.expected())
+        self.assertEqual(cache.cachedata_extras, [{}, {}])
+
+        # A changed file is hashed again without listing the tree
+        path = os.path.join(self.srcdir, "sub1", "file5")
+        st = os.stat(path)
+        self.write("sub1/file5", "changed")
+        os.utime(path, (st.st_atime, st.st_mtime + 1))
+        cache = self.new_cache()
+        cache.walk_dir = walk_dir
+        self.assertEqual(sorted(cache.get_dir_checksums(self.srcdir)), self.expected())
+        self.assertEqual(list(cache.cachedata_extras[0]), [path])
+
+    def test_added_file(self):
+        cache = self.new_cache()
+        cache.get_dir_checksums(self.srcdir)
+        cache.save_extras(self.d)
+        cache.save_merge(self.d)
+
+        self.write("sub2/new", "new")
+        cache = self.new_cache()
+        self.assertEqual(sorted(cache.get_dir_checksums(self.srcdir)), self.expected())
+
+    def test_dangling_symlink(self):
+        os.symlink("nonexistent", os.path.join(self.srcdir, "sub0", "broken"))
+        errors = []
+        cache = self.new_cache()
+        checksums = cache.get_dir_checksums(self.srcdir, lambda f, e: errors.append(f))
+        self.assertEqual(sorted(checksums), self.expected())
+        self.assertEqual(errors, [os.path.join(self.srcdir, "sub0", "broken")])
@@ -373,3 +373,66 @@ esac
     #    self.assertEquals(deps, set(["oe_libinstall"]))
 
 
+
+class ExpressionCacheTest(ReferenceTest):
+
+    def setUp(self):
+        ReferenceTest.setUp(self)
+        self.cache = bb.codeparser.ExpressionCache(maxsize=2)
+
+    def test_lookup(self):
+        code = "bb.utils.contains('DISTRO_FEATURES', 'x11', 'a', 'b', d) + d.getVar('FOO', True)"
+        codeobj, parsed, parser = self.cache.get(code, "BAR", logger)
+        self.assertIsNotNone(parser)
+        self.assertEqual(parsed.refs, set(["FOO"]))
+        self.assertEqual(parsed.contains, {"DISTRO_FEATURES" : set(["x11"])})
+        self.assertEqual(codeobj.co_filename, "BAR")
+
+        cached = self.cache.get(code, "BAR", logger)
+        self.assertIs(cached[0], codeobj)
+        self.assertIs(cached[1], parsed)
+        self.assertIsNone(cached[2])
+
+    def test_persisted(self):
+        import imp
+        import marshal
+        cache = bb.codeparser.codeparsercache
+        key = (imp.get_magic(), "BAR", "1 + 1")
+        h = hash(key)
+        cache.exprcacheextras.pop(h, None)
+        try:
+            # An entry stored under the same hash for other code isn't used
+            cache.exprcache[h] = ((imp.get_magic(), "BAR", "2 + 2"), marshal.dumps(compile("2 + 2", "BAR", "eval")), 0)
+            self.assertEqual(eval(self.cache.compile("1 + 1", "BAR")), 2)
+            self.assertEqual(cache.exprcacheextras[h][0], key)
+
+            # A matching one is, and its use is recorded
+            cache.exprcache[h] = cache.exprcacheextras.pop(h)
+            self.assertEqual(eval(self.cache.compile("1 + 1", "BAR")), 2)
+            self.assertTrue(cache.exprcacheextras[h][2] >= cache.exprcache[h][2])
+        finally:
+            cache.exprcache.pop(h, None)
+            cache.exprcacheextras.pop(h, None)
+
+    def test_prune(self):
+        cache = bb.codeparser.CodeParserCache()
+        cache.expr_maxsize = 2
+        data = [{}, {}, {1 : ("a", "", 1.0), 2 : ("b", "", 2.0)}]
+        cache.merge_data([{}, {}, {1 : ("a", "", 4.0), 3 : ("c", "", 3.0)}], data)
+        # The least recently used entry is dropped
+        self.assertEqual(data[2], {1 : ("a", "", 4.0), 3 : ("c", "", 3.0)})
+
+    def test_lru(self):
+        self.cache.get("1", None, logger)
+        self.cache.get("2", None, logger)
+        self.cache.get("1", None, logger)
+        self.cache.get("3", None, logger)
+        self.assertEqual(list(self.cache.entries), [(None, "1"), (None, "3")])
+
+    def test_expand(self):
+        self.d.setVar("FOO", "foo")
+        self.d.setVar("BAR", "${@d.getVar('FOO', True) + 'bar'}")
+        for i in range(2):
+            parsedvar = self.d.expandWithRefs(self.d.getVar("BAR", False), "BAR")
+            self.assertEqual(parsedvar.value, "foobar")
+            self.assertEqual(parsedvar.references, set(["FOO"]))
@@ -355,6 +355,49 @@ class TestFlags(unittest.TestCase):
         self.assertEqual(self.d.getVarFlag("foo", "flag1"), "value of flag1")
         self.assertEqual(self.d.getVarFlag("foo", "flag2"), None)
 
+class TestCopies(unittest.TestCase):
+    def setUp(self):
+        self.d = bb.data.init()
+        self.d.setVar("foo", "value of foo")
+        self.d.setVar("bar", "value of bar")
+        self.copies = [self.d]
+        for i in range(4):
+            self.copies.append(bb.data.createCopy(self.copies[-1]))
+        self.newd = self.copies[-1]
+
+    def test_lookup(self):
+        self.copies[2].setVar("foo", "value of foo 2")
+        self.assertEqual(self.newd.getVar("foo"), "value of foo 2")
+        self.assertEqual(self.copies[1].getVar("foo"), "value of foo")
+        self.assertEqual(self.newd.getVar("baz"), None)
+
+    def test_parent_changed(self):
+        self.assertEqual(self.newd.getVar("foo"), "value of foo")
+        self.assertEqual(self.newd.getVar("baz"), None)
+        self.copies[3].setVar("foo", "value of foo 3")
+        self.copies[2].setVar("baz", "value of baz")
+        self.assertEqual(self.newd.getVar("foo"), "value of foo 3")
+        self.assertEqual(self.newd.getVar("baz"), "value of baz")
+        self.copies[3].delVarFlag("foo", "_content")
+        self.assertEqual(self.newd.getVar("foo"), None)
+        self.copies[3].delVarFlags("foo")
+        self.assertEqual(self.newd.getVar("foo"), "value of foo")
+
+    def test_flags(self):
+        self.newd.getVar("foo")
+        self.copies[1].setVarFlag("foo", "flag", "value of flag")
+        self.assertEqual(self.newd.getVarFlag("foo", "flag"), "value of flag")
+        self.assertEqual(self.d.getVarFlag("foo", "flag"), None)
+
+    def test_keys(self):
+        self.assertEqual(sorted(self.newd.keys()), ["bar", "foo"])
+        self.copies[2].setVar("baz", "value of baz")
+        self.copies[3].delVar("bar")
+        self.assertEqual(sorted(self.newd.keys()), ["baz", "foo"])
+        self.assertEqual(sorted(self.copies[2].keys()), ["bar", "baz", "foo"])
+        self.newd.setVar("bar", "value of bar 4")
+        self.assertEqual(sorted(self.newd.keys()), ["bar", "baz", "foo"])
+
 
 class Contains(unittest.TestCase):
     def setUp(self):
@@ -0,0 +1,118 @@
+# ex:ts=4:sw=4:sts=4:et
+# -*- tab-width: 4; c-basic-offset: 4; indent-tabs-mode: nil -*-
+#
+# BitBake Tests for event.py
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 2 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+
+import unittest
+import logging
+import multiprocessing
+import os
+import pickle
+import time
+import bb
+import bb.event
+import bb.server.process
+
+class UIEventFilterTest(unittest.TestCase):
+
+    def test_no_ratelimit(self):
+        f = bb.event.UIEventFilter(logging.INFO, {})
+        for i in range(10):
+            progress = bb.event.ParseProgress(i, 10)
+            self.assertEqual(f.coalesce(progress), [progress])
+
+    def test_coalesce_progress(self):
+        f = bb.event.UIEventFilter(logging.INFO, {})
+        f.update(None, logging.INFO, {}, 60)
+        first = bb.event.ParseProgress(1, 10)
+        self.assertEqual(f.coalesce(first), [first])
+        for i in range(2, 10):
+            self.assertEqual(f.coalesce(bb.event.ParseProgress(i, 10)), [])
+        # Other classes of progress events are limited separately
+        cacheprogress = bb.event.CacheLoadProgress(1, 10)
+        self.assertEqual(f.coalesce(cacheprogress), [cacheprogress])
+        # Log records don't release the held events
+        record = logging.LogRecord("BitBake", logging.INFO, __file__, 1, "msg", None, None)
+        self.assertEqual(f.coalesce(record), [record])
+        # Only the latest held event is sent, ahead of the next event
+        completed = bb.event.ParseCompleted(0, 10, 0, 0, 0, 0, 10)
+        events = f.coalesce(completed)
+        self.assertEqual(len(events), 2)
+        self.assertEqual(events[0].current, 9)
+        self.assertIs(events[1], completed)
+        self.assertEqual(f.nextdue(), None)
+
+    def test_release_due(self):
+        f = bb.event.UIEventFilter(logging.INFO, {})
+        f.update(None, logging.INFO, {}, 0.5)
+        f.coalesce(bb.event.ParseProgress(1, 10))
+        f.coalesce(bb.event.ParseProgress(2, 10))
+        due = f.nextdue()
+        self.assertTrue(due > time.time())
+        self.assertEqual(f.release(due - 0.1), [])
+        events = f.release(due)
+        self.assertEqual([e.current for e in events], [2])
+        self.assertEqual(f.nextdue(), None)
+
+    def test_forked(self):
+        f = bb.event.UIEventFilter(logging.INFO, {})
+        f.update(None, logging.INFO, {}, 60)
+        f.coalesce(bb.event.ParseProgress(1, 10))
+        f.coalesce(bb.event.ParseProgress(2, 10))
+        # A forked process can't send held events later, nor should it send
+        # the ones its parent holds
+        f.pid = -1
+        progress = bb.event.ParseProgress(3, 10)
+        self.assertEqual(f.coalesce(progress), [progress])
+        completed = bb.event.ParseCompleted(0, 10, 0, 0, 0, 0, 10)
+        self.assertEqual(f.coalesce(completed), [completed])
+
+class EventAdapterTest(unittest.TestCase):
+
+    def test_unpicklable(self):
+        queue = multiprocessing.Queue()
+        adapter = bb.server.process.EventAdapter(queue)
+        adapter.pid = os.getpid()
+        adapter.send(lambda: None)
+        adapter.flush()
+        # Nothing is put on the queue for a batch with no picklable event
+        adapter.send(bb.event.ParseProgress(1, 10))
+        adapter.flush()
+        events = pickle.loads(queue.get(True, 5))
+        self.assertEqual([e.current for e in events], [1])
+
+    def test_forked(self):
+        queue = multiprocessing.Queue()
+        adapter = bb.server.process.EventAdapter(queue)
+        adapter.pid = os.getpid()
+        adapter.send(bb.event.ParseProgress(1, 10))
+
+        def child():
+            adapter.send(bb.event.ParseProgress(2, 10))
+
+        # The child neither waits for the lock held at fork time nor sends
+        # the events its parent batched
+        with adapter.cond:
+            p = multiprocessing.Process(target=child)
+            p.start()
+        p.join(10)
+        self.assertEqual(p.exitcode, 0)
+        events = pickle.loads(queue.get(True, 5))
+        self.assertEqual([e.current for e in events], [2])
+        adapter.flush()
+        events = pickle.loads(queue.get(True, 5))
+        self.assertEqual([e.current for e in events], [1])
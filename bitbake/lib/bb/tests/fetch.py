@@ -23,6 +23,11 @@ import unittest
 import tempfile
 import subprocess
 import os
+import time
+import hashlib
+import threading
+import SocketServer
+import SimpleHTTPServer
 from bb.fetch2 import URI
 from bb.fetch2 import FetchMethod
 import bb
@@ -467,6 +472,159 @@ class FetcherLocalTest(FetcherTest):
         tree = self.fetchUnpack(['file://dir/subdir/e;subdir=bar'])
         self.assertEqual(tree, ['bar/dir/subdir/e'])
 
+class LocalHTTPRequestHandler(SimpleHTTPServer.SimpleHTTPRequestHandler):
+    """
+    Serve files from the server's rootdir rather than the current directory,
+    which the fetcher changes to DL_DIR, and record how many requests were
+    being handled at the same time.
+    """
+    def translate_path(self, path):
+        return os.path.join(self.server.rootdir, path.lstrip("/"))
+
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.requests += 1
+            server.active += 1
+            server.maxactive = max(server.maxactive, server.active)
+        try:
+            time.sleep(server.delay)
+            SimpleHTTPServer.SimpleHTTPRequestHandler.do_GET(self)
+        finally:
+            with server.lock:
+                server.active -= 1
+
+    def log_message(self, format, *args):
+        pass
+
+class LocalHTTPServer(SocketServer.ThreadingMixIn, SocketServer.TCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, rootdir, delay):
+        SocketServer.TCPServer.__init__(self, ("127.0.0.1", 0), LocalHTTPRequestHandler)
+        self.rootdir = rootdir
+        self.delay = delay
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.active = 0
+        self.maxactive = 0
+
+class FetcherParallelTest(FetcherTest):
+    def setUp(self):
+        super(FetcherParallelTest, self).setUp()
+        self.srcdir = os.path.join(self.tempdir, "srcdir")
+        os.makedirs(self.srcdir)
+        self.files = {}
+        for i in range(6):
+            name = "file%d.txt" % i
+            data = name * (i + 1) * 1000
+            with open(os.path.join(self.srcdir, name), "w") as f:
+                f.write(data)
+            self.files[name] = data
+        self.d.setVar("FILESPATH", self.srcdir)
+        self.d.setVar("BB_NUMBER_FETCH_THREADS", "4")
+
+        self.server = LocalHTTPServer(self.srcdir, 0.2)
+        self.serverthread = threading.Thread(target=self.server.serve_forever)
+        self.serverthread.start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.serverthread.join()
+        self.server.server_close()
+        super(FetcherParallelTest, self).tearDown()
+
+    def httpurl(self, name):
+        url = "http://127.0.0.1:%d/%s" % (self.server.server_address[1], name)
+        data = self.files.get(name)
+        if data is not None:
+            url += ";md5sum=%s;sha256sum=%s" % (hashlib.md5(data).hexdigest(), hashlib.sha256(data).hexdigest())
+        return url
+
+    def test_local_parallel(self):
+        fetcher = bb.fetch.Fetch(["file://%s" % name for name in sorted(self.files)], self.d)
+        fetcher.download()
+        fetcher.unpack(self.unpackdir)
+        self.assertEqual(sorted(os.listdir(self.unpackdir)), sorted(self.files))
+
+    def test_http_parallel(self):
+        fetcher = bb.fetch.Fetch([self.httpurl(name) for name in sorted(self.files)], self.d)
+        fetcher.download()
+        for name, data in self.files.items():
+            with open(os.path.join(self.dldir, name)) as f:
+                self.assertEqual(f.read(), data)
+            self.assertTrue(os.path.exists(os.path.join(self.dldir, name + ".done")))
+        self.assertEqual(self.server.requests, len(self.files))
+        self.assertTrue(self.server.maxactive > 1)
+        self.assertTrue(self.server.maxactive <= 4)
+
+        # The donestamps mean nothing is fetched again
+        self.d.setVar("BB_NO_NETWORK", "1")
+        fetcher = bb.fetch.Fetch([self.httpurl(name) for name in sorted(self.files)], self.d)
+        fetcher.download()
+        self.assertEqual(self.server.requests, len(self.files))
+
+    def test_http_serial(self):
+        self.d.setVar("BB_NUMBER_FETCH_THREADS", "1")
+        fetcher = bb.fetch.Fetch([self.httpurl(name) for name in sorted(self.files)[:3]], self.d)
+        fetcher.download()
+        self.assertEqual(self.server.requests, 3)
+        self.assertEqual(self.server.maxactive, 1)
+
+    def test_http_failure(self):
+        urls = [self.httpurl(name) for name in sorted(self.files)]
+        urls.insert(1, self.httpurl("missing.txt"))
+        fetcher = bb.fetch.Fetch(urls, self.d)
+        with self.assertRaises(bb.fetch2.FetchError) as cm:
+            fetcher.download()
+        self.assertEqual(cm.exception.url, urls[1])
+        self.assertFalse(os.path.exists(os.path.join(self.dldir, "missing.txt.done")))
+
+    def test_git_parallel(self):
+        # Git changes the working directory while it fetches, so git urls
+        # are fetched one at a time next to the parallel http downloads
+        urls = [self.httpurl(name) for name in sorted(self.files)]
+        for name in ("one", "two"):
+            repo = os.path.join(self.tempdir, "repo-" + name)
+            os.makedirs(repo)
+            with open(os.path.join(repo, name), "w") as f:
+                f.write(name)
+            try:
+                bb.process.run("git init; git add %s; git -c user.name=Test -c user.email=test@example.com commit -m %s" % (name, name),
+                               shell=True, cwd=repo)
+            except (OSError, bb.process.CmdError):
+                self.skipTest("Cannot create git repositories")
+            rev = bb.process.run("git rev-parse HEAD", shell=True, cwd=repo)[0].strip()
+            urls.append("git://%s;protocol=file;rev=%s;destsuffix=%s" % (repo, rev, name))
+        fetcher = bb.fetch.Fetch(urls, self.d)
+        fetcher.download()
+        fetcher.unpack(self.unpackdir)
+        self.assertEqual(sorted(os.listdir(os.path.join(self.unpackdir, "one"))), [".git", "one"])
+        self.assertEqual(sorted(os.listdir(os.path.join(self.unpackdir, "two"))), [".git", "two"])
+        self.assertEqual(self.server.requests, len(self.files))
+        self.assertTrue(self.server.maxactive > 1)
+
+    def test_serial_mirror(self):
+        # A mirror whose fetcher can't run in a thread is tried again once
+        # the parallel downloads are done
+        mirrordir = os.path.join(self.tempdir, "mirror")
+        os.makedirs(mirrordir)
+        with open(os.path.join(mirrordir, "missing.txt"), "w") as f:
+            f.write("mirrored")
+        self.d.setVar("MIRRORS", "http://.*/.* file://%s/" % mirrordir)
+        urls = [self.httpurl(name) for name in sorted(self.files)]
+        urls.insert(1, self.httpurl("missing.txt"))
+        local = bb.fetch2.local.Local
+        local.supports_parallel_download = lambda self, urldata: False
+        try:
+            fetcher = bb.fetch.Fetch(urls, self.d)
+            fetcher.download()
+        finally:
+            del local.supports_parallel_download
+        with open(os.path.join(self.dldir, "missing.txt")) as f:
+            self.assertEqual(f.read(), "mirrored")
+
 class FetcherNetworkTest(FetcherTest):
 
     if os.environ.get("BB_SKIP_NETTESTS") == "yes":
@@ -67,3 +67,154 @@ C = "3"
         f = self.parsehelper(testfileB)
         with self.assertRaises(bb.parse.ParseError):
             d = bb.parse.handle(f.name, self.d)['']
+
+class StatementCacheTest(ParseTest):
+
+    def setUp(self):
+        ParseTest.setUp(self)
+        self.tempdir = tempfile.mkdtemp()
+        self.d.setVar("PERSISTENT_DIR", self.tempdir)
+        self.origcache = bb.parse.statementcache
+
+    def tearDown(self):
+        bb.parse.statementcache = self.origcache
+        bb.utils.remove(self.tempdir, True)
+
+    def new_cache(self):
+        bb.parse.statementcache = bb.parse.StatementCache()
+        bb.parse.statementcache.init_cache(self.d)
+        return bb.parse.statementcache
+
+    def test_persist(self):
+        f = self.parsehelper(self.testfile)
+        self.new_cache()
+        bb.parse.handle(f.name, self.d.createCopy())
+        bb.parse.statement_cache_save(self.d)
+
+        cache = self.new_cache()
+        self.assertIsNotNone(cache.lookup(f.name, self.testfile))
+        d = bb.parse.handle(f.name, self.d.createCopy())['']
+        self.assertEqual(d.getVar("C", True), "3")
+        self.assertEqual(d.getVar("do_install", True), '\techo "hello"\n')
+        self.assertEqual(cache.extras, {})
+
+    def test_changed(self):
+        f = self.parsehelper(self.testfile)
+        self.new_cache()
+        bb.parse.handle(f.name, self.d.createCopy())
+        bb.parse.statement_cache_save(self.d)
+
+        f.seek(0)
+        f.write(self.testfile.replace('"3"', '"4"'))
+        f.flush()
+        cache = self.new_cache()
+        d = bb.parse.handle(f.name, self.d.createCopy())['']
+        self.assertEqual(d.getVar("C", True), "4")
+        self.assertEqual(list(cache.extras), [f.name])
+
+    def test_key(self):
+        f = self.parsehelper(self.testfile)
+        cache = self.new_cache()
+        name = os.path.relpath(f.name)
+        cache.add(name, self.testfile, "statements")
+        self.assertEqual(list(cache.extras), [f.name])
+        self.assertEqual(cache.lookup(f.name, self.testfile, name), "statements")
+        # The statements refer to the name the file was parsed as
+        self.assertIsNone(cache.lookup(f.name, self.testfile))
+
+    def test_kept(self):
+        f = self.parsehelper(self.testfile)
+        cache = self.new_cache()
+        cache.keep(f.name, cache.filekey(f.name), "statements")
+        self.assertEqual(cache.lookup_kept(f.name), "statements")
+        self.assertEqual(cache.extras, {})
+
+        f.write("B = \"2\"\n")
+        f.flush()
+        self.assertIsNone(cache.lookup_kept(f.name))
+
+    def test_removed(self):
+        f = self.parsehelper(self.testfile)
+        g = self.parsehelper(self.testfile.replace('"3"', '"4"'))
+        self.new_cache()
+        bb.parse.handle(f.name, self.d.createCopy())
+        bb.parse.handle(g.name, self.d.createCopy())
+        bb.parse.statement_cache_save(self.d)
+
+        # Files which are gone are dropped when the cache is next saved
+        g.close()
+        cache = self.new_cache()
+        cache.add(f.name, "changed", "statements")
+        cache.save()
+        self.assertEqual(list(self.new_cache().cachefile), [f.name])
+
+class BaseHashCacheTest(ParseTest):
+
+    recipe = """
+A = "1"
+do_install() {
+	echo ${A}
+}
+addtask install
+"""
+
+    def setUp(self):
+        ParseTest.setUp(self)
+        self.tempdir = tempfile.mkdtemp()
+        self.d.setVar("PERSISTENT_DIR", self.tempdir)
+        self.d.setVar("BB_SIGNATURE_HANDLER", "basic")
+        self.d.setVar("__BB_CONFIG_HASH", "config")
+        self.d.setVar("__exportlist", [])
+        self.origsiggen = bb.parse.siggen
+
+    def tearDown(self):
+        bb.parse.siggen = self.origsiggen
+        bb.utils.remove(self.tempdir, True)
+
+    def new_siggen(self):
+        bb.parse.siggen = bb.siggen.init(self.d)
+        bb.parse.signature_cache_init(self.d)
+        return bb.parse.siggen
+
+    def parse(self, f):
+        bb.parse.update_mtime(f.name)
+        d = bb.parse.handle(f.name, self.d.createCopy())['']
+        return d.getVar("BB_BASEHASH_task-do_install", False)
+
+    def test_persist(self):
+        f = self.parsehelper(self.recipe)
+        self.new_siggen()
+        basehash = self.parse(f)
+        self.assertIn(f.name, bb.parse.siggen.taskdeps)
+        bb.parse.signature_cache_save(self.d)
+
+        siggen = self.new_siggen()
+        self.assertEqual(self.parse(f), basehash)
+        self.assertNotIn(f.name, siggen.taskdeps)
+
+    def test_changed(self):
+        f = self.parsehelper(self.recipe)
+        self.new_siggen()
+        basehash = self.parse(f)
+        bb.parse.signature_cache_save(self.d)
+
+        f.seek(0)
+        f.write(self.recipe.replace('"1"', '"2"'))
+        f.flush()
+        st = os.stat(f.name)
+        os.utime(f.name, (st.st_atime, st.st_mtime + 1))
+        siggen = self.new_siggen()
+        self.assertNotEqual(self.parse(f), basehash)
+        self.assertIn(f.name, siggen.taskdeps)
+
+    def test_config_changed(self):
+        f = self.parsehelper(self.recipe)
+        self.new_siggen()
+        basehash = self.parse(f)
+        bb.parse.signature_cache_save(self.d)
+
+        self.d.setVar("A_pn-none", "3")
+        self.d.setVar("__BB_CONFIG_HASH", "other")
+        siggen = self.new_siggen()
+        self.assertEqual(self.parse(f), basehash)
+        self.assertIn(f.name, siggen.taskdeps)
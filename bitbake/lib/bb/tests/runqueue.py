@@ -0,0 +1,289 @@
+# ex:ts=4:sw=4:sts=4:et
+# -*- tab-width: 4; c-basic-offset: 4; indent-tabs-mode: nil -*-
+#
+# BitBake Tests for runqueue.py
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 2 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+
+import unittest
+import tempfile
+import shutil
+import hashlib
+import os
+import bb
+import bb.parse
+import bb.siggen
+import bb.runqueue
+from bb.tests.siggen import DataCache
+
+class FakeTaskData(object):
+    def __init__(self, fns):
+        self.fn_index = fns
+
+class FakeDataCache(object):
+    def __init__(self, stampdir, fns):
+        self.stamp = {}
+        self.stamp_base = {}
+        self.stamp_extrainfo = {}
+        self.pkg_fn = {}
+        for fn in fns:
+            self.pkg_fn[fn] = os.path.basename(fn)[:-3]
+            self.stamp[fn] = os.path.join(stampdir, os.path.basename(fn))
+            self.stamp_base[fn] = {}
+            self.stamp_extrainfo[fn] = {}
+
+class FakeRunQueueData(object):
+    def __init__(self, stampdir, fns, tasks):
+        """
+        tasks is a list of (fnid, taskname, weight, depends) tuples
+        """
+        self.taskData = FakeTaskData(fns)
+        self.dataCache = FakeDataCache(stampdir, fns)
+        self.runq_fnid = [t[0] for t in tasks]
+        self.runq_task = [t[1] for t in tasks]
+        self.runq_weight = [t[2] for t in tasks]
+        self.runq_depends = [set(t[3]) for t in tasks]
+        self.runq_revdeps = [set() for t in tasks]
+        for task, deps in enumerate(self.runq_depends):
+            for dep in deps:
+                self.runq_revdeps[dep].add(task)
+
+class FakeStats(object):
+    active = 0
+
+class FakeRunQueueExecute(object):
+    def __init__(self, rqdata):
+        self.rqdata = rqdata
+        self.number_tasks = 1
+        self.stats = FakeStats()
+        self.build_stamps2 = set()
+        self.runq_running = [0] * len(rqdata.runq_fnid)
+        self.runq_complete = [0] * len(rqdata.runq_fnid)
+        self.runq_buildable = [int(not deps) for deps in rqdata.runq_depends]
+
+    def run(self, sched):
+        """
+        Execute every task one at a time and return the order chosen by sched
+        """
+        order = []
+        while True:
+            task = sched.next()
+            if task is None:
+                break
+            order.append(task)
+            self.runq_running[task] = 1
+            self.runq_complete[task] = 1
+            for revdep in self.rqdata.runq_revdeps[task]:
+                if self.runq_buildable[revdep]:
+                    continue
+                if all(self.runq_complete[dep] for dep in self.rqdata.runq_depends[revdep]):
+                    self.runq_buildable[revdep] = 1
+                    sched.newbuilable(revdep)
+        return order
+
+class RunQueueSchedulerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.stampdir = tempfile.mkdtemp()
+        bb.parse.siggen = bb.siggen.SignatureGenerator(None)
+        self.fns = ["/recipes/a.bb", "/recipes/b.bb"]
+        # fnid, taskname, weight, depends
+        self.tasks = [(0, "do_fetch", 10, []),
+                      (1, "do_fetch", 30, []),
+                      (0, "do_compile", 5, [0]),
+                      (1, "do_compile", 20, [1]),
+                      (0, "do_install", 1, [2]),
+                      (1, "do_install", 2, [3])]
+
+    def tearDown(self):
+        shutil.rmtree(self.stampdir)
+
+    def runsched(self, schedclass):
+        rqdata = FakeRunQueueData(self.stampdir, self.fns, self.tasks)
+        rqexec = FakeRunQueueExecute(rqdata)
+        return rqexec.run(schedclass(rqexec, rqdata))
+
+    def test_basic(self):
+        self.assertEqual(self.runsched(bb.runqueue.RunQueueScheduler), [0, 1, 2, 3, 4, 5])
+
+    def test_speed(self):
+        self.assertEqual(self.runsched(bb.runqueue.RunQueueSchedulerSpeed), [1, 3, 0, 2, 5, 4])
+
+    def test_speed_equal_weights(self):
+        self.tasks = [(0, "do_fetch", 1, []),
+                      (1, "do_fetch", 1, []),
+                      (0, "do_compile", 1, [])]
+        self.assertEqual(self.runsched(bb.runqueue.RunQueueSchedulerSpeed), [2, 1, 0])
+
+    def test_completion(self):
+        self.assertEqual(self.runsched(bb.runqueue.RunQueueSchedulerCompletion), [1, 3, 5, 0, 2, 4])
+
+    def test_makespan(self):
+        class TestScheduler(bb.runqueue.RunQueueSchedulerMakespan):
+            def get_durations(self):
+                return durations
+
+        durations = {}
+        self.assertEqual(self.runsched(TestScheduler), [1, 3, 0, 2, 5, 4])
+        durations = {"a:do_compile" : 100.0, "b:do_compile" : 10.0, "b:do_install" : 1.0}
+        self.assertEqual(self.runsched(TestScheduler), [0, 2, 1, 3, 5, 4])
+        # b's do_compile is assumed to take as long as a's
+        durations = {"a:do_fetch" : 1.0, "a:do_compile" : 100.0, "b:do_fetch" : 50.0}
+        self.assertEqual(self.runsched(TestScheduler), [1, 0, 3, 2, 5, 4])
+
+    def test_save_durations(self):
+        class TestExecute(bb.runqueue.RunQueueExecuteTasks):
+            def __init__(self, d):
+                self.cfgData = d
+
+        d = bb.data.init()
+        d.setVar("PERSISTENT_DIR", self.stampdir)
+        rqexec = TestExecute(d)
+        rqexec.task_durations = {"a:do_compile" : 10.0}
+        rqexec.save_task_durations()
+        self.assertEqual(rqexec.task_durations, {})
+        rqexec.task_durations = {"a:do_compile" : 20.0, "b:do_compile" : 1.0}
+        rqexec.save_task_durations()
+        store = bb.runqueue.task_duration_store(d)
+        self.assertEqual(dict(store.items()), {"a:do_compile" : "15.000", "b:do_compile" : "1.000"})
+
+    def test_busy_stamp(self):
+        rqdata = FakeRunQueueData(self.stampdir, self.fns, self.tasks)
+        rqexec = FakeRunQueueExecute(rqdata)
+        sched = bb.runqueue.RunQueueScheduler(rqexec, rqdata)
+        rqexec.build_stamps2.add(sched.stamps[0])
+        self.assertEqual(sched.next_buildable_task(), 1)
+        rqexec.build_stamps2.add(sched.stamps[1])
+        self.assertEqual(sched.next_buildable_task(), None)
+        rqexec.build_stamps2.discard(sched.stamps[0])
+        self.assertEqual(sched.next_buildable_task(), 0)
+
+class FakeCooker(object):
+    def __init__(self):
+        self.data = bb.data.init()
+
+class HashRunQueueData(bb.runqueue.RunQueueData):
+    def __init__(self, dataCache, fns, tasks):
+        """
+        tasks is a list of (fnid, taskname, depends) tuples
+        """
+        self.cooker = FakeCooker()
+        self.taskData = FakeTaskData(fns)
+        self.dataCache = dataCache
+        self.reset()
+        for (fnid, taskname, depends) in tasks:
+            self.runq_fnid.append(fnid)
+            self.runq_task.append(taskname)
+            self.runq_depends.append(set(depends))
+            self.runq_revdeps.append(set())
+            self.runq_hash.append("")
+        for task, deps in enumerate(self.runq_depends):
+            for dep in deps:
+                self.runq_revdeps[dep].add(task)
+
+class TaskHashTest(unittest.TestCase):
+
+    def setUp(self):
+        self.stampdir = tempfile.mkdtemp()
+        self.d = bb.data.init()
+        self.cache = DataCache(self.stampdir)
+        self.fns = []
+        self.tasks = []
+        installs = []
+        for i in range(30):
+            fn = "/recipes/r%d.bb" % i
+            self.fns.append(fn)
+            for taskname in ["do_fetch", "do_compile", "do_install"]:
+                self.cache.add(fn, taskname, hashlib.md5(fn + taskname).hexdigest())
+            fetch = len(self.tasks)
+            self.tasks.append((i, "do_fetch", []))
+            self.tasks.append((i, "do_compile", [fetch]))
+            self.tasks.append((i, "do_install", [fetch + 1] + installs[-3:]))
+            installs.append(fetch + 2)
+        self.fns.append("/recipes/image.bb")
+        self.cache.add("/recipes/image.bb", "do_rootfs", "image")
+        self.tasks.append((30, "do_rootfs", installs))
+
+    def tearDown(self):
+        shutil.rmtree(self.stampdir)
+
+    def taskhashes(self, num_processes, siggenclass=bb.siggen.SignatureGeneratorBasic):
+        bb.parse.siggen = siggenclass(self.d)
+        rqdata = HashRunQueueData(self.cache, self.fns, self.tasks)
+        rqdata.calculate_task_hashes(num_processes, min_parallel=10)
+        return rqdata.runq_hash, bb.parse.siggen
+
+    def test_levels(self):
+        rqdata = HashRunQueueData(self.cache, self.fns, self.tasks)
+        seen = set()
+        for level in rqdata.hash_levels():
+            for task in level:
+                self.assertTrue(rqdata.runq_depends[task].issubset(seen))
+            seen.update(level)
+        self.assertEqual(len(seen), len(self.tasks))
+
+    def test_parallel(self):
+        serial, serialgen = self.taskhashes(1)
+        parallel, parallelgen = self.taskhashes(3)
+        self.assertNotIn("", serial)
+        self.assertEqual(serial, parallel)
+        self.assertEqual(serialgen.taskhash, parallelgen.taskhash)
+        self.assertEqual(serialgen.runtaskdeps, parallelgen.runtaskdeps)
+        self.assertEqual(serialgen.file_checksum_values, parallelgen.file_checksum_values)
+
+    def test_taskstate_unsupported(self):
+        class LayerSignatureGenerator(bb.siggen.SignatureGeneratorBasic):
+            # Keeps state of its own which get_taskstate() doesn't return
+            def get_taskhash(self, fn, task, deps, dataCache):
+                self.lasttask = fn + "." + task
+                return bb.siggen.SignatureGeneratorBasic.get_taskhash(self, fn, task, deps, dataCache)
+
+        self.assertTrue(bb.runqueue.taskstate_supported(bb.siggen.SignatureGeneratorBasicHash(self.d)))
+        self.assertFalse(bb.runqueue.taskstate_supported(bb.siggen.SignatureGenerator(self.d)))
+        self.assertFalse(bb.runqueue.taskstate_supported(LayerSignatureGenerator(self.d)))
+        # Such generators are run serially
+        serial, serialgen = self.taskhashes(1)
+        layer, layergen = self.taskhashes(3, LayerSignatureGenerator)
+        self.assertEqual(serial, layer)
+        self.assertEqual(serialgen.taskhash, layergen.taskhash)
+        self.assertEqual(layergen.lasttask, "/recipes/image.bb.do_rootfs")
+
+class WorkerFrameBufferTest(unittest.TestCase):
+
+    def test_frames(self):
+        data = bb.runqueue.frame_worker_msg(bb.runqueue.workerMsgEvent, {"msg" : "</event>"})
+        data += bb.runqueue.frame_worker_msg(bb.runqueue.workerMsgExitcode, (3, 0))
+        queue = bb.runqueue.WorkerFrameBuffer()
+        queue.feed(data[:4])
+        self.assertEqual(queue.frames(), [])
+        queue.feed(data[4:-1])
+        frames = queue.frames()
+        self.assertEqual(len(frames), 1)
+        self.assertEqual(frames[0][0], bb.runqueue.workerMsgEvent)
+        self.assertEqual(bb.runqueue.pickle.loads(frames[0][1]), {"msg" : "</event>"})
+        queue.feed(data[-1:])
+        frames = queue.frames()
+        self.assertEqual([(t, bb.runqueue.pickle.loads(p)) for t, p in frames], [(bb.runqueue.workerMsgExitcode, (3, 0))])
+        self.assertEqual(len(queue), 0)
+
+    def test_raw_frames(self):
+        first = bb.runqueue.frame_worker_msg(bb.runqueue.workerMsgEvent, "one")
+        second = bb.runqueue.frame_worker_msg(bb.runqueue.workerMsgEvent, "two")
+        queue = bb.runqueue.WorkerFrameBuffer()
+        queue.feed(first + second[:-2])
+        self.assertEqual(queue.raw_frames(), first)
+        queue.feed(second[-2:])
+        self.assertEqual(queue.raw_frames(), second)
+        self.assertEqual(queue.raw_frames(), "")
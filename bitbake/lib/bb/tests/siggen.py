@@ -0,0 +1,86 @@
+# ex:ts=4:sw=4:sts=4:et
+# -*- tab-width: 4; c-basic-offset: 4; indent-tabs-mode: nil -*-
+#
+# BitBake Tests for siggen.py
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 2 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+
+import unittest
+import tempfile
+import hashlib
+import os
+import bb
+import bb.siggen
+
+class DataCache(object):
+    def __init__(self, stampdir):
+        self.basetaskhash = {}
+        self.pkg_fn = {}
+        self.file_checksums = {}
+        self.task_deps = {}
+        self.stamp = {}
+        self.stampdir = stampdir
+
+    def add(self, fn, task, basehash):
+        self.basetaskhash[fn + "." + task] = basehash
+        self.pkg_fn[fn] = os.path.basename(fn)
+        self.file_checksums[fn] = {}
+        self.task_deps[fn] = {}
+        self.stamp[fn] = os.path.join(self.stampdir, os.path.basename(fn))
+
+class TaskHashTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.d = bb.data.init()
+        self.cache = DataCache(self.tempdir)
+        self.deps = []
+        for i in range(50):
+            fn = "/recipes/dep%d.bb" % i
+            self.cache.add(fn, "do_populate_sysroot", hashlib.md5(fn).hexdigest())
+            self.deps.append(fn + ".do_populate_sysroot")
+        self.cache.add("/recipes/image.bb", "do_rootfs", hashlib.md5("image").hexdigest())
+
+    def tearDown(self):
+        bb.utils.remove(self.tempdir, True)
+
+    def taskhashes(self, algorithm=None):
+        if algorithm:
+            self.d.setVar("BB_HASHALGORITHM", algorithm)
+        siggen = bb.siggen.SignatureGeneratorBasic(self.d)
+        for dep in self.deps:
+            fn, task = dep.rsplit(".", 1)
+            siggen.get_taskhash(fn, task, [], self.cache)
+        return siggen, siggen.get_taskhash("/recipes/image.bb", "do_rootfs", self.deps, self.cache)
+
+    def test_md5(self):
+        siggen, h = self.taskhashes()
+        data = self.cache.basetaskhash["/recipes/image.bb.do_rootfs"]
+        for dep in sorted(self.deps, key=bb.siggen.clean_basepath):
+            data = data + siggen.taskhash[dep]
+        self.assertEqual(h, hashlib.md5(data).hexdigest())
+
+    def test_sha256(self):
+        siggen, h = self.taskhashes("sha256")
+        data = self.cache.basetaskhash["/recipes/image.bb.do_rootfs"]
+        for dep in sorted(self.deps, key=bb.siggen.clean_basepath):
+            data = data + siggen.taskhash[dep]
+        self.assertEqual(h, hashlib.sha256(data).hexdigest())
+        self.assertEqual(len(h), 64)
+
+    def test_invalid(self):
+        self.d.setVar("BB_HASHALGORITHM", "crc32")
+        with self.assertRaises(bb.BBHandledException):
+            bb.siggen.SignatureGeneratorBasic(self.d)
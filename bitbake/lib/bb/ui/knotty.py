@@ -245,6 +245,10 @@ _evt_list = [ "bb.runqueue.runQueueExitWait", "bb.event.LogExecTTY", "logging.Lo
               "bb.runqueue.runQueueTaskStarted", "bb.runqueue.runQueueTaskFailed", "bb.runqueue.sceneQueueTaskFailed",
               "bb.event.BuildBase", "bb.build.TaskStarted", "bb.build.TaskSucceeded", "bb.build.TaskFailedSilent"]
 
+# The progress bars only need the latest progress event in each interval
+# of this many seconds
+_evt_ratelimit = 0.1
+
 def main(server, eventHandler, params, tf = TerminalFilter):
 
     includelogs, loglines, consolelogfile = _log_settings_from_server(server)
@@ -280,7 +284,7 @@ def main(server, eventHandler, params, tf = TerminalFilter):
         logger.addHandler(consolelog)
 
     llevel, debug_domains = bb.msg.constructLogOptions()
-    server.runCommand(["setEventMask", server.getEventHandle(), llevel, debug_domains, _evt_list])
+    server.runCommand(["setEventMask", server.getEventHandle(), llevel, debug_domains, _evt_list, _evt_ratelimit])
 
     if not params.observe_only:
         params.updateFromServer(server)
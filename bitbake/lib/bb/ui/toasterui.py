@@ -300,6 +300,7 @@ def main(server, eventHandler, params ):
 
             # ignore
             if isinstance(event, (bb.event.BuildBase,
+                                  bb.build.TaskOverhead,
                                   bb.event.StampUpdate,
                                   bb.event.RecipePreFinalise,
                                   bb.runqueue.runQueueEvent,
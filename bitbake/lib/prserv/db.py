@@ -32,6 +32,12 @@ class PRTable(object):
                     value INTEGER, \
                     PRIMARY KEY (version, pkgarch, checksum));" % self.table)
 
+        # Write through copy of the table, loaded one (version, pkgarch)
+        # pair at a time: {(version, pkgarch): {checksum: value}} plus the
+        # highest value of each pair
+        self.cache = {}
+        self.maxvalues = {}
+
     def _execute(self, *query):
         """Execute a query, waiting to acquire a lock if necessary"""
         start = time.time()
@@ -53,59 +59,72 @@ class PRTable(object):
             self.sync()
             self.dirty = False
 
-    def _getValueHist(self, version, pkgarch, checksum):
-        data=self._execute("SELECT value FROM %s WHERE version=? AND pkgarch=? AND checksum=?;" % self.table,
-                           (version, pkgarch, checksum))
-        row=data.fetchone()
-        if row != None:
-            return row[0]
-        else:
-            #no value found, try to insert
-            try:
-                self._execute("INSERT INTO %s VALUES (?, ?, ?, (select ifnull(max(value)+1,0) from %s where version=? AND pkgarch=?));"
-                           % (self.table,self.table),
-                           (version,pkgarch, checksum,version, pkgarch))
-            except sqlite3.IntegrityError as exc:
-                logger.error(str(exc))
+    def _getGroup(self, version, pkgarch):
+        """Return the cached {checksum: value} mapping of a version and pkgarch"""
+        key = (version, pkgarch)
+        group = self.cache.get(key)
+        if group is None:
+            group = {}
+            maxvalue = None
+            data = self._execute("SELECT checksum, value FROM %s WHERE version=? AND pkgarch=?;" % self.table,
+                                 (version, pkgarch))
+            for row in data:
+                group[row[0]] = row[1]
+                if row[1] is not None and (maxvalue is None or row[1] > maxvalue):
+                    maxvalue = row[1]
+            self.cache[key] = group
+            self.maxvalues[key] = maxvalue
+        return group
 
-            self.dirty = True
+    def _invalidate(self, version, pkgarch):
+        """Drop the cached rows of a version and pkgarch"""
+        self.cache.pop((version, pkgarch), None)
+        self.maxvalues.pop((version, pkgarch), None)
 
-            data=self._execute("SELECT value FROM %s WHERE version=? AND pkgarch=? AND checksum=?;" % self.table,
-                               (version, pkgarch, checksum))
-            row=data.fetchone()
-            if row != None:
-                return row[0]
-            else:
+    def _insertValue(self, version, pkgarch, checksum, replace=False):
+        """Allocate the next value of a version and pkgarch to checksum"""
+        key = (version, pkgarch)
+        maxvalue = self.maxvalues[key]
+        if maxvalue is None:
+            value = 0
+        else:
+            value = maxvalue + 1
+        if replace:
+            sql = "INSERT OR REPLACE INTO %s VALUES (?, ?, ?, ?);"
+        else:
+            sql = "INSERT INTO %s VALUES (?, ?, ?, ?);"
+        try:
+            self._execute(sql % self.table, (version, pkgarch, checksum, value))
+        except sqlite3.IntegrityError as exc:
+            # A failed statement leaves the rest of the transaction alone
+            # but the cached rows may no longer match, so reload them
+            logger.error(str(exc))
+            self._invalidate(version, pkgarch)
+            value = self._getGroup(version, pkgarch).get(checksum)
+            if value is None:
                 raise prserv.NotFoundError
+            return value
 
-    def _getValueNohist(self, version, pkgarch, checksum):
-        data=self._execute("SELECT value FROM %s \
-                            WHERE version=? AND pkgarch=? AND checksum=? AND \
-                            value >= (select max(value) from %s where version=? AND pkgarch=?);" 
-                            % (self.table, self.table),
-                            (version, pkgarch, checksum, version, pkgarch))
-        row=data.fetchone()
-        if row != None:
-            return row[0]
-        else:
-            #no value found, try to insert
-            try:
-                self._execute("INSERT OR REPLACE INTO %s VALUES (?, ?, ?, (select ifnull(max(value)+1,0) from %s where version=? AND pkgarch=?));"
-                               % (self.table,self.table),
-                               (version, pkgarch, checksum, version, pkgarch))
-            except sqlite3.IntegrityError as exc:
-                logger.error(str(exc))
-                self.conn.rollback()
+        self.dirty = True
+        self.cache[key][checksum] = value
+        self.maxvalues[key] = value
+        return value
 
-            self.dirty = True
+    def _getValueHist(self, version, pkgarch, checksum):
+        group = self._getGroup(version, pkgarch)
+        if checksum in group:
+            return group[checksum]
+        #no value found, try to insert
+        return self._insertValue(version, pkgarch, checksum)
 
-            data=self._execute("SELECT value FROM %s WHERE version=? AND pkgarch=? AND checksum=?;" % self.table,
-                               (version, pkgarch, checksum))
-            row=data.fetchone()
-            if row != None:
-                return row[0]
-            else:
-                raise prserv.NotFoundError
+    def _getValueNohist(self, version, pkgarch, checksum):
+        group = self._getGroup(version, pkgarch)
+        value = group.get(checksum)
+        maxvalue = self.maxvalues[(version, pkgarch)]
+        if value is not None and maxvalue is not None and value >= maxvalue:
+            return value
+        #no value found, try to insert
+        return self._insertValue(version, pkgarch, checksum, replace=True)
 
     def getValue(self, version, pkgarch, checksum):
         if self.nohist:
@@ -162,6 +181,7 @@ class PRTable(object):
             return None
 
     def importone(self, version, pkgarch, checksum, value):
+        self._invalidate(version, pkgarch)
         if self.nohist:
             return self._importNohist(version, pkgarch, checksum, value)
         else:
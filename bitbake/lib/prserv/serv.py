@@ -3,6 +3,7 @@ import signal, time
 from SimpleXMLRPCServer import SimpleXMLRPCServer, SimpleXMLRPCRequestHandler
 import threading
 import Queue
+import xmlrpclib
 
 try:
     import sqlite3
@@ -56,15 +57,13 @@ class PRServer(SimpleXMLRPCServer):
         self.pidfile=PIDPREFIX % (self.host, self.port)
 
         self.register_function(self.getPR, "getPR")
+        self.register_function(self.getPRs, "getPRs")
         self.register_function(self.quit, "quit")
         self.register_function(self.ping, "ping")
         self.register_function(self.export, "export")
         self.register_function(self.importone, "importone")
         self.register_introspection_functions()
 
-        self.db = prserv.db.PRData(self.dbfile)
-        self.table = self.db["PRMAIN"]
-
         self.requestqueue = Queue.Queue()
         self.handlerthread = threading.Thread(target = self.process_request_thread)
         self.handlerthread.daemon = False
@@ -75,27 +74,29 @@ class PRServer(SimpleXMLRPCServer):
         In addition, exception handling is done here.
 
         """
-        iter_count = 1
-        # 60 iterations between syncs or sync if dirty every ~30 seconds
-        iterations_between_sync = 60
+        # Allocations are written through the table's cache straight away
+        # but only committed once the server has been idle for a moment or
+        # at least every sync_interval seconds while it stays busy
+        sync_interval = 2
+        lastsync = time.time()
 
         while not self.quit:
             try:
-                (request, client_address) = self.requestqueue.get(True, 30)
+                (request, client_address) = self.requestqueue.get(True, 0.1 if self.table.dirty else 30)
             except Queue.Empty:
                 self.table.sync_if_dirty()
+                lastsync = time.time()
                 continue
             try:
                 self.finish_request(request, client_address)
                 self.shutdown_request(request)
-                iter_count = (iter_count + 1) % iterations_between_sync
-                if iter_count == 0:
-                    self.table.sync_if_dirty()
             except:
                 self.handle_error(request, client_address)
                 self.shutdown_request(request)
                 self.table.sync()
-            self.table.sync_if_dirty()
+            if time.time() - lastsync > sync_interval:
+                self.table.sync_if_dirty()
+                lastsync = time.time()
 
     def process_request(self, request, client_address):
         self.requestqueue.put((request, client_address))
@@ -126,17 +127,35 @@ class PRServer(SimpleXMLRPCServer):
             logger.error(str(exc))
             return None
 
+    def getPRs(self, queries):
+        """
+        Look up or allocate the values of a list of (version, pkgarch,
+        checksum) queries in one call, returning them in the same order
+        """
+        return [self.getPR(version, pkgarch, checksum) for (version, pkgarch, checksum) in queries]
+
     def quit(self):
         self.quit=True
         return
 
+    def sigterm_handler(self, signum, frame):
+        # Stop serving so that the pending allocations get committed
+        self.quit=True
+
     def work_forever(self,):
         self.quit = False
         self.timeout = 0.5
 
+        # Open the database in the serving process only, a connection
+        # inherited over fork() checkpoints and removes the WAL file from
+        # under the server when the parent closes it
+        self.db = prserv.db.PRData(self.dbfile)
+        self.table = self.db["PRMAIN"]
+
         logger.info("Started PRServer with DBfile: %s, IP: %s, PORT: %s, PID: %s" %
                      (self.dbfile, self.host, self.port, str(os.getpid())))
 
+        signal.signal(signal.SIGTERM, self.sigterm_handler)
         self.handlerthread.start()
         while not self.quit:
             self.handle_request()
@@ -248,6 +267,13 @@ class PRServerConnection(object):
     def getPR(self, version, pkgarch, checksum):
         return self.connection.getPR(version, pkgarch, checksum)
 
+    def getPRs(self, queries):
+        try:
+            return self.connection.getPRs(queries)
+        except xmlrpclib.Fault:
+            # Servers older than the batch call only know getPR
+            return [self.connection.getPR(version, pkgarch, checksum) for (version, pkgarch, checksum) in queries]
+
     def ping(self):
         return self.connection.ping()
 
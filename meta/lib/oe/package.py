@@ -1,3 +1,84 @@
+def is_elf(path):
+    # Function to classify a file for split_and_strip_files in package.bbclass,
+    # reading the ELF headers directly rather than running 'file' on it.
+    #
+    # Returns the elftype bit pattern:
+    # 0 - not elf
+    # 1 - ELF
+    # 2 - stripped
+    # 4 - executable
+    # 8 - shared library
+
+    import oe.qa
+
+    elf = oe.qa.ELFFile(path)
+    try:
+        elf.open()
+        exec_type = 1
+        elftype = elf.elfType()
+        if elftype == oe.qa.ELFFile.ET_EXEC:
+            exec_type |= 4
+        elif elftype == oe.qa.ELFFile.ET_DYN:
+            exec_type |= 8
+        # 'file' only lists the sections of these types
+        if elftype not in (oe.qa.ELFFile.ET_REL, oe.qa.ELFFile.ET_EXEC, oe.qa.ELFFile.ET_DYN) or elf.isStripped():
+            exec_type |= 2
+    except Exception:
+        return 0
+    finally:
+        elf.close()
+
+    return exec_type
+
+def splitdebuginfo(arg):
+    # Function to split a single file into two components, one is the stripped
+    # target system binary, the other contains any debugging information. The
+    # two files are linked to reference each other. Called from
+    # split_and_strip_files in package.bbclass.
+    #
+    # sourcefile is also generated containing a list of debugsources
+
+    import os, stat
+    import bb.utils
+    import oe.utils
+
+    (file, debugfile, debugsrcdir, sourcefile, objcopy, debugedit, workparentdir) = arg
+
+    # We ignore kernel modules, we don't generate debug info files.
+    if file.find("/lib/modules/") != -1 and file.endswith(".ko"):
+        return 1
+
+    newmode = None
+    if not os.access(file, os.W_OK) or os.access(file, os.R_OK):
+        origmode = os.stat(file)[stat.ST_MODE]
+        newmode = origmode | stat.S_IWRITE | stat.S_IREAD
+        os.chmod(file, newmode)
+
+    # We need to extract the debug src information here...
+    if debugsrcdir:
+        cmd = "'%s' -b '%s' -d '%s' -i -l '%s' '%s'" % (debugedit, workparentdir, debugsrcdir, sourcefile, file)
+        (retval, output) = oe.utils.getstatusoutput(cmd)
+        if retval:
+            bb.fatal("debugedit failed with exit code %s (cmd was %s)%s" % (retval, cmd, ":\n%s" % output if output else ""))
+
+    bb.utils.mkdirhier(os.path.dirname(debugfile))
+
+    cmd = "'%s' --only-keep-debug '%s' '%s'" % (objcopy, file, debugfile)
+    (retval, output) = oe.utils.getstatusoutput(cmd)
+    if retval:
+        bb.fatal("objcopy failed with exit code %s (cmd was %s)%s" % (retval, cmd, ":\n%s" % output if output else ""))
+
+    # Set the debuglink to have the view of the file path on the target
+    cmd = "'%s' --add-gnu-debuglink='%s' '%s'" % (objcopy, debugfile, file)
+    (retval, output) = oe.utils.getstatusoutput(cmd)
+    if retval:
+        bb.fatal("objcopy failed with exit code %s (cmd was %s)%s" % (retval, cmd, ":\n%s" % output if output else ""))
+
+    if newmode:
+        os.chmod(file, origmode)
+
+    return 0
+
 def runstrip(arg):
     # Function to strip a single file, called from split_and_strip_files below
     # A working 'file' (one which works on the target architecture)
@@ -44,6 +125,243 @@ def runstrip(arg):
     return
 
 
+def elf_filedeps(path, executable):
+    # Function to find the dependencies of an ELF file in the same way as
+    # rpmfcELF() in rpm's file classifier, used by rpmdeps. Returns
+    # (provides, requires) as sets, both empty if the file can't be parsed.
+    #
+    # Shared libraries provide their sonames and symbol version
+    # definitions, executable files require the sonames they are linked
+    # against and their symbol versions.
+
+    import os, struct
+    import oe.qa
+
+    provides = set()
+    requires = set()
+
+    elf = oe.qa.ELFFile(path)
+    try:
+        elf.open()
+        if elf.bits == 64:
+            suffix = "(64bit)"
+        else:
+            suffix = ""
+        isdso = elf.elfType() == oe.qa.ELFFile.ET_DYN
+        shdrs = elf.sectionHeaders()
+
+        def strings(shdr):
+            if shdr[3] >= len(shdrs):
+                return ""
+            return elf.readSection(shdrs[shdr[3]])
+
+        def string(table, offset):
+            end = table.find("\0", offset)
+            if end < 0:
+                end = len(table)
+            return table[offset:end]
+
+        gotsoname = gotdebug = gothash = gotgnuhash = False
+        for shdr in shdrs:
+            sh_type = shdr[0]
+            if sh_type == oe.qa.ELFFile.SHT_GNU_verdef:
+                data = elf.readSection(shdr)
+                table = strings(shdr)
+                soname = None
+                offset = 0
+                for i in xrange(shdr[4]):
+                    if offset + 20 > len(data):
+                        break
+                    (vd_flags, vd_cnt, vd_aux, vd_next) = struct.unpack(elf.sex + "2xH2xH4xII", data[offset:offset+20])
+                    auxoffset = offset + vd_aux
+                    for j in xrange(vd_cnt):
+                        if auxoffset + 8 > len(data):
+                            break
+                        (vda_name, vda_next) = struct.unpack(elf.sex + "II", data[auxoffset:auxoffset+8])
+                        name = string(table, vda_name)
+                        if vd_flags & oe.qa.ELFFile.VER_FLG_BASE:
+                            soname = name
+                        elif soname is not None:
+                            provides.add("%s(%s)%s" % (soname, name, suffix))
+                        auxoffset += vda_next
+                    offset += vd_next
+            elif sh_type == oe.qa.ELFFile.SHT_GNU_verneed and executable:
+                data = elf.readSection(shdr)
+                table = strings(shdr)
+                offset = 0
+                for i in xrange(shdr[4]):
+                    if offset + 16 > len(data):
+                        break
+                    (vn_cnt, vn_file, vn_aux, vn_next) = struct.unpack(elf.sex + "2xHIII", data[offset:offset+16])
+                    soname = string(table, vn_file)
+                    auxoffset = offset + vn_aux
+                    for j in xrange(vn_cnt):
+                        if auxoffset + 16 > len(data):
+                            break
+                        (vna_name, vna_next) = struct.unpack(elf.sex + "8xII", data[auxoffset:auxoffset+16])
+                        requires.add("%s(%s)%s" % (soname, string(table, vna_name), suffix))
+                        auxoffset += vna_next
+                    offset += vn_next
+            elif sh_type == oe.qa.ELFFile.SHT_DYNAMIC:
+                data = elf.readSection(shdr)
+                table = strings(shdr)
+                dynfmt = elf.sex + ("II" if elf.bits == 32 else "QQ")
+                dynlen = struct.calcsize(dynfmt)
+                for offset in xrange(0, len(data) - dynlen + 1, dynlen):
+                    (tag, val) = struct.unpack(dynfmt, data[offset:offset+dynlen])
+                    if tag == oe.qa.ELFFile.DT_HASH:
+                        gothash = True
+                    elif tag == oe.qa.ELFFile.DT_GNU_HASH:
+                        gotgnuhash = True
+                    elif tag == oe.qa.ELFFile.DT_DEBUG:
+                        gotdebug = True
+                    elif tag == oe.qa.ELFFile.DT_NEEDED and executable:
+                        requires.add(string(table, val) + ("()" + suffix if suffix else ""))
+                    elif tag == oe.qa.ELFFile.DT_SONAME:
+                        gotsoname = True
+                        provides.add(string(table, val) + ("()" + suffix if suffix else ""))
+
+        # Libraries only hashed with .gnu_hash need a recent enough glibc
+        if gotgnuhash and not gothash:
+            requires.add("rtld(GNU_HASH)")
+
+        # Libraries without a soname provide their file name
+        if isdso and not gotdebug and not gotsoname:
+            provides.add(os.path.basename(path) + ("()" + suffix if suffix else ""))
+    except Exception:
+        return (set(), set())
+    finally:
+        elf.close()
+
+    return (provides, requires)
+
+def script_interpreter(path):
+    # Function to find the interpreter of a script as rpmfcSCRIPT() in rpm's
+    # file classifier does, the first #! line within the first ten lines
+    # which names one by its absolute path. Returns None if there is none.
+
+    import re
+
+    with open(path, "rb") as f:
+        for i in xrange(10):
+            line = f.readline(8190)
+            # Like fgets() followed by a feof() check
+            if not line.endswith("\n") and len(line) < 8190:
+                break
+            line = line.split("\0", 1)[0]
+            if not line.startswith("#!"):
+                continue
+            interpreter = line[2:].lstrip(" \t\n\r")
+            if not interpreter.startswith("/"):
+                continue
+            return re.match("[^ \t\n\r]*", interpreter).group(0)
+    return None
+
+# Files rpmdeps hands to its helper scripts (perl, python, libtool,
+# pkgconfig and so on) rather than finding their dependencies itself, by
+# file name...
+rpmdeps_helper_suffixes = (".pm", ".pl", ".ph", ".py", ".pyc", ".pyo", ".la", ".pc",
+                           ".php", ".jar", ".class", ".dll", ".exe", ".typelib", ".tcl", ".rb",
+                           ".ttf", ".otf", ".pcf", ".pcf.gz", ".pfa", ".pfb", ".afm", ".bdf")
+rpmdeps_helper_paths = "/usr/lib(32|64)?/(perl|python|ruby|php|tcl)"
+# ...by the interpreter of scripts...
+rpmdeps_helper_interpreters = ("perl", "python", "php", "tcl", "wish", "ruby", "mono", "java")
+# ...or by the start of their contents
+rpmdeps_helper_magic = ("MZ", "PK\x03\x04", "\xca\xfe\xba\xbe", "GOBJ\nMETADATA")
+rpmdeps_helper_contents = r"^(package\s|use\s+(strict|warnings)|eval\s+.exec|import\s|from\s+\S+\s+import\s)|<\?php|libtool library file"
+
+def rpmdeps_needs_helper(head):
+    # Whether the dependencies of a file need one of rpmdeps' helper
+    # scripts, head is the start of its contents
+    import os, re
+
+    if head.startswith(rpmdeps_helper_magic):
+        return True
+    if head.startswith("#!"):
+        for word in head[2:].split("\n", 1)[0].split()[:2]:
+            if os.path.basename(word).startswith(rpmdeps_helper_interpreters):
+                return True
+    if re.search(rpmdeps_helper_contents, head, re.M):
+        return True
+    return False
+
+def filedeps(path):
+    # Function to find the dependencies of a single file for filedepscanner
+    # below. Returns (provides, requires) as sets, None if rpmdeps needs one
+    # of its helper scripts for the file.
+
+    import os, re, stat
+
+    st = os.lstat(path)
+    if path.endswith(rpmdeps_helper_suffixes) or re.search(rpmdeps_helper_paths, path):
+        return None
+    if not stat.S_ISREG(st.st_mode):
+        return (set(), set())
+
+    executable = bool(st.st_mode & (stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH))
+    with open(path, "rb") as f:
+        head = f.read(1024)
+    if rpmdeps_needs_helper(head):
+        return None
+    if head.startswith("\x7fELF"):
+        return elf_filedeps(path, executable)
+    if head.startswith("#!"):
+        interpreter = script_interpreter(path)
+        if interpreter and os.path.basename(interpreter).startswith(rpmdeps_helper_interpreters):
+            return None
+        if interpreter and executable:
+            return (set(), set([interpreter]))
+    return (set(), set())
+
+def filedepscanner(arg):
+    # Function to find the per file dependencies of a package in process,
+    # with the same results as filedeprunner below. Files rpmdeps uses
+    # helper scripts for are still passed to rpmdeps.
+
+    (pkg, pkgfiles, rpmdeps, pkgdest) = arg
+    found = {}
+    helperfiles = []
+    for f in pkgfiles:
+        # filedeprunner splits the output of rpmdeps at the first space so
+        # never finds anything for these
+        if " " in f:
+            found[f] = (set(), set())
+            continue
+        deps = filedeps(f)
+        if deps is None:
+            helperfiles.append(f)
+        else:
+            found[f] = deps
+
+    helperprovides = {}
+    helperrequires = {}
+    if helperfiles:
+        (_, helperprovides, helperrequires) = filedeprunner((pkg, helperfiles, rpmdeps, pkgdest))
+
+    # rpmdeps lists the files sorted by name, the dependencies of each
+    # sorted by name too
+    provides = {}
+    requires = {}
+    for f in sorted(pkgfiles):
+        file = file_translate(f.replace(pkgdest + "/" + pkg, ""))
+        if f in found:
+            (fprovides, frequires) = found[f]
+            fprovides = sorted(filedep_filter(fprovides), key=lambda x: x + " ")
+            frequires = sorted(filedep_filter(frequires), key=lambda x: x + " ")
+        else:
+            fprovides = helperprovides.get(file)
+            frequires = helperrequires.get(file)
+        if fprovides:
+            provides[file] = fprovides
+        if frequires:
+            requires[file] = frequires
+
+    return (pkg, provides, requires)
+
+def filedep_filter(values):
+    # The dependencies filedeprunner ignores
+    return [v for v in values if not v.startswith("rpmlib(") and v != "python"]
+
 def file_translate(file):
     ft = file.replace("@", "@at@")
     ft = ft.replace(" ", "@space@")
@@ -27,12 +27,290 @@ def create_index(arg):
     return None
 
 
+def write_index_file(path, data, compress=False):
+    """
+    Write an index file of a feed so that readers only ever see the old or
+    the new contents, and a gzip compressed copy next to it if asked to
+    """
+    import gzip
+
+    tmpfile = path + ".tmp"
+    with open(tmpfile, "wb") as f:
+        f.write(data)
+    if compress:
+        with open(path + ".gz.tmp", "wb") as f:
+            gz = gzip.GzipFile(os.path.basename(path), "wb", 9, f, 0)
+            gz.write(data)
+            gz.close()
+    os.rename(tmpfile, path)
+    if compress:
+        os.rename(path + ".gz.tmp", path + ".gz")
+
+
+class PackageIndexCache(object):
+    """
+    The index entries of the packages in a feed directory, kept in a file
+    between runs so that only new or changed packages have to be read
+    again. An entry is used again while the size and modification time of
+    its package stay the same, or while its checksum does if only the
+    modification time changed.
+    """
+    CACHE_FILE = ".index.cache"
+    CACHE_VERSION = "1"
+
+    def __init__(self, pkgs_dir):
+        self.pkgs_dir = pkgs_dir
+        self.cachefile = os.path.join(pkgs_dir, self.CACHE_FILE)
+        self.entries = {}
+
+    def load(self):
+        import cPickle as pickle
+        try:
+            with open(self.cachefile, "rb") as f:
+                (version, entries) = pickle.load(f)
+            if version == self.CACHE_VERSION:
+                self.entries = entries
+        except Exception:
+            self.entries = {}
+
+    def save(self):
+        import cPickle as pickle
+        tmpfile = self.cachefile + ".tmp"
+        with open(tmpfile, "wb") as f:
+            pickle.dump((self.CACHE_VERSION, self.entries), f, pickle.HIGHEST_PROTOCOL)
+        os.rename(tmpfile, self.cachefile)
+
+    @staticmethod
+    def checksums(path):
+        import hashlib
+        md5 = hashlib.md5()
+        sha1 = hashlib.sha1()
+        sha256 = hashlib.sha256()
+        with open(path, "rb") as f:
+            while True:
+                data = f.read(1024 * 1024)
+                if not data:
+                    break
+                md5.update(data)
+                sha1.update(data)
+                sha256.update(data)
+        return (md5.hexdigest(), sha1.hexdigest(), sha256.hexdigest())
+
+    def update(self, filenames, read):
+        """
+        Bring the entries of the packages filenames, relative to pkgs_dir,
+        up to date and drop those of packages which are gone. read(path,
+        entry) returns what is kept for a new or changed package. Returns
+        the number of entries added, changed or dropped.
+        """
+        changed = 0
+        for filename in set(self.entries) - set(filenames):
+            del self.entries[filename]
+            changed += 1
+
+        for filename in filenames:
+            path = os.path.join(self.pkgs_dir, filename)
+            st = os.stat(path)
+            entry = self.entries.get(filename)
+            if entry and entry["size"] == st.st_size and entry["mtime"] == st.st_mtime:
+                continue
+            (md5, sha1, sha256) = self.checksums(path)
+            if entry and entry["size"] == st.st_size and entry["md5"] == md5 and entry["sha256"] == sha256:
+                entry["mtime"] = st.st_mtime
+                continue
+            entry = {"size": st.st_size, "mtime": st.st_mtime,
+                     "md5": md5, "sha1": sha1, "sha256": sha256}
+            entry["data"] = read(path, entry)
+            self.entries[filename] = entry
+            changed += 1
+        return changed
+
+
+def _ar_control(f):
+    # The name and data of the control.tar member of an ar archive such as
+    # a .deb or an .ipk built in ar format. The other members are skipped
+    # without being read.
+    if f.read(8) != "!<arch>\n":
+        raise ValueError("not an ar archive")
+    while True:
+        header = f.read(60)
+        if len(header) < 60:
+            return (None, None)
+        name = header[0:16].strip().rstrip("/")
+        size = int(header[48:58])
+        if name.startswith("control.tar"):
+            return (name, f.read(size))
+        f.seek(size + size % 2, os.SEEK_CUR)
+
+def _tar_control(f):
+    # The name and data of the control.tar member of an .ipk which
+    # opkg-build created as a gzip compressed tar archive. It comes before
+    # data.tar, which is never decompressed.
+    import tarfile
+    with tarfile.open(fileobj=f, mode="r|gz") as tar:
+        for info in tar:
+            name = os.path.basename(info.name)
+            if info.isfile() and name.startswith("control.tar"):
+                return (name, tar.extractfile(info).read())
+    return (None, None)
+
+def _tar_open(name, data):
+    import tarfile
+    import StringIO
+    if name.endswith(".xz"):
+        proc = subprocess.Popen(["xz", "-dc"], stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+        data = proc.communicate(data)[0]
+        if proc.returncode:
+            raise ValueError("cannot decompress %s" % name)
+        return tarfile.open(fileobj=StringIO.StringIO(data), mode="r:")
+    return tarfile.open(fileobj=StringIO.StringIO(data), mode="r:*")
+
+def _read_control(path):
+    # The fields of the control file of a .deb or .ipk package as a list of
+    # (name, value) in file order
+    with open(path, "rb") as f:
+        magic = f.read(2)
+        f.seek(0)
+        if magic == "\x1f\x8b":
+            (name, data) = _tar_control(f)
+        else:
+            (name, data) = _ar_control(f)
+    control = None
+    if name:
+        with _tar_open(name, data) as tar:
+            for info in tar:
+                if info.name in ("./control", "control"):
+                    control = tar.extractfile(info).read()
+    if control is None:
+        raise ValueError("no control file")
+
+    fields = []
+    for line in control.splitlines():
+        if not line.strip():
+            continue
+        if line[0] in " \t" and fields:
+            fields[-1][1] += "\n" + line
+        elif ":" in line:
+            (name, value) = line.split(":", 1)
+            fields.append([name.strip(), value.strip()])
+    return [tuple(field) for field in fields]
+
+def _stanza(fields, extra):
+    # An index entry, the fields the indexer adds go before the description
+    # as the package managers' own tools put them
+    stanza = ""
+    for (name, value) in fields:
+        if name == "Description" and extra:
+            stanza += "".join("%s: %s\n" % e for e in extra)
+            extra = None
+        stanza += "%s: %s\n" % (name, value)
+    if extra:
+        stanza += "".join("%s: %s\n" % e for e in extra)
+    return stanza
+
+def opkg_index(pkgs_dir):
+    # Function to index a directory of .ipk packages in the same way as
+    # opkg-make-index -m, using PackageIndexCache so only new or changed
+    # packages are read. Only the newest version of each package is listed
+    # and the older ones are moved to the morgue subdirectory. Called
+    # through oe.utils.multiprocess_exec().
+    def read(path, entry):
+        fields = _read_control(path)
+        values = dict(fields)
+        extra = [("MD5Sum", entry["md5"]), ("Size", str(entry["size"])),
+                 ("Filename", os.path.basename(path))]
+        return (values.get("Package"), values.get("Architecture"), values.get("Version", ""),
+                _stanza(fields, extra))
+
+    cache = PackageIndexCache(pkgs_dir)
+    cache.load()
+    filenames = [f for f in os.listdir(pkgs_dir) if f.endswith(".ipk")]
+    try:
+        changed = cache.update(filenames, read)
+    except Exception as e:
+        return "Cannot index %s: %s" % (pkgs_dir, e)
+
+    pkgs_file = os.path.join(pkgs_dir, "Packages")
+    if not changed and os.path.exists(pkgs_file):
+        bb.note("Index of %s is up to date" % pkgs_dir)
+        return None
+
+    newest = {}
+    for filename in sorted(cache.entries):
+        (package, arch, version, stanza) = cache.entries[filename]["data"]
+        if not package:
+            continue
+        key = "%s:%s" % (package, arch)
+        if key not in newest or bb.utils.vercmp_string(version, newest[key][0]) >= 0:
+            newest[key] = (version, stanza)
+
+    morgue_dir = os.path.join(pkgs_dir, "morgue")
+    for filename in sorted(cache.entries):
+        (package, arch, version, stanza) = cache.entries[filename]["data"]
+        if package and bb.utils.vercmp_string(version, newest["%s:%s" % (package, arch)][0]) < 0:
+            bb.utils.mkdirhier(morgue_dir)
+            for f in (filename, filename + ".asc"):
+                if os.path.exists(os.path.join(pkgs_dir, f)):
+                    os.rename(os.path.join(pkgs_dir, f), os.path.join(morgue_dir, f))
+            del cache.entries[filename]
+
+    stanzas = [newest[key][1] for key in sorted(newest)]
+    write_index_file(pkgs_file, "\n".join(stanzas) + "\n" if stanzas else "", True)
+    cache.save()
+    bb.note("Indexed %s, %d of %d packages changed" % (pkgs_dir, changed, len(filenames)))
+    return None
+
+def dpkg_index(arg):
+    # Function to index a directory of .deb packages in the same way as
+    # apt-ftparchive packages, using PackageIndexCache so only new or
+    # changed packages are read, and to write its Release file. Called
+    # through oe.utils.multiprocess_exec().
+    (pkgs_dir, apt_ftparchive, label) = arg
+
+    def read(path, entry):
+        fields = _read_control(path)
+        extra = [("Filename", "./" + os.path.basename(path)), ("Size", str(entry["size"])),
+                 ("MD5sum", entry["md5"]), ("SHA1", entry["sha1"]), ("SHA256", entry["sha256"])]
+        return _stanza(fields, extra)
+
+    cache = PackageIndexCache(pkgs_dir)
+    cache.load()
+    filenames = [f for f in os.listdir(pkgs_dir) if f.endswith(".deb")]
+    try:
+        changed = cache.update(filenames, read)
+    except Exception as e:
+        return "Cannot index %s: %s" % (pkgs_dir, e)
+
+    pkgs_file = os.path.join(pkgs_dir, "Packages")
+    release_file = os.path.join(pkgs_dir, "Release")
+    if not changed and os.path.exists(pkgs_file) and os.path.exists(release_file):
+        bb.note("Index of %s is up to date" % pkgs_dir)
+        return None
+
+    stanzas = [cache.entries[filename]["data"] for filename in sorted(cache.entries)]
+    write_index_file(pkgs_file, "\n".join(stanzas) + "\n" if stanzas else "", True)
+
+    cmd = "cd %s; PSEUDO_UNLOAD=1 %s release ." % (pkgs_dir, apt_ftparchive)
+    try:
+        release = subprocess.check_output(cmd, stderr=subprocess.STDOUT, shell=True)
+    except subprocess.CalledProcessError as e:
+        return("Index creation command '%s' failed with return code %d:\n%s" %
+               (e.cmd, e.returncode, e.output))
+    write_index_file(release_file, "Label: %s\n" % label + release)
+    cache.save()
+    bb.note("Indexed %s, %d of %d packages changed" % (pkgs_dir, changed, len(filenames)))
+    return None
+
+
 class Indexer(object):
     __metaclass__ = ABCMeta
 
     def __init__(self, d, deploy_dir):
         self.d = d
         self.deploy_dir = deploy_dir
+        # Index the packages with the package managers' own tools rather
+        # than incrementally in process
+        self.external = (self.d.getVar('PACKAGE_INDEX_BUILTIN', True) or "1") != "1"
 
     @abstractmethod
     def write_index(self):
@@ -109,6 +387,7 @@ class RpmIndexer(Indexer):
 
         rpm_createrepo = bb.utils.which(os.getenv('PATH'), "createrepo")
         index_cmds = []
+        caches = []
         rpm_dirs_found = False
         for arch in archs:
             dbpath = os.path.join(self.d.getVar('WORKDIR', True), 'rpmdb', arch)
@@ -118,11 +397,26 @@ class RpmIndexer(Indexer):
             if not os.path.isdir(arch_dir):
                 continue
 
+            rpm_dirs_found = True
+
+            # createrepo has to go through every package even with --update,
+            # don't run it at all when no package changed
+            if not self.external:
+                cache = PackageIndexCache(arch_dir)
+                cache.load()
+                rpms = []
+                for root, dirs, files in os.walk(arch_dir):
+                    rpms.extend(os.path.relpath(os.path.join(root, f), arch_dir)
+                                for f in files if f.endswith(".rpm"))
+                if not cache.update(rpms, lambda path, entry: None) and \
+                        os.path.exists(os.path.join(arch_dir, "repodata", "repomd.xml")):
+                    bb.note("Index of %s is up to date" % arch_dir)
+                    continue
+                caches.append(cache)
+
             index_cmds.append("%s --dbpath %s --update -q %s" % \
                              (rpm_createrepo, dbpath, arch_dir))
 
-            rpm_dirs_found = True
-
         if not rpm_dirs_found:
             bb.note("There are no packages in %s" % self.deploy_dir)
             return
@@ -131,6 +425,9 @@ class RpmIndexer(Indexer):
         if result:
             bb.fatal('%s' % ('\n'.join(result)))
 
+        for cache in caches:
+            cache.save()
+
 
 class OpkgIndexer(Indexer):
     def write_index(self):
@@ -156,6 +453,11 @@ class OpkgIndexer(Indexer):
                 if not os.path.isdir(pkgs_dir):
                     continue
 
+                if not self.external:
+                    if pkgs_dir not in index_cmds:
+                        index_cmds.append(pkgs_dir)
+                    continue
+
                 if not os.path.exists(pkgs_file):
                     open(pkgs_file, "w").close()
 
@@ -166,7 +468,10 @@ class OpkgIndexer(Indexer):
             bb.note("There are no packages in %s!" % self.deploy_dir)
             return
 
-        result = oe.utils.multiprocess_exec(index_cmds, create_index)
+        if self.external:
+            result = oe.utils.multiprocess_exec(index_cmds, create_index)
+        else:
+            result = oe.utils.multiprocess_exec(index_cmds, opkg_index)
         if result:
             bb.fatal('%s' % ('\n'.join(result)))
 
@@ -224,6 +529,12 @@ class DpkgIndexer(Indexer):
             if not os.path.isdir(arch_dir):
                 continue
 
+            deb_dirs_found = True
+
+            if not self.external:
+                index_cmds.append((arch_dir, apt_ftparchive, arch))
+                continue
+
             cmd = "cd %s; PSEUDO_UNLOAD=1 %s packages . > Packages;" % (arch_dir, apt_ftparchive)
 
             cmd += "%s -fc Packages > Packages.gz;" % gzip
@@ -235,13 +546,14 @@ class DpkgIndexer(Indexer):
             
             index_cmds.append(cmd)
 
-            deb_dirs_found = True
-
         if not deb_dirs_found:
             bb.note("There are no packages in %s" % self.deploy_dir)
             return
 
-        result = oe.utils.multiprocess_exec(index_cmds, create_index)
+        if self.external:
+            result = oe.utils.multiprocess_exec(index_cmds, create_index)
+        else:
+            result = oe.utils.multiprocess_exec(index_cmds, dpkg_index)
         if result:
             bb.fatal('%s' % ('\n'.join(result)))
 
@@ -20,6 +20,41 @@ class ELFFile:
     ELFDATA2LSB  = 1
     ELFDATA2MSB  = 2
 
+    # possible values for e_type
+    ET_NONE      = 0
+    ET_REL       = 1
+    ET_EXEC      = 2
+    ET_DYN       = 3
+    ET_CORE      = 4
+
+    # section types
+    SHT_SYMTAB   = 2
+    SHT_DYNAMIC  = 6
+    SHT_GNU_verdef  = 0x6ffffffd
+    SHT_GNU_verneed = 0x6ffffffe
+
+    # flag of the version definition naming the file itself
+    VER_FLG_BASE = 1
+
+    # program header types
+    PT_LOAD      = 1
+    PT_DYNAMIC   = 2
+
+    # dynamic section tags
+    DT_NULL      = 0
+    DT_NEEDED    = 1
+    DT_HASH      = 4
+    DT_STRTAB    = 5
+    DT_SYMTAB    = 6
+    DT_STRSZ     = 10
+    DT_SONAME    = 14
+    DT_RPATH     = 15
+    DT_DEBUG     = 21
+    DT_TEXTREL   = 22
+    DT_RUNPATH   = 29
+    DT_GNU_PRELINKED = 0x6ffffdf5
+    DT_GNU_HASH  = 0x6ffffef5
+
     def my_assert(self, expectation, result):
         if not expectation == result:
             #print "'%x','%x' %s" % (ord(expectation), ord(result), self.name)
@@ -28,7 +63,9 @@ class ELFFile:
     def __init__(self, name, bits = 0):
         self.name = name
         self.bits = bits
+        self.file = None
         self.objdump_output = {}
+        self.dynamic_info = None
 
     def open(self):
         self.file = file(self.name, "r")
@@ -65,6 +102,11 @@ class ELFFile:
         else:
             raise Exception("Unknown self.sex")
 
+    def close(self):
+        if self.file:
+            self.file.close()
+            self.file = None
+
     def osAbi(self):
         return ord(self.data[ELFFile.EI_OSABI])
 
@@ -89,6 +131,218 @@ class ELFFile:
         (a,) = struct.unpack(self.sex+"H", self.data[18:20])
         return a
 
+    def elfType(self):
+        import struct
+        (a,) = struct.unpack(self.sex+"H", self.data[16:18])
+        return a
+
+    def sectionHeaders(self):
+        """
+        List of (sh_type, sh_offset, sh_size, sh_link, sh_info, sh_entsize)
+        for each section header
+        """
+        import struct
+        # Offsets of e_shoff, e_shentsize and e_shnum in the ELF header, the
+        # format of the address sized fields and of a section header
+        if self.bits == 32:
+            (e_shoff, e_shentsize, e_shnum, addrfmt) = (32, 46, 48, "I")
+            shdrfmt = self.sex + "IIIIIIIIII"
+        else:
+            (e_shoff, e_shentsize, e_shnum, addrfmt) = (40, 58, 60, "Q")
+            shdrfmt = self.sex + "IIQQQQIIQQ"
+        addrfmt = self.sex + addrfmt
+        addrlen = struct.calcsize(addrfmt)
+        shdrlen = struct.calcsize(shdrfmt)
+
+        self.file.seek(0)
+        header = self.file.read(e_shnum + 2)
+        if len(header) < e_shnum + 2:
+            return []
+        (shoff,) = struct.unpack(addrfmt, header[e_shoff:e_shoff+addrlen])
+        (shentsize,) = struct.unpack(self.sex+"H", header[e_shentsize:e_shentsize+2])
+        (shnum,) = struct.unpack(self.sex+"H", header[e_shnum:e_shnum+2])
+        if not shoff or shentsize < shdrlen:
+            return []
+
+        self.file.seek(shoff)
+        if not shnum:
+            # More sections than fit e_shnum, the count is in the
+            # sh_size field of the first section header
+            first = self.file.read(shdrlen)
+            if len(first) < shdrlen:
+                return []
+            shnum = min(struct.unpack(shdrfmt, first)[5], 0x100000)
+            self.file.seek(shoff)
+
+        table = self.file.read(shnum * shentsize)
+        shdrs = []
+        for offset in xrange(0, len(table) - shentsize + 1, shentsize):
+            shdr = struct.unpack(shdrfmt, table[offset:offset+shdrlen])
+            shdrs.append((shdr[1], shdr[4], shdr[5], shdr[6], shdr[7], shdr[9]))
+        return shdrs
+
+    def readSection(self, shdr):
+        (sh_type, sh_offset, sh_size, sh_link, sh_info, sh_entsize) = shdr
+        self.file.seek(sh_offset)
+        return self.file.read(sh_size)
+
+    def isStripped(self):
+        """
+        Whether the file has no symbol table section, which is what
+        'file' reports as stripped
+        """
+        for shdr in self.sectionHeaders():
+            if shdr[0] == ELFFile.SHT_SYMTAB:
+                return False
+        return True
+
+    def flags(self):
+        import struct
+        self.file.seek(36 if self.bits == 32 else 48)
+        (a,) = struct.unpack(self.sex+"I", self.file.read(4))
+        return a
+
+    def programHeaders(self):
+        """
+        List of (p_type, p_offset, p_vaddr, p_filesz) for each program header
+        """
+        import struct
+        if self.bits == 32:
+            (e_phoff, e_phentsize, e_phnum, addrfmt) = (28, 42, 44, "I")
+            phdrfmt = self.sex + "IIII"
+            fields = (0, 1, 2, 3)
+        else:
+            (e_phoff, e_phentsize, e_phnum, addrfmt) = (32, 54, 56, "Q")
+            phdrfmt = self.sex + "IIQQQQ"
+            fields = (0, 2, 3, 5)
+        addrfmt = self.sex + addrfmt
+        addrlen = struct.calcsize(addrfmt)
+        phdrlen = struct.calcsize(phdrfmt)
+
+        self.file.seek(0)
+        header = self.file.read(e_phnum + 2)
+        if len(header) < e_phnum + 2:
+            return []
+        (phoff,) = struct.unpack(addrfmt, header[e_phoff:e_phoff+addrlen])
+        (phentsize,) = struct.unpack(self.sex+"H", header[e_phentsize:e_phentsize+2])
+        (phnum,) = struct.unpack(self.sex+"H", header[e_phnum:e_phnum+2])
+        if not phoff or phentsize < phdrlen:
+            return []
+
+        self.file.seek(phoff)
+        table = self.file.read(phnum * phentsize)
+        phdrs = []
+        for offset in xrange(0, len(table) - phentsize + 1, phentsize):
+            phdr = struct.unpack(phdrfmt, table[offset:offset+phdrlen])
+            phdrs.append(tuple(phdr[i] for i in fields))
+        return phdrs
+
+    def dynamicEntries(self):
+        """
+        The (tag, value) entries of the dynamic section, empty if there
+        is none
+        """
+        import struct
+
+        dynamic = [p for p in self.programHeaders() if p[0] == ELFFile.PT_DYNAMIC]
+        if not dynamic:
+            return []
+        (p_type, p_offset, p_vaddr, p_filesz) = dynamic[0]
+
+        dynfmt = self.sex + ("II" if self.bits == 32 else "QQ")
+        dynlen = struct.calcsize(dynfmt)
+        self.file.seek(p_offset)
+        table = self.file.read(p_filesz)
+        entries = []
+        for offset in xrange(0, len(table) - dynlen + 1, dynlen):
+            (tag, val) = struct.unpack(dynfmt, table[offset:offset+dynlen])
+            if tag == ELFFile.DT_NULL:
+                break
+            entries.append((tag, val))
+        return entries
+
+    def isPrelinked(self):
+        return ELFFile.DT_GNU_PRELINKED in [tag for (tag, val) in self.dynamicEntries()]
+
+    def readDynamic(self):
+        """
+        Read what the packaging QA and shlibs code use out of the dynamic
+        section, this is what they used to parse from 'objdump -p'
+        """
+        info = ELFFile.emptyDynamic()
+
+        phdrs = self.programHeaders()
+        entries = self.dynamicEntries()
+        if not entries:
+            return info
+
+        strtab = None
+        strsz = 0
+        for (tag, val) in entries:
+            if tag == ELFFile.DT_STRTAB:
+                strtab = val
+            elif tag == ELFFile.DT_STRSZ:
+                strsz = val
+            elif tag == ELFFile.DT_TEXTREL:
+                info["textrel"] = True
+            elif tag == ELFFile.DT_SYMTAB:
+                info["symtab"] = True
+            elif tag == ELFFile.DT_GNU_HASH:
+                info["gnu_hash"] = True
+
+        # The string table is found by its address, find where the
+        # segment loading it comes from in the file
+        strings = ""
+        if strtab is not None:
+            for (p_type, p_offset, p_vaddr, p_filesz) in phdrs:
+                if p_type == ELFFile.PT_LOAD and p_vaddr <= strtab < p_vaddr + p_filesz:
+                    self.file.seek(strtab - p_vaddr + p_offset)
+                    strings = self.file.read(min(strsz, p_vaddr + p_filesz - strtab))
+                    break
+
+        def string(val):
+            end = strings.find("\0", val)
+            if end < 0:
+                end = len(strings)
+            return strings[val:end]
+
+        names = {
+            ELFFile.DT_NEEDED : "needed",
+            ELFFile.DT_SONAME : "soname",
+            ELFFile.DT_RPATH : "rpath",
+            ELFFile.DT_RUNPATH : "runpath",
+        }
+        for (tag, val) in entries:
+            if tag in names:
+                info[names[tag]].append(string(val))
+        return info
+
+    def dynamic(self):
+        """
+        The contents of the dynamic section as returned by readDynamic(),
+        empty if the file cannot be parsed
+        """
+        if self.dynamic_info is None:
+            try:
+                self.dynamic_info = self.readDynamic()
+            except Exception as e:
+                import bb
+                bb.note("Reading the dynamic section of %s failed: %s" % (self.name, e))
+                self.dynamic_info = ELFFile.emptyDynamic()
+        return self.dynamic_info
+
+    @staticmethod
+    def emptyDynamic():
+        return {
+            "needed" : [],
+            "soname" : [],
+            "rpath" : [],
+            "runpath" : [],
+            "textrel" : False,
+            "symtab" : False,
+            "gnu_hash" : False,
+        }
+
     def run_objdump(self, cmd, d):
         import bb.process
         import sys
@@ -109,3 +363,112 @@ class ELFFile:
         except Exception as e:
             bb.note("%s %s %s failed: %s" % (objdump, cmd, self.name, e))
             return ""
+
+def elf_dynamic(path):
+    # Function to read the dynamic section of a single file, called from
+    # ELFInfo.update() through oe.utils.multiprocess_exec
+    #
+    # Returns (path, dynamic), dynamic is None if the file is not ELF
+    elf = ELFFile(path)
+    try:
+        elf.open()
+    except Exception:
+        elf.close()
+        return (path, None)
+    try:
+        return (path, elf.dynamic())
+    finally:
+        elf.close()
+
+class ELFInfo:
+    """
+    Cache of ELFFile.dynamic() for the files below root, so that
+    do_package and do_package_qa each parse a file only once. Entries
+    are kept by path relative to root and used only while the size and
+    modification time of the file stay the same.
+    """
+
+    def __init__(self, root, cachefile = None):
+        self.root = root
+        self.cachefile = cachefile
+        self.files = {}
+
+    def load(self):
+        import cPickle as pickle
+        try:
+            with open(self.cachefile, "rb") as f:
+                self.files = pickle.load(f)
+        except Exception:
+            self.files = {}
+
+    def save(self):
+        import cPickle as pickle
+        import os
+        tmpfile = self.cachefile + ".tmp"
+        with open(tmpfile, "wb") as f:
+            pickle.dump(self.files, f, pickle.HIGHEST_PROTOCOL)
+        os.rename(tmpfile, self.cachefile)
+
+    def _stamp(self, path):
+        import os
+        try:
+            s = os.stat(path)
+        except OSError:
+            return None
+        return (s.st_size, s.st_mtime)
+
+    def lookup(self, path):
+        """
+        (True, dynamic) if path is cached, dynamic being None for files
+        that are not ELF, (False, None) otherwise
+        """
+        import os
+        entry = self.files.get(os.path.relpath(path, self.root))
+        if entry and entry[0] == self._stamp(path):
+            return (True, entry[1])
+        return (False, None)
+
+    def store(self, path, dynamic):
+        import os
+        stamp = self._stamp(path)
+        if stamp:
+            self.files[os.path.relpath(path, self.root)] = (stamp, dynamic)
+
+    def update(self, paths):
+        """
+        Read the dynamic sections of the files in paths which are not
+        cached yet, in parallel
+        """
+        import oe.utils
+        missing = [path for path in paths if not self.lookup(path)[0]]
+        for (path, dynamic) in oe.utils.multiprocess_exec(missing, elf_dynamic):
+            self.store(path, dynamic)
+
+    def dynamic(self, path):
+        """
+        The dynamic section of path as returned by ELFFile.dynamic(), None
+        if the file is not ELF
+        """
+        (cached, dynamic) = self.lookup(path)
+        if not cached:
+            (path, dynamic) = elf_dynamic(path)
+            self.store(path, dynamic)
+        return dynamic
+
+    def open(self, path):
+        """
+        An opened ELFFile for path which uses the cached dynamic section,
+        None if the file is not ELF
+        """
+        (cached, dynamic) = self.lookup(path)
+        if cached and dynamic is None:
+            return None
+        elf = ELFFile(path)
+        try:
+            elf.open()
+        except Exception:
+            elf.close()
+            return None
+        if cached:
+            elf.dynamic_info = dynamic
+        return elf
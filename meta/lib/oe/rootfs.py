@@ -6,6 +6,7 @@ import oe.path
 import filecmp
 import shutil
 import os
+import stat
 import subprocess
 import re
 
@@ -581,6 +582,56 @@ class DpkgRootfs(Rootfs):
         pass
 
 
+def multilib_file_hashes(paths):
+    # Function to hash files installed into more than one of the multilib
+    # rootfs, called from OpkgRootfs._multilib_sanity_test() through
+    # oe.utils.multiprocess_exec
+    #
+    # Returns a list of (path, sha256, prelinked), prelinked being True for
+    # ELF files prelink has modified
+    import hashlib
+    import oe.qa
+
+    results = []
+    for path in paths:
+        sha256 = hashlib.sha256()
+        with open(path, "rb") as f:
+            data = f.read(1024 * 1024)
+            iself = data.startswith("\x7fELF")
+            while data:
+                sha256.update(data)
+                data = f.read(1024 * 1024)
+
+        prelinked = False
+        if iself:
+            elf = oe.qa.ELFFile(path)
+            try:
+                elf.open()
+                prelinked = elf.isPrelinked()
+            except Exception:
+                pass
+            finally:
+                elf.close()
+        results.append((path, sha256.hexdigest(), prelinked))
+    return results
+
+def multilib_unprelinked_hash(arg):
+    # Function to hash what a prelinked file looked like before prelink
+    # changed it, as 'prelink --verify' prints it
+    #
+    # Returns (path, sha256), sha256 is None if prelink failed
+    import hashlib
+
+    (path, root, prelink) = arg
+    try:
+        with open(os.devnull, "w") as devnull:
+            data = subprocess.check_output([prelink, "--root", root, "--verify",
+                                            os.path.join("/", os.path.relpath(path, root))],
+                                           stderr=devnull)
+    except (OSError, subprocess.CalledProcessError):
+        return (path, None)
+    return (path, hashlib.sha256(data).hexdigest())
+
 class OpkgRootfs(Rootfs):
     def __init__(self, d, manifest_dir):
         super(OpkgRootfs, self).__init__(d)
@@ -666,29 +717,96 @@ class OpkgRootfs(Rootfs):
         allow_rep = re.compile(re.sub("\|$", "", allow_replace))
         error_prompt = "Multilib check error:"
 
+        def file_stat(path):
+            if path not in stats:
+                try:
+                    stats[path] = os.stat(path)
+                except OSError:
+                    stats[path] = None
+            return stats[path]
+
+        # The paths installed into more than one rootfs, each one is
+        # compared with the same path in the rootfs before it
         files = {}
+        stats = {}
+        pairs = []
         for dir in dirs:
             for root, subfolders, subfiles in os.walk(dir):
+                relroot = os.path.normpath(os.path.join("/", os.path.relpath(root, dir)))
                 for file in subfiles:
                     item = os.path.join(root, file)
-                    key = str(os.path.join("/", os.path.relpath(item, dir)))
-
-                    valid = True
-                    if key in files:
-                        #check whether the file is allow to replace
-                        if allow_rep.match(key):
-                            valid = True
-                        else:
-                            if os.path.exists(files[key]) and \
-                               os.path.exists(item) and \
-                               not self._file_equal(key, files[key], item):
-                                valid = False
-                                bb.fatal("%s duplicate files %s %s is not the same\n" %
-                                         (error_prompt, item, files[key]))
-
-                    #pass the check, add to list
-                    if valid:
-                        files[key] = item
+                    key = str(os.path.join(relroot, file))
+
+                    #check whether the file is allow to replace
+                    if key in files and not allow_rep.match(key) and \
+                       file_stat(files[key]) and file_stat(item):
+                        pairs.append((key, files[key], item))
+
+                    files[key] = item
+
+        # Files which are the same by the shallow filecmp.cmp() check need no
+        # hashing, neither do files other than regular ones, which are left
+        # to _file_equal()
+        tohash = set()
+        for (key, f1, f2) in pairs:
+            s1 = stats[f1]
+            s2 = stats[f2]
+            if stat.S_ISREG(s1.st_mode) and stat.S_ISREG(s2.st_mode) and \
+               (s1.st_size, s1.st_mtime) != (s2.st_size, s2.st_mtime):
+                tohash.add(f1)
+                tohash.add(f2)
+
+        hashes = {}
+        prelinked = set()
+        tohash = sorted(tohash)
+        chunks = [tohash[i:i+500] for i in range(0, len(tohash), 500)]
+        for result in oe.utils.multiprocess_exec(chunks, multilib_file_hashes):
+            for (path, sha256, isprelinked) in result:
+                hashes[path] = sha256
+                if isprelinked:
+                    prelinked.add(path)
+
+        # Prelinked files are compared by what they were before prelinking,
+        # as 'prelink --verify' gives it
+        unprelinked = {}
+        if prelinked:
+            cmd_prelink = self.d.expand('${STAGING_DIR_NATIVE}${sbindir_native}/prelink')
+            args = []
+            for (key, f1, f2) in pairs:
+                if f1 in hashes and f2 in hashes and hashes[f1] != hashes[f2]:
+                    for f in (f1, f2):
+                        if f in prelinked:
+                            args.append((f, f[:-len(key)], cmd_prelink))
+            for (path, sha256) in oe.utils.multiprocess_exec(sorted(set(args)), multilib_unprelinked_hash):
+                unprelinked[path] = sha256
+            for path in hashes:
+                if path not in prelinked:
+                    unprelinked[path] = hashes[path]
+
+        errors = []
+        for (key, f1, f2) in pairs:
+            s1 = stats[f1]
+            s2 = stats[f2]
+            if not stat.S_ISREG(s1.st_mode) or not stat.S_ISREG(s2.st_mode):
+                equal = self._file_equal(key, f1, f2)
+            elif (s1.st_size, s1.st_mtime) == (s2.st_size, s2.st_mtime):
+                equal = True
+            elif hashes[f1] == hashes[f2]:
+                equal = True
+            elif f1 not in prelinked and f2 not in prelinked:
+                equal = False
+            elif unprelinked.get(f1) is None or unprelinked.get(f2) is None:
+                # prelink couldn't undo itself, prelink the other rootfs
+                # and compare again as well
+                equal = self._file_equal(key, f1, f2)
+            else:
+                equal = unprelinked[f1] == unprelinked[f2]
+            if not equal:
+                errors.append("%s duplicate files %s %s is not the same\n" %
+                              (error_prompt, f2, f1))
+
+        if errors:
+            bb.fatal("".join(errors))
 
     def _multilib_test_install(self, pkgs):
         ml_temp = self.d.getVar("MULTILIB_TEMP_ROOTFS", True)
@@ -0,0 +1,189 @@
+#
+# An index of the objects in SSTATE_DIR, so that finding which setscene
+# tasks can run doesn't need a stat() of every candidate object, which is
+# slow when SSTATE_DIR is shared over NFS.
+#
+# The index is a text file of records, one per line, naming objects and
+# directories by their path relative to SSTATE_DIR (which encodes the spec,
+# hash and task):
+#
+#   + <path> <mtime>    the object was present while its directory had
+#                       this mtime
+#   - <path>            the object was found to be missing
+#   = <dir> <mtime>     the directory held only the listed objects while it
+#                       had this mtime
+#
+# Adding or removing a file changes the mtime of its directory, so the index
+# is only trusted for directories whose mtime still matches, which takes a
+# stat() of each directory rather than of each object. Objects anywhere else
+# are looked for on disk.
+#
+# Records are only ever appended, under a lock, so readers can carry on from
+# where they stopped. The scan tool rewrites the index from scratch, with a
+# "=" record for every directory.
+#
+
+import os
+import bb
+
+class SStateIndex(object):
+    def __init__(self, path):
+        self.path = path
+        self.reset()
+
+    def reset(self):
+        self.objects = {}
+        self.dirs = {}
+        self.inode = None
+        self.offset = 0
+
+    def load(self):
+        """
+        Read any records added since the last call, starting over if the
+        index was rewritten
+        """
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            self.reset()
+            return
+        if st.st_ino != self.inode or st.st_size < self.offset:
+            self.reset()
+            self.inode = st.st_ino
+        if st.st_size == self.offset:
+            return
+
+        with open(self.path, "r") as f:
+            f.seek(self.offset)
+            data = f.read()
+        # Leave any partially written last line for next time
+        end = data.rfind("\n") + 1
+        self.offset += end
+        for line in data[:end].splitlines():
+            fields = line.split(" ")
+            if len(fields) == 3 and fields[0] == "+":
+                self.objects[fields[1]] = float(fields[2])
+            elif len(fields) == 2 and fields[0] == "-":
+                self.objects.pop(fields[1], None)
+            elif len(fields) == 3 and fields[0] == "=":
+                self.dirs[fields[1]] = float(fields[2])
+
+    def __contains__(self, path):
+        return path in self.objects
+
+    def lookup(self, path, mtime):
+        """
+        Return whether the object path is present given the current mtime
+        of its directory (None if there is no such directory), or None if
+        the index can't tell and the object has to be looked for on disk
+        """
+        if mtime is None:
+            return False
+        if path in self.objects:
+            if self.objects[path] == mtime:
+                return True
+        elif self.dirs.get(os.path.dirname(path)) == mtime:
+            return False
+        return None
+
+    def update(self, added=[], removed=[]):
+        """
+        Append records for objects added to and removed from SSTATE_DIR,
+        added being (path, mtime) pairs with the mtime of the object's
+        directory taken before the object was seen to be present
+        """
+        records = ["+ %s %r\n" % (p, m) for p, m in added] + ["- %s\n" % p for p in removed]
+        if not records:
+            return
+        bb.utils.mkdirhier(os.path.dirname(self.path))
+        lf = bb.utils.lockfile(self.path + ".lock")
+        try:
+            with open(self.path, "a") as f:
+                f.write("".join(records))
+        finally:
+            bb.utils.unlockfile(lf)
+
+    def rewrite(self, objects, dirs):
+        """
+        Replace the index with the objects and directories found by scan()
+        """
+        bb.utils.mkdirhier(os.path.dirname(self.path))
+        lf = bb.utils.lockfile(self.path + ".lock")
+        try:
+            tmp = self.path + ".tmp"
+            with open(tmp, "w") as f:
+                f.write("".join("= %s %r\n" % (p, dirs[p]) for p in sorted(dirs)))
+                f.write("".join("+ %s %r\n" % (p, objects[p]) for p in sorted(objects)))
+            os.rename(tmp, self.path)
+        finally:
+            bb.utils.unlockfile(lf)
+
+def dirmtime(path):
+    """
+    Return the mtime of the directory path or None if it doesn't exist
+    """
+    try:
+        return os.stat(path).st_mtime
+    except OSError:
+        return None
+
+# Indexes read by the cooker, kept so that a memory resident server only
+# reads the records added since the previous build
+_indexes = {}
+
+def get_index(d):
+    """
+    Return the up to date index configured by SSTATE_INDEX or None if the
+    index is disabled
+    """
+    path = d.getVar("SSTATE_INDEX", True)
+    if not path:
+        return None
+    if path not in _indexes:
+        _indexes[path] = SStateIndex(path)
+    index = _indexes[path]
+    index.load()
+    return index
+
+def update(d, added=[], removed=[]):
+    """
+    Record objects, given relative to SSTATE_DIR, being added to or removed
+    from SSTATE_DIR
+    """
+    path = d.getVar("SSTATE_INDEX", True)
+    if not path:
+        return
+    sstatedir = d.getVar("SSTATE_DIR", True)
+    records = []
+    for p in added:
+        sstatefile = os.path.join(sstatedir, p)
+        mtime = dirmtime(os.path.dirname(sstatefile))
+        if mtime is not None and os.path.exists(sstatefile):
+            records.append((p, mtime))
+    SStateIndex(path).update(records, removed)
+
+def scan(sstatedir):
+    """
+    Return the sstate objects in sstatedir and the directories holding them,
+    as dicts of their paths relative to sstatedir to the directory mtimes
+    """
+    objects = {}
+    dirs = {}
+    for root, _, _ in os.walk(sstatedir):
+        # Take the mtime before listing so later changes show up
+        mtime = dirmtime(root)
+        try:
+            names = os.listdir(root)
+        except OSError:
+            continue
+        reldir = os.path.relpath(root, sstatedir)
+        if reldir != ".":
+            dirs[reldir] = mtime
+        for name in names:
+            if not name.startswith("sstate:") or not (name.endswith(".tgz") or name.endswith(".tgz.siginfo")):
+                continue
+            path = os.path.join(root, name)
+            # Skip dangling symlinks to mirrored objects
+            if os.path.exists(path):
+                objects[os.path.normpath(os.path.join(reldir, name))] = mtime
+    return objects, dirs
@@ -0,0 +1,238 @@
+#
+# Check which sstate objects are available from SSTATE_MIRRORS.
+#
+# Checking one object at a time through bb.fetch2 runs a wget --spider
+# process per mirror url, each opening a new connection. Here many objects
+# are checked at once from a pool of threads, plain http(s) mirrors are
+# queried with HEAD requests over connections kept open per thread and the
+# answers are remembered for the rest of the build.
+#
+
+import os
+import time
+import socket
+import threading
+import Queue
+import httplib
+import urlparse
+import bb
+import bb.fetch2
+
+# Answers already found during this build, keyed on the mirror setup and object
+_results = {}
+_results_build = None
+_results_lock = threading.Lock()
+
+def cached_results(d):
+    """
+    Return the dictionary of answers for the current build, dropping those
+    from previous builds of a memory resident server
+    """
+    global _results, _results_build
+
+    build = d.getVar("BUILDSTART", True)
+    with _results_lock:
+        if build != _results_build:
+            _results = {}
+            _results_build = build
+        return _results
+
+class ConnectionPool(object):
+    """
+    HTTP connections kept open per thread and host so consecutive requests
+    to a mirror don't each pay for a new connection
+    """
+    def __init__(self, timeout):
+        self.timeout = timeout
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.all = []
+
+    def connection(self, scheme, netloc):
+        conns = self.local.__dict__.setdefault("conns", {})
+        conn = conns.get((scheme, netloc))
+        if conn is None:
+            if scheme == "https":
+                kwargs = {}
+                # Don't verify certificates, as the wget fetcher doesn't
+                import ssl
+                if hasattr(ssl, "_create_unverified_context"):
+                    kwargs["context"] = ssl._create_unverified_context()
+                conn = httplib.HTTPSConnection(netloc, timeout=self.timeout, **kwargs)
+            else:
+                conn = httplib.HTTPConnection(netloc, timeout=self.timeout)
+            conns[(scheme, netloc)] = conn
+            with self.lock:
+                self.all.append(conn)
+        return conn
+
+    def drop(self, scheme, netloc):
+        conn = self.local.conns.pop((scheme, netloc))
+        conn.close()
+
+    def head(self, url):
+        """
+        Return the HTTP status of a HEAD request for url or None if no
+        answer could be obtained
+        """
+        parsed = urlparse.urlsplit(url)
+        path = parsed.path or "/"
+        if parsed.query:
+            path = path + "?" + parsed.query
+        # A kept open connection may have been closed by the server meanwhile
+        for attempt in range(2):
+            conn = self.connection(parsed.scheme, parsed.netloc)
+            try:
+                conn.request("HEAD", path)
+                response = conn.getresponse()
+                response.read()
+            except (httplib.HTTPException, socket.error):
+                self.drop(parsed.scheme, parsed.netloc)
+                continue
+            if response.will_close:
+                self.drop(parsed.scheme, parsed.netloc)
+            return response.status
+        return None
+
+    def close(self):
+        with self.lock:
+            for conn in self.all:
+                conn.close()
+            self.all = []
+
+class MirrorStats(object):
+    def __init__(self):
+        self.checked = 0
+        self.found = 0
+        self.elapsed = 0.0
+
+class MirrorProbe(object):
+    """
+    Check sstate objects against the mirrors in the PREMIRRORS of d, which
+    should be set up as for fetching from SSTATE_MIRRORS
+    """
+    def __init__(self, d, numthreads, timeout=30):
+        self.d = d
+        self.mirrors = bb.fetch2.mirror_from_string(d.getVar("PREMIRRORS", True))
+        self.numthreads = max(1, numthreads)
+        self.pool = ConnectionPool(timeout)
+        self.local = threading.local()
+        self.stats = {}
+        self.statslock = threading.Lock()
+        self.nonetwork = (d.getVar("BB_NO_NETWORK", True) == "1")
+
+    def localdata(self):
+        # The fetcher code may set variables, so each thread has its own copy
+        if not hasattr(self.local, "d"):
+            self.local.d = bb.data.createCopy(self.d)
+        return self.local.d
+
+    def proxied(self, scheme):
+        for var in (scheme + "_proxy", "all_proxy"):
+            for name in (var, var.upper()):
+                if self.d.getVar(name, True) or os.environ.get(name):
+                    return True
+        return False
+
+    def record(self, ud, found, elapsed):
+        mirror = "%s://%s" % (ud.type, ud.host)
+        with self.statslock:
+            stats = self.stats.setdefault(mirror, MirrorStats())
+            stats.checked += 1
+            stats.elapsed += elapsed
+            if found:
+                stats.found += 1
+
+    def check_url(self, ud, d):
+        """
+        Return True if the mirror url of ud exists
+        """
+        if ud.type in ("http", "https") and not self.nonetwork and not self.proxied(ud.type):
+            status = self.pool.head(ud.url.split(";")[0])
+            if status == 200:
+                return True
+            if status in (404, 410):
+                return False
+            # Let the fetcher deal with redirects, authentication and errors
+        try:
+            return bool(ud.method.checkstatus(ud, d))
+        except Exception as e:
+            bb.debug(2, "SState: mirror check of %s failed: %s" % (ud.url, str(e)))
+            return False
+
+    def check(self, sstatefile):
+        """
+        Return True if sstatefile, relative to SSTATE_DIR, is available from
+        any of the mirrors
+        """
+        d = self.localdata()
+        try:
+            origud = bb.fetch2.FetchData("file://" + sstatefile, d)
+            uris, uds = bb.fetch2.build_mirroruris(origud, self.mirrors, d)
+        except bb.fetch2.BBFetchException as e:
+            bb.debug(2, "SState: unable to build mirror urls for %s: %s" % (sstatefile, str(e)))
+            return False
+        for ud in uds:
+            start = time.time()
+            found = self.check_url(ud, d)
+            self.record(ud, found, time.time() - start)
+            if found:
+                bb.debug(2, "SState: Successful fetch test for %s" % ud.url)
+                return True
+        bb.debug(2, "SState: Unsuccessful fetch test for %s" % sstatefile)
+        return False
+
+    def check_all(self, sstatefiles):
+        """
+        Check each of sstatefiles using the thread pool and return the set
+        of those which are available
+        """
+        pending = Queue.Queue()
+        for sstatefile in sstatefiles:
+            pending.put(sstatefile)
+        found = set()
+
+        def probe_worker():
+            while True:
+                try:
+                    sstatefile = pending.get_nowait()
+                except Queue.Empty:
+                    return
+                if self.check(sstatefile):
+                    found.add(sstatefile)
+
+        threads = [threading.Thread(target=probe_worker) for i in range(min(self.numthreads, len(sstatefiles)))]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.pool.close()
+        return found
+
+    def report(self):
+        for mirror in sorted(self.stats):
+            stats = self.stats[mirror]
+            bb.note("SState mirror %s: %d of %d objects found, %.2fs spent checking (%.1fms per object)" %
+                    (mirror, stats.found, stats.checked, stats.elapsed, stats.elapsed * 1000 / stats.checked))
+
+def check_mirrors(d, sstatefiles):
+    """
+    Return the set of sstatefiles available from the mirrors, set up in d as
+    for fetching from SSTATE_MIRRORS, reusing answers from earlier in the
+    build
+    """
+    results = cached_results(d)
+    key = (d.getVar("PREMIRRORS", True), d.getVar("BB_NO_NETWORK", True))
+    unknown = [f for f in sstatefiles if (key, f) not in results]
+
+    if unknown:
+        numthreads = int(d.getVar("SSTATE_MIRROR_PROBE_THREADS", True) or 1)
+        probe = MirrorProbe(d, numthreads)
+        start = time.time()
+        found = probe.check_all(unknown)
+        bb.debug(1, "SState: checked %d objects against the mirrors in %.2fs" % (len(unknown), time.time() - start))
+        probe.report()
+        for f in unknown:
+            results[(key, f)] = f in found
+
+    return set(f for f in sstatefiles if results[(key, f)])
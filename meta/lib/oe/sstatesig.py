@@ -105,6 +105,26 @@ class SignatureGeneratorOEBasicHash(bb.siggen.SignatureGeneratorBasicHash):
         coredata, self.lockedpnmap, self.lockedhashfn = data
         super(bb.siggen.SignatureGeneratorBasicHash, self).set_taskdata(coredata)
 
+    def get_taskstate(self, fn, task):
+        state = super(bb.siggen.SignatureGeneratorBasicHash, self).get_taskstate(fn, task)
+        k = fn + "." + task
+        recipename = self.lockedpnmap[fn]
+        msgs = []
+        if k in self.lockedhashes:
+            prefix = 'The %s:%s sig (' % (recipename, task)
+            msgs = [msg for msg in self.mismatch_msgs if msg.startswith(prefix)]
+        return (state, recipename, self.lockedhashfn[fn], self.lockedhashes.get(k), msgs)
+
+    def set_taskstate(self, fn, task, state):
+        coredata, recipename, hashfn, h_locked, msgs = state
+        super(bb.siggen.SignatureGeneratorBasicHash, self).set_taskstate(fn, task, coredata)
+        k = fn + "." + task
+        self.lockedpnmap[fn] = recipename
+        self.lockedhashfn[fn] = hashfn
+        if h_locked:
+            self.lockedhashes[k] = h_locked
+        self.mismatch_msgs.extend(msgs)
+
     def dump_sigs(self, dataCache, options):
         self.dump_lockedsigs()
         return super(bb.siggen.SignatureGeneratorBasicHash, self).dump_sigs(dataCache, options)
@@ -0,0 +1,204 @@
+import os
+import shutil
+import subprocess
+import tempfile
+import unittest
+
+class ELFTestCase(unittest.TestCase):
+    SOURCE = "int value = 1;\nint get(void) { return value; }\nint main(void) { return get(); }\n"
+
+    def setUp(self):
+        try:
+            import bb
+        except ImportError:
+            self.skipTest("Cannot import bb")
+        self.tempdir = tempfile.mkdtemp()
+        self.source = os.path.join(self.tempdir, "test.c")
+        with open(self.source, "w") as f:
+            f.write(self.SOURCE)
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def build(self, name, flags, strip=False):
+        path = os.path.join(self.tempdir, name)
+        try:
+            subprocess.check_call(["gcc"] + flags + ["-o", path, self.source])
+            if strip:
+                subprocess.check_call(["strip", path])
+        except (OSError, subprocess.CalledProcessError):
+            self.skipTest("Cannot build test binaries")
+        return path
+
+class TestIsElf(ELFTestCase):
+    def check(self, path, expected):
+        from oe.package import is_elf
+        self.assertEqual(is_elf(path), expected)
+
+    def test_object(self):
+        self.check(self.build("test.o", ["-c"]), 1)
+        self.check(self.build("test-stripped.o", ["-c"], strip=True), 1 | 2)
+
+    def test_executable(self):
+        self.check(self.build("test", ["-no-pie", "-fno-pie"]), 1 | 4)
+        self.check(self.build("test-stripped", ["-no-pie", "-fno-pie"], strip=True), 1 | 2 | 4)
+
+    def test_shared(self):
+        self.check(self.build("libtest.so", ["-shared", "-fPIC"]), 1 | 8)
+        self.check(self.build("libtest-stripped.so", ["-shared", "-fPIC"], strip=True), 1 | 2 | 8)
+        # Position independent executables are shared objects to 'file' too
+        self.check(self.build("test-pie", ["-pie", "-fPIE"]), 1 | 8)
+
+    def test_not_elf(self):
+        self.check(self.source, 0)
+        self.check(os.path.join(self.tempdir, "missing"), 0)
+        truncated = os.path.join(self.tempdir, "truncated")
+        with open(truncated, "wb") as f:
+            f.write(b"\x7fELF\x02\x01")
+        self.check(truncated, 0)
+
+    def test_missing_section_headers(self):
+        path = self.build("test-truncated", ["-no-pie", "-fno-pie"])
+        # Only the ELF header is left, there is no symbol table to be found
+        # so the file counts as stripped
+        with open(path, "r+b") as f:
+            f.truncate(64)
+        self.check(path, 1 | 2 | 4)
+
+class TestDynamic(ELFTestCase):
+    def dynamic(self, path):
+        import oe.qa
+        elf = oe.qa.ELFFile(path)
+        elf.open()
+        try:
+            return elf.dynamic()
+        finally:
+            elf.close()
+
+    def test_library(self):
+        path = self.build("libtest.so", ["-shared", "-fPIC", "-Wl,-soname,libtest.so.1",
+                                         "-Wl,--disable-new-dtags", "-Wl,-rpath,/opt/lib:$ORIGIN",
+                                         "-Wl,--hash-style=gnu", "-Wl,--no-as-needed", "-lm"])
+        dynamic = self.dynamic(path)
+        self.assertEqual(dynamic["soname"], ["libtest.so.1"])
+        self.assertEqual(dynamic["rpath"], ["/opt/lib:$ORIGIN"])
+        self.assertEqual(dynamic["runpath"], [])
+        self.assertTrue([n for n in dynamic["needed"] if n.startswith("libm.so")])
+        self.assertTrue(dynamic["symtab"])
+        self.assertTrue(dynamic["gnu_hash"])
+        self.assertFalse(dynamic["textrel"])
+
+    def test_executable(self):
+        path = self.build("test", ["-Wl,--enable-new-dtags", "-Wl,-rpath,/opt/lib",
+                                   "-Wl,--hash-style=sysv"])
+        dynamic = self.dynamic(path)
+        self.assertEqual(dynamic["soname"], [])
+        self.assertEqual(dynamic["rpath"], [])
+        self.assertEqual(dynamic["runpath"], ["/opt/lib"])
+        self.assertFalse(dynamic["gnu_hash"])
+
+    def test_object(self):
+        import oe.qa
+        self.assertEqual(self.dynamic(self.build("test.o", ["-c"])), oe.qa.ELFFile.emptyDynamic())
+
+    def test_cache(self):
+        import oe.qa
+        library = self.build("libtest.so", ["-shared", "-fPIC", "-Wl,-soname,libtest.so.1"])
+        cachefile = os.path.join(self.tempdir, "cache")
+
+        elfinfo = oe.qa.ELFInfo(self.tempdir, cachefile)
+        elfinfo.update([library, self.source])
+        elfinfo.save()
+
+        elfinfo = oe.qa.ELFInfo(self.tempdir, cachefile)
+        elfinfo.load()
+        self.assertEqual(elfinfo.lookup(self.source), (True, None))
+        (cached, dynamic) = elfinfo.lookup(library)
+        self.assertTrue(cached)
+        self.assertEqual(dynamic["soname"], ["libtest.so.1"])
+        self.assertIsNone(elfinfo.open(self.source))
+        elf = elfinfo.open(library)
+        self.assertIs(elf.dynamic(), dynamic)
+        elf.close()
+
+        # Changed files are read again
+        os.utime(library, (0, 0))
+        self.assertEqual(elfinfo.lookup(library), (False, None))
+        self.assertEqual(elfinfo.dynamic(library)["soname"], ["libtest.so.1"])
+        self.assertTrue(elfinfo.lookup(library)[0])
+
+class TestFiledeps(ELFTestCase):
+    def filedeps(self, path):
+        from oe.package import filedeps
+        return filedeps(path)
+
+    def test_library(self):
+        script = os.path.join(self.tempdir, "test.map")
+        with open(script, "w") as f:
+            f.write("TEST_1 { global: get; local: *; };\n")
+        path = self.build("libtest.so", ["-shared", "-fPIC", "-Wl,-soname,libtest.so.1",
+                                         "-Wl,--version-script," + script,
+                                         "-Wl,--hash-style=gnu", "-Wl,--no-as-needed", "-lm"])
+        provides, requires = self.filedeps(path)
+        self.assertEqual(provides, set(["libtest.so.1()(64bit)", "libtest.so.1(TEST_1)(64bit)"]))
+        # Libraries aren't usually executable, only executable files get
+        # requires on other libraries
+        os.chmod(path, 0o644)
+        self.assertEqual(self.filedeps(path), (provides, set(["rtld(GNU_HASH)"])))
+        os.chmod(path, 0o755)
+        provides, requires = self.filedeps(path)
+        self.assertIn("rtld(GNU_HASH)", requires)
+        self.assertTrue([r for r in requires if r.startswith("libm.so.6()")])
+
+    def test_plugin(self):
+        path = self.build("plugin.so", ["-shared", "-fPIC", "-Wl,--hash-style=both"])
+        provides, requires = self.filedeps(path)
+        self.assertEqual(provides, set(["plugin.so()(64bit)"]))
+        self.assertNotIn("rtld(GNU_HASH)", requires)
+
+    def test_executable(self):
+        path = self.build("test", ["-Wl,--hash-style=gnu"])
+        provides, requires = self.filedeps(path)
+        self.assertEqual(provides, set())
+        self.assertIn("libc.so.6()(64bit)", requires)
+        self.assertTrue([r for r in requires if r.startswith("libc.so.6(GLIBC_")])
+
+    def test_script(self):
+        path = os.path.join(self.tempdir, "script")
+        with open(path, "w") as f:
+            f.write("#!/bin/sh -e\necho\n")
+        os.chmod(path, 0o644)
+        self.assertEqual(self.filedeps(path), (set(), set()))
+        os.chmod(path, 0o755)
+        self.assertEqual(self.filedeps(path), (set(), set(["/bin/sh"])))
+        # rpm ignores a last line without a newline
+        with open(path, "w") as f:
+            f.write("#!/bin/sh")
+        self.assertEqual(self.filedeps(path), (set(), set()))
+
+    def test_helpers(self):
+        for name, contents in (("lib.pm", "1;\n"), ("libfoo.la", "# libfoo.la\n"),
+                               ("tool", "#!/usr/bin/env perl\nprint;\n"),
+                               ("module", "#!/usr/bin/python\nimport os\n")):
+            path = os.path.join(self.tempdir, name)
+            with open(path, "w") as f:
+                f.write(contents)
+            os.chmod(path, 0o755)
+            self.assertIsNone(self.filedeps(path), name)
+
+    def test_filedepscanner(self):
+        from oe.package import filedepscanner
+        pkgdir = os.path.join(self.tempdir, "pkg")
+        bindir = os.path.join(pkgdir, "usr", "bin")
+        os.makedirs(bindir)
+        for name in ("b", "a", "with space"):
+            path = os.path.join(bindir, name)
+            with open(path, "w") as f:
+                f.write("#!/bin/sh\n")
+            os.chmod(path, 0o755)
+        os.symlink("a", os.path.join(bindir, "c"))
+        files = [os.path.join(bindir, name) for name in ("b", "a", "c", "with space")]
+        pkg, provides, requires = filedepscanner(("pkg", files, "false", self.tempdir))
+        self.assertEqual(pkg, "pkg")
+        self.assertEqual(provides, {})
+        self.assertEqual(requires, {"/usr/bin/a": ["/bin/sh"], "/usr/bin/b": ["/bin/sh"]})
@@ -0,0 +1,154 @@
+import os
+import shutil
+import StringIO
+import tarfile
+import tempfile
+import unittest
+
+def tar_gz(files):
+    data = StringIO.StringIO()
+    tar = tarfile.open(fileobj=data, mode="w:gz")
+    for name, contents in files:
+        info = tarfile.TarInfo(name)
+        if contents is None:
+            info.type = tarfile.DIRTYPE
+            tar.addfile(info)
+        else:
+            info.size = len(contents)
+            tar.addfile(info, StringIO.StringIO(contents))
+    tar.close()
+    return data.getvalue()
+
+def write_ipk(path, control, files):
+    members = [("debian-binary", "2.0\n"),
+               ("control.tar.gz", tar_gz([("./control", control)])),
+               ("data.tar.gz", tar_gz([("./", None)] + [("./" + f, "") for f in files]))]
+    with open(path, "wb") as f:
+        f.write("!<arch>\n")
+        for name, data in members:
+            f.write("%-16s%-12d%-6d%-6d%-8s%-10d`\n" % (name + "/", 0, 0, 0, "100644", len(data)))
+            f.write(data)
+            if len(data) % 2:
+                f.write("\n")
+
+def control(package, version, description="Test package\n more text"):
+    return ("Package: %s\nVersion: %s\nArchitecture: core2-64\n"
+            "Description: %s\nLicense: MIT\n" % (package, version, description))
+
+class TestOpkgIndex(unittest.TestCase):
+    def setUp(self):
+        try:
+            import bb
+        except ImportError:
+            self.skipTest("Cannot import bb")
+        self.tempdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def index(self):
+        from oe.package_manager import opkg_index
+        self.assertIsNone(opkg_index(self.tempdir))
+        with open(os.path.join(self.tempdir, "Packages")) as f:
+            return f.read()
+
+    def test_index(self):
+        write_ipk(os.path.join(self.tempdir, "foo_1.0-r0_core2-64.ipk"),
+                  control("foo", "1.0-r0"), ["usr/bin/foo"])
+        write_ipk(os.path.join(self.tempdir, "foo_1.10-r0_core2-64.ipk"),
+                  control("foo", "1.10-r0"), ["usr/bin/foo", "usr/bin/foo2"])
+        write_ipk(os.path.join(self.tempdir, "bar_2.0-r0_core2-64.ipk"),
+                  control("bar", "2.0-r0"), ["usr/bin/foo"])
+        packages = self.index()
+
+        # Only the newest foo is listed, after bar, the older one is moved
+        # aside
+        stanzas = packages.rstrip("\n").split("\n\n")
+        self.assertEqual(len(stanzas), 2)
+        self.assertTrue(stanzas[0].startswith("Package: bar\n"))
+        self.assertTrue(stanzas[1].startswith("Package: foo\nVersion: 1.10-r0\n"))
+        self.assertTrue(stanzas[1].endswith("\nFilename: foo_1.10-r0_core2-64.ipk\n"
+                                            "Description: Test package\n more text\nLicense: MIT"))
+        self.assertIn("\nMD5Sum: ", stanzas[1])
+        self.assertIn("\nSize: %d\n" % os.path.getsize(os.path.join(self.tempdir, "foo_1.10-r0_core2-64.ipk")),
+                      stanzas[1])
+        self.assertTrue(os.path.exists(os.path.join(self.tempdir, "Packages.gz")))
+        self.assertFalse(os.path.exists(os.path.join(self.tempdir, "foo_1.0-r0_core2-64.ipk")))
+        self.assertTrue(os.path.exists(os.path.join(self.tempdir, "morgue", "foo_1.0-r0_core2-64.ipk")))
+        self.assertEqual(self.index(), packages)
+
+    def test_tar_format(self):
+        # opkg-build may create an .ipk as a gzip compressed tar archive
+        path = os.path.join(self.tempdir, "foo_1.0-r0_core2-64.ipk")
+        with open(path, "wb") as f:
+            f.write(tar_gz([("./debian-binary", "2.0\n"),
+                            ("./control.tar.gz", tar_gz([("./control", control("foo", "1.0-r0"))])),
+                            ("./data.tar.gz", "not a tar archive, never read")]))
+        self.assertTrue(self.index().startswith("Package: foo\nVersion: 1.0-r0\n"))
+
+    def test_incremental(self):
+        import oe.package_manager
+        foo = os.path.join(self.tempdir, "foo_1.0-r0_core2-64.ipk")
+        write_ipk(foo, control("foo", "1.0-r0"), [])
+        write_ipk(os.path.join(self.tempdir, "bar_1.0-r0_core2-64.ipk"), control("bar", "1.0-r0"), [])
+        first = self.index()
+
+        reads = []
+        def read(path, entry):
+            reads.append(os.path.basename(path))
+            return real_read(path, entry)
+        cache = oe.package_manager.PackageIndexCache(self.tempdir)
+        cache.load()
+        real_read = lambda path, entry: cache.entries[os.path.basename(path)]["data"]
+        filenames = sorted(cache.entries)
+
+        # Nothing is read again while the packages stay the same, or if only
+        # their modification time changes
+        self.assertEqual(cache.update(filenames, read), 0)
+        os.utime(foo, (0, 0))
+        self.assertEqual(cache.update(filenames, read), 0)
+        self.assertEqual(reads, [])
+        self.assertEqual(self.index(), first)
+
+        # Rebuilt and removed packages are noticed
+        write_ipk(foo, control("foo", "1.0-r0", "Rebuilt"), [])
+        os.unlink(os.path.join(self.tempdir, "bar_1.0-r0_core2-64.ipk"))
+        packages = self.index()
+        self.assertNotIn("Package: bar", packages)
+        self.assertIn("Description: Rebuilt\n", packages)
+
+class TestDpkgIndex(unittest.TestCase):
+    def setUp(self):
+        try:
+            import bb
+        except ImportError:
+            self.skipTest("Cannot import bb")
+        self.tempdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def test_index(self):
+        import subprocess
+        from oe.package_manager import dpkg_index
+        pkgdir = os.path.join(self.tempdir, "foo")
+        os.makedirs(os.path.join(pkgdir, "DEBIAN"))
+        with open(os.path.join(pkgdir, "DEBIAN", "control"), "w") as f:
+            f.write("Package: foo\nVersion: 1.0-r0\nArchitecture: amd64\n"
+                    "Maintainer: Nobody <nobody@example.com>\nDescription: Test package\n")
+        archdir = os.path.join(self.tempdir, "core2-64")
+        os.makedirs(archdir)
+        deb = os.path.join(archdir, "foo_1.0-r0_amd64.deb")
+        try:
+            subprocess.check_output(["dpkg-deb", "-Zxz", "--build", pkgdir, deb], stderr=subprocess.STDOUT)
+        except (OSError, subprocess.CalledProcessError):
+            self.skipTest("Cannot build test package")
+
+        self.assertIsNone(dpkg_index((archdir, "true", "core2-64")))
+        with open(os.path.join(archdir, "Packages")) as f:
+            packages = f.read()
+        self.assertTrue(packages.startswith("Package: foo\nVersion: 1.0-r0\n"))
+        self.assertIn("\nFilename: ./foo_1.0-r0_amd64.deb\nSize: %d\n" % os.path.getsize(deb), packages)
+        self.assertIn("\nSHA256: ", packages)
+        with open(os.path.join(archdir, "Release")) as f:
+            self.assertEqual(f.read(), "Label: core2-64\n")
@@ -0,0 +1,72 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+class TestMultilibSanity(unittest.TestCase):
+    def setUp(self):
+        try:
+            import bb
+        except ImportError:
+            self.skipTest("Cannot import bb")
+        self.tempdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def rootfs(self, name, files):
+        root = os.path.join(self.tempdir, name)
+        for path, (contents, mtime) in files.items():
+            path = os.path.join(root, path)
+            if not os.path.isdir(os.path.dirname(path)):
+                os.makedirs(os.path.dirname(path))
+            with open(path, "w") as f:
+                f.write(contents)
+            os.utime(path, (mtime, mtime))
+        return root
+
+    def check(self, dirs, allow="/usr/lib/opkg"):
+        import bb.data
+        from oe.rootfs import OpkgRootfs
+        rootfs = OpkgRootfs.__new__(OpkgRootfs)
+        rootfs.d = bb.data.init()
+        rootfs.image_rootfs = dirs[0]
+        rootfs.d.setVar("MULTILIBRE_ALLOW_REP", allow)
+        rootfs._multilib_sanity_test(dirs)
+
+    def test_same(self):
+        dirs = [self.rootfs("image", {"etc/a": ("a", 1), "etc/b": ("b", 1)}),
+                self.rootfs("lib32", {"etc/a": ("a", 1), "etc/c": ("c", 1)}),
+                self.rootfs("libx32", {"etc/a": ("a", 2), "etc/b": ("b", 3)})]
+        self.check(dirs)
+
+    def test_conflict(self):
+        import bb
+        dirs = [self.rootfs("image", {"etc/a": ("a", 1), "usr/include/b.h": ("b", 1)}),
+                self.rootfs("lib32", {"etc/a": ("a", 1), "usr/include/b.h": ("c", 2)})]
+        self.assertRaises(bb.BBHandledException, self.check, dirs)
+        # The paths MULTILIBRE_ALLOW_REP matches may differ
+        self.check(dirs, "/usr/include/.*|/usr/lib/opkg")
+
+    def test_same_stat(self):
+        # As with filecmp.cmp(), files of the same size and modification time
+        # are taken to be the same
+        dirs = [self.rootfs("image", {"etc/a": ("a", 1)}),
+                self.rootfs("lib32", {"etc/a": ("b", 1)})]
+        self.check(dirs)
+
+    def test_file_hash(self):
+        import hashlib
+        import subprocess
+        from oe.rootfs import multilib_file_hashes
+        source = os.path.join(self.tempdir, "test.c")
+        with open(source, "w") as f:
+            f.write("int main(void) { return 0; }\n")
+        self.assertEqual(multilib_file_hashes([source]),
+                         [(source, hashlib.sha256(open(source).read()).hexdigest(), False)])
+        binary = os.path.join(self.tempdir, "test")
+        try:
+            subprocess.check_call(["gcc", "-o", binary, source])
+        except (OSError, subprocess.CalledProcessError):
+            self.skipTest("Cannot build test binaries")
+        self.assertFalse(multilib_file_hashes([binary])[0][2])
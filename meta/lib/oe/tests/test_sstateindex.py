@@ -0,0 +1,85 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+class TestSStateIndex(unittest.TestCase):
+    def setUp(self):
+        try:
+            import bb
+        except ImportError:
+            self.skipTest("Cannot import bb")
+        self.tempdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tempdir, "sstate-index")
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def test_incremental(self):
+        from oe.sstateindex import SStateIndex
+        index = SStateIndex(self.path)
+        index.load()
+        self.assertFalse("a" in index)
+
+        writer = SStateIndex(self.path)
+        writer.update([("a", 1.5), ("b", 2.25)])
+        index.load()
+        self.assertTrue("a" in index)
+        self.assertEqual(index.objects["b"], 2.25)
+
+        writer.update([("c", 3.0)], ["a"])
+        with open(self.path, "a") as f:
+            f.write("+ d 4.0")
+        index.load()
+        self.assertEqual(set(index.objects), set(["b", "c"]))
+
+        with open(self.path, "a") as f:
+            f.write("\n")
+        index.load()
+        self.assertEqual(set(index.objects), set(["b", "c", "d"]))
+
+    def test_rewrite(self):
+        from oe.sstateindex import SStateIndex
+        index = SStateIndex(self.path)
+        index.update([("ab/a", 1.0), ("ab/b", 1.0)])
+        index.load()
+        SStateIndex(self.path).rewrite({"cd/c": 2.0}, {"ab": 3.0, "cd": 2.0})
+        index.load()
+        self.assertEqual(index.objects, {"cd/c": 2.0})
+        self.assertEqual(index.dirs, {"ab": 3.0, "cd": 2.0})
+
+    def test_lookup(self):
+        from oe.sstateindex import SStateIndex
+        index = SStateIndex(self.path)
+        index.update([("ab/a", 1.0), ("cd/c", 2.0)])
+        index.load()
+        self.assertTrue(index.lookup("ab/a", 1.0))
+        # The directory changed, the object may have been removed
+        self.assertEqual(index.lookup("ab/a", 5.0), None)
+        self.assertEqual(index.lookup("ab/b", 1.0), None)
+        self.assertFalse(index.lookup("ab/a", None))
+
+        SStateIndex(self.path).rewrite({"ab/a": 1.0}, {"ab": 1.0, "cd": 2.0})
+        index.load()
+        self.assertFalse(index.lookup("ab/b", 1.0))
+        self.assertFalse(index.lookup("cd/c", 2.0))
+        # Objects copied in change the directory and are looked for
+        self.assertEqual(index.lookup("ab/b", 6.0), None)
+        self.assertEqual(index.lookup("ef/e", 7.0), None)
+
+    def test_scan(self):
+        import oe.sstateindex
+        names = ["ab/sstate:foo::1.0:r0::3:ab12_populate_sysroot.tgz",
+                 "ab/sstate:foo::1.0:r0::3:ab12_populate_sysroot.tgz.siginfo",
+                 "native/cd/sstate:bar::1.0:r0::3:cd34_populate_lic.tgz"]
+        for name in names + ["ab/sstate:foo::1.0:r0::3:ab12_populate_sysroot.tgz.done"]:
+            path = os.path.join(self.tempdir, name)
+            if not os.path.exists(os.path.dirname(path)):
+                os.makedirs(os.path.dirname(path))
+            open(path, "w").close()
+        os.symlink("/nonexistent", os.path.join(self.tempdir, "ab", "sstate:baz::1.0:r0::3:ab56_package.tgz"))
+        objects, dirs = oe.sstateindex.scan(self.tempdir)
+        self.assertEqual(sorted(objects), sorted(names))
+        self.assertEqual(sorted(dirs), ["ab", "native", "native/cd"])
+        for name in names:
+            self.assertEqual(objects[name], os.stat(os.path.dirname(os.path.join(self.tempdir, name))).st_mtime)
@@ -0,0 +1,115 @@
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+import urllib
+import SocketServer
+import SimpleHTTPServer
+
+class MirrorRequestHandler(SimpleHTTPServer.SimpleHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Buffer the response so it isn't delayed by Nagle's algorithm
+    wbufsize = -1
+
+    def setup(self):
+        SimpleHTTPServer.SimpleHTTPRequestHandler.setup(self)
+        with self.server.lock:
+            self.server.connections += 1
+
+    def translate_path(self, path):
+        return os.path.join(self.server.rootdir, urllib.unquote(path).lstrip("/"))
+
+    def do_HEAD(self):
+        with self.server.lock:
+            self.server.requests += 1
+        SimpleHTTPServer.SimpleHTTPRequestHandler.do_HEAD(self)
+
+    def send_error(self, code, message=None):
+        # Keep the connection open as a real mirror would
+        self.send_response(code, message)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+class MirrorServer(SocketServer.ThreadingMixIn, SocketServer.TCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, rootdir):
+        SocketServer.TCPServer.__init__(self, ("127.0.0.1", 0), MirrorRequestHandler)
+        self.rootdir = rootdir
+        self.lock = threading.Lock()
+        self.connections = 0
+        self.requests = 0
+
+class TestMirrorProbe(unittest.TestCase):
+    def setUp(self):
+        try:
+            import bb
+        except ImportError:
+            self.skipTest("Cannot import bb")
+
+        self.tempdir = tempfile.mkdtemp()
+        self.sstatedir = os.path.join(self.tempdir, "sstate-cache")
+        self.mirrordir = os.path.join(self.tempdir, "mirror")
+        self.objects = ["%02x/sstate:foo%d::1.0:r0::3:%032x_populate_sysroot.tgz" % (i, i, i) for i in range(40)]
+        for obj in self.objects[::2]:
+            path = os.path.join(self.mirrordir, obj)
+            bb.utils.mkdirhier(os.path.dirname(path))
+            open(path, "w").close()
+        os.makedirs(self.sstatedir)
+
+        self.server = MirrorServer(self.mirrordir)
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.thread.join()
+        self.server.server_close()
+        shutil.rmtree(self.tempdir)
+
+    def datastore(self, mirrors):
+        import bb
+        d = bb.data.init()
+        d.setVar("DL_DIR", self.sstatedir)
+        d.setVar("FILESPATH", self.sstatedir)
+        d.setVar("PREMIRRORS", mirrors)
+        d.setVar("BUILDSTART", "1")
+        d.setVar("SSTATE_MIRROR_PROBE_THREADS", "4")
+        return d
+
+    def test_http(self):
+        import oe.sstatemirror
+        d = self.datastore("file://.* http://127.0.0.1:%d/PATH" % self.server.server_address[1])
+        found = oe.sstatemirror.check_mirrors(d, self.objects)
+        self.assertEqual(found, set(self.objects[::2]))
+        self.assertEqual(self.server.requests, len(self.objects))
+        # Connections are reused between requests
+        self.assertTrue(self.server.connections <= 4)
+
+        # Answers are remembered for the rest of the build
+        found = oe.sstatemirror.check_mirrors(d, self.objects)
+        self.assertEqual(found, set(self.objects[::2]))
+        self.assertEqual(self.server.requests, len(self.objects))
+
+        d.setVar("BUILDSTART", "2")
+        oe.sstatemirror.check_mirrors(d, self.objects[:4])
+        self.assertEqual(self.server.requests, len(self.objects) + 4)
+
+    def test_file(self):
+        import oe.sstatemirror
+        d = self.datastore("file://.* file://%s/PATH" % self.mirrordir)
+        found = oe.sstatemirror.check_mirrors(d, self.objects)
+        self.assertEqual(found, set(self.objects[::2]))
+
+    def test_fallthrough(self):
+        import oe.sstatemirror
+        emptydir = os.path.join(self.tempdir, "empty")
+        os.makedirs(emptydir)
+        d = self.datastore("file://.* file://%s/PATH \n file://.* http://127.0.0.1:%d/PATH" % (emptydir, self.server.server_address[1]))
+        found = oe.sstatemirror.check_mirrors(d, self.objects)
+        self.assertEqual(found, set(self.objects[::2]))
@@ -178,6 +178,7 @@ def execute_pre_post_process(d, cmds):
 def multiprocess_exec(commands, function):
     import signal
     import multiprocessing
+    import bb.utils
 
     if not commands:
         return []
@@ -204,6 +205,24 @@ def multiprocess_exec(commands, function):
         pool.join()
         raise
 
+_fork_function = None
+
+def _call_fork_function(arg):
+    return _fork_function(arg)
+
+def multiprocess_fork_exec(commands, function):
+    """
+    Like multiprocess_exec() for functions which cannot be pickled, such as
+    the ones defined in classes. The pool workers are forked after function
+    is set up here so they inherit it.
+    """
+    global _fork_function
+    _fork_function = function
+    try:
+        return multiprocess_exec(commands, _call_fork_function)
+    finally:
+        _fork_function = None
+
 def squashspaces(string):
     import re
     return re.sub("\s+", " ", string).strip()
@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 2 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+#
+# Time finding the per file dependencies of packages as package_do_filedeps
+# does, with oe.package.filedepscanner and, given the RPMDEPS command of a
+# build, with oe.package.filedeprunner. Each argument is a package directory
+# below PKGDEST, e.g.:
+#
+#   bench-filedeps.py --rpmdeps "$(bitbake -e foo | sed -n 's/^RPMDEPS="\(.*\)"/\1/p')" \
+#       tmp/work/*/foo/*/packages-split/*
+#
+# --compare also reports the files for which the two give different results.
+# Without --rpmdeps only the in process scanner is timed, the files it would
+# pass to rpmdeps are counted.
+#
+import os
+import sys
+import time
+import optparse
+import multiprocessing
+
+scripts_path = os.path.abspath(os.path.dirname(os.path.abspath(sys.argv[0])))
+sys.path.insert(0, os.path.join(scripts_path, '../../meta/lib'))
+sys.path.insert(0, os.path.join(scripts_path, '../../bitbake/lib'))
+import bb
+import bb.utils
+import oe.package
+
+def package_files(pkgdir):
+    files = []
+    for root, dirs, names in os.walk(pkgdir):
+        for name in names:
+            files.append(os.path.join(root, name))
+    return files
+
+def run(function, pkglist, jobs):
+    pool = bb.utils.multiprocessingpool(jobs)
+    start = time.time()
+    results = pool.map(function, pkglist)
+    elapsed = time.time() - start
+    pool.close()
+    pool.join()
+    return results, elapsed
+
+def merge(results):
+    merged = {}
+    for (pkg, provides, requires) in results:
+        for file in provides:
+            merged[(pkg, file, "provides")] = provides[file]
+        for file in requires:
+            merged[(pkg, file, "requires")] = requires[file]
+    return merged
+
+def main():
+    parser = optparse.OptionParser(usage="%prog [options] PKGDIR...")
+    parser.add_option("-r", "--rpmdeps", metavar="COMMAND",
+                      help="the RPMDEPS command to compare against")
+    parser.add_option("-c", "--compare", action="store_true",
+                      help="report the files with different results")
+    parser.add_option("-j", "--jobs", type="int", default=multiprocessing.cpu_count(),
+                      help="number of processes (default: %default)")
+    options, args = parser.parse_args()
+    if not args:
+        parser.error("no package directories given")
+
+    pkglist = []
+    nfiles = 0
+    helperfiles = 0
+    for pkgdir in args:
+        pkgdir = os.path.abspath(pkgdir)
+        files = package_files(pkgdir)
+        nfiles += len(files)
+        for f in files:
+            if " " not in f and oe.package.filedeps(f) is None:
+                helperfiles += 1
+        for i in range(0, len(files), 100):
+            pkglist.append((os.path.basename(pkgdir), files[i:i+100],
+                            options.rpmdeps or "false", os.path.dirname(pkgdir)))
+
+    print("%d packages, %d files, %d need rpmdeps helpers" % (len(args), nfiles, helperfiles))
+    if helperfiles and not options.rpmdeps:
+        print("skipping those files, no --rpmdeps given")
+        for i, (pkg, files, rpmdeps, pkgdest) in enumerate(pkglist):
+            files = [f for f in files if " " in f or oe.package.filedeps(f) is not None]
+            pkglist[i] = (pkg, files, rpmdeps, pkgdest)
+
+    scanned, elapsed = run(oe.package.filedepscanner, pkglist, options.jobs)
+    print("filedepscanner with %d processes: %.3fs" % (options.jobs, elapsed))
+    if not options.rpmdeps:
+        return 0
+
+    rpmdeps, elapsed = run(oe.package.filedeprunner, pkglist, options.jobs)
+    print("filedeprunner with %d processes: %.3fs" % (options.jobs, elapsed))
+
+    scanned = merge(scanned)
+    rpmdeps = merge(rpmdeps)
+    differences = sorted(k for k in set(scanned) | set(rpmdeps) if scanned.get(k) != rpmdeps.get(k))
+    print("%d differences" % len(differences))
+    if options.compare:
+        for key in differences:
+            print("%s %s %s:\n  filedepscanner: %s\n  filedeprunner:  %s" %
+                  (key + (" ".join(scanned.get(key, [])), " ".join(rpmdeps.get(key, [])))))
+    return 1 if differences else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,141 @@
+#!/usr/bin/env python
+
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 2 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+#
+# Time the incremental package feed indexing of oe.package_manager on a
+# synthetic feed directory of small .ipk or .deb packages, e.g.:
+#
+#   bench-package-index.py --packages 10000 --rebuild 50
+#
+# The feed is indexed from scratch, again with nothing changed, again
+# after --rebuild packages were rebuilt and once more after all of them
+# were touched. --tool times the package managers' own tools on the same
+# feed for comparison (opkg-make-index for ipk, apt-ftparchive for deb).
+#
+import os
+import sys
+import time
+import shutil
+import StringIO
+import tarfile
+import tempfile
+import optparse
+
+scripts_path = os.path.abspath(os.path.dirname(os.path.abspath(sys.argv[0])))
+sys.path.insert(0, os.path.join(scripts_path, '../../meta/lib'))
+sys.path.insert(0, os.path.join(scripts_path, '../../bitbake/lib'))
+import bb
+import bb.utils
+import oe.package_manager
+
+def tar_gz(files):
+    data = StringIO.StringIO()
+    tar = tarfile.open(fileobj=data, mode="w:gz")
+    for name, contents in files:
+        info = tarfile.TarInfo(name)
+        info.size = len(contents)
+        tar.addfile(info, StringIO.StringIO(contents))
+    tar.close()
+    return data.getvalue()
+
+def write_package(path, name, version, arch, files):
+    control = ("Package: %s\nVersion: %s\nArchitecture: %s\n"
+               "Maintainer: Nobody <nobody@example.com>\n"
+               "Depends: libc6 (>= 2.21), %s-data\n"
+               "Description: Synthetic package %s\n for benchmarking the feed indexer\n"
+               "License: MIT\n" % (name, version, arch, name, name))
+    members = [("debian-binary", "2.0\n"),
+               ("control.tar.gz", tar_gz([("./control", control)])),
+               ("data.tar.gz", tar_gz([("./usr/share/%s/%s" % (name, f), f * 100) for f in files]))]
+    with open(path, "wb") as f:
+        f.write("!<arch>\n")
+        for member, data in members:
+            f.write("%-16s%-12d%-6d%-6d%-8s%-10d`\n" % (member + "/", 0, 0, 0, "100644", len(data)))
+            f.write(data)
+            if len(data) % 2:
+                f.write("\n")
+
+def build_feed(feed, options, release):
+    bb.utils.mkdirhier(feed)
+    for i in xrange(options.packages):
+        name = "pkg%d" % i
+        write_package(os.path.join(feed, "%s_1.0-r%d_core2-64.%s" % (name, release, options.format)),
+                      name, "1.0-r%d" % release, "core2-64", ["file%d" % j for j in xrange(options.files)])
+
+def builtin(feed, options):
+    if options.format == "ipk":
+        return oe.package_manager.opkg_index(feed)
+    return oe.package_manager.dpkg_index((feed, "true", "core2-64"))
+
+def tool(feed, options):
+    if options.format == "ipk":
+        packages = os.path.join(feed, "Packages")
+        cmd = "%s -r %s -p %s -m %s" % (options.tool, packages, packages, feed)
+    else:
+        cmd = "cd %s; %s packages . > Packages" % (feed, options.tool)
+    return oe.package_manager.create_index(cmd)
+
+def timed(label, function, *args):
+    start = time.time()
+    result = function(*args)
+    print("%s: %.3fs" % (label, time.time() - start))
+    if result:
+        print(result)
+
+def main():
+    parser = optparse.OptionParser(usage="%prog [options]")
+    parser.add_option("-n", "--packages", type="int", default=10000,
+                      help="number of packages in the feed (default: %default)")
+    parser.add_option("-f", "--files", type="int", default=5,
+                      help="number of files in each package (default: %default)")
+    parser.add_option("-r", "--rebuild", type="int", default=50,
+                      help="number of packages to rebuild (default: %default)")
+    parser.add_option("--format", choices=["ipk", "deb"], default="ipk",
+                      help="package format, ipk or deb (default: %default)")
+    parser.add_option("-t", "--tool", metavar="PATH",
+                      help="also time opkg-make-index or apt-ftparchive at PATH")
+    options, args = parser.parse_args()
+
+    tmpdir = tempfile.mkdtemp(prefix="bench-package-index")
+    try:
+        feed = os.path.join(tmpdir, "core2-64")
+        start = time.time()
+        build_feed(feed, options, 0)
+        print("created %d packages in %.3fs" % (options.packages, time.time() - start))
+
+        timed("builtin, full index", builtin, feed, options)
+        timed("builtin, nothing changed", builtin, feed, options)
+
+        for i in xrange(options.rebuild):
+            name = "pkg%d" % i
+            os.unlink(os.path.join(feed, "%s_1.0-r0_core2-64.%s" % (name, options.format)))
+            write_package(os.path.join(feed, "%s_1.0-r1_core2-64.%s" % (name, options.format)),
+                          name, "1.0-r1", "core2-64", ["file"])
+        timed("builtin, %d packages rebuilt" % options.rebuild, builtin, feed, options)
+
+        for f in os.listdir(feed):
+            os.utime(os.path.join(feed, f), None)
+        timed("builtin, all packages touched", builtin, feed, options)
+
+        if options.tool:
+            os.unlink(os.path.join(feed, "Packages"))
+            timed("%s, full index" % os.path.basename(options.tool), tool, feed, options)
+            timed("%s, nothing changed" % os.path.basename(options.tool), tool, feed, options)
+    finally:
+        shutil.rmtree(tmpdir)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,161 @@
+#!/usr/bin/env python
+
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 2 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+#
+# Time the phases of split_and_strip_files on a synthetic PKGD tree. A few
+# binaries are built with the host gcc and copied many times over a tree of
+# directories, next to non-ELF files, then:
+#
+#  - every file is classified by running 'file' on it as package.bbclass did,
+#    and with oe.package.is_elf()
+#  - the debug info is split out of the ELF files one at a time and with
+#    a process pool as oe.utils.multiprocess_exec() uses, each on a fresh
+#    copy of the tree
+#
+# e.g.:
+#
+#   bench-split-strip.py --copies 200 --other 2000
+#
+# The host objcopy is used and debugedit is not run.
+#
+import os
+import sys
+import time
+import shutil
+import tempfile
+import optparse
+import multiprocessing
+import subprocess
+
+scripts_path = os.path.abspath(os.path.dirname(os.path.abspath(sys.argv[0])))
+sys.path.insert(0, os.path.join(scripts_path, '../../meta/lib'))
+sys.path.insert(0, os.path.join(scripts_path, '../../bitbake/lib'))
+import bb
+import bb.utils
+import oe.utils
+import oe.package
+
+SOURCE = """
+#include <stdio.h>
+static int table[%d];
+int lookup(int i) { return table[i %% %d]; }
+int main(int argc, char **argv) { printf("%%d\\n", lookup(argc)); return 0; }
+"""
+
+def file_classify(path):
+    # What split_and_strip_files used to do for every candidate file
+    ret, result = oe.utils.getstatusoutput("file \"%s\"" % path.replace("\"", "\\\""))
+    type = 0
+    if "ELF" in result:
+        type |= 1
+        if "not stripped" not in result:
+            type |= 2
+        if "executable" in result:
+            type |= 4
+        if "shared" in result:
+            type |= 8
+    return type
+
+def build_tree(tmpdir, options):
+    srcdir = os.path.join(tmpdir, "src")
+    pkgd = os.path.join(tmpdir, "package")
+    bb.utils.mkdirhier(srcdir)
+    source = os.path.join(srcdir, "test.c")
+    with open(source, "w") as f:
+        f.write(SOURCE % (options.size, options.size))
+    binaries = []
+    for name, flags in (("prog", ["-no-pie", "-fno-pie"]), ("libprog.so", ["-shared", "-fPIC"])):
+        binary = os.path.join(srcdir, name)
+        subprocess.check_call(["gcc", "-g", "-O2"] + flags + ["-o", binary, source])
+        binaries.append(binary)
+
+    for i in xrange(options.copies):
+        bindir = os.path.join(pkgd, "usr/bin/d%d" % (i % 50))
+        libdir = os.path.join(pkgd, "usr/lib/d%d" % (i % 50))
+        bb.utils.mkdirhier(bindir)
+        bb.utils.mkdirhier(libdir)
+        shutil.copy(binaries[0], os.path.join(bindir, "prog%d" % i))
+        shutil.copy(binaries[1], os.path.join(libdir, "libprog%d.so" % i))
+    for i in xrange(options.other):
+        datadir = os.path.join(pkgd, "usr/share/d%d" % (i % 50))
+        bb.utils.mkdirhier(datadir)
+        path = os.path.join(datadir, "script%d" % i)
+        with open(path, "w") as f:
+            f.write("#!/bin/sh\necho %d\n" % i)
+        os.chmod(path, 0755)
+    return pkgd
+
+def walk(pkgd):
+    for root, dirs, files in os.walk(pkgd):
+        for f in files:
+            yield os.path.join(root, f)
+
+def main():
+    parser = optparse.OptionParser(usage="%prog [options]")
+    parser.add_option("-c", "--copies", type="int", default=200,
+                      help="number of copies of each binary (default: %default)")
+    parser.add_option("-o", "--other", type="int", default=2000,
+                      help="number of non-ELF files (default: %default)")
+    parser.add_option("-s", "--size", type="int", default=1000,
+                      help="size of the table in the test binaries (default: %default)")
+    parser.add_option("-j", "--jobs", type="int", default=multiprocessing.cpu_count(),
+                      help="number of processes for the parallel split (default: %default)")
+    parser.add_option("-k", "--keep", action="store_true",
+                      help="keep the temporary directory")
+    options, args = parser.parse_args()
+
+    tmpdir = tempfile.mkdtemp(prefix="bench-split-strip")
+    try:
+        pkgd = build_tree(tmpdir, options)
+        files = list(walk(pkgd))
+
+        results = {}
+        for name, classify in (("file", file_classify), ("is_elf", oe.package.is_elf)):
+            start = time.time()
+            results[name] = dict((f, classify(f)) for f in files)
+            print("classify %d files with %s: %.3fs" % (len(files), name, time.time() - start))
+        if results["file"] != results["is_elf"]:
+            print("classification differs for %d files" %
+                  len([f for f in files if results["file"][f] != results["is_elf"][f]]))
+
+        elffiles = sorted(f for f in files if results["is_elf"][f] & 1)
+        for name in ("serial", "parallel"):
+            copy = os.path.join(tmpdir, name)
+            shutil.copytree(pkgd, copy)
+            splitfiles = []
+            for f in elffiles:
+                f = copy + f[len(pkgd):]
+                debugfile = os.path.join(os.path.dirname(f), ".debug", os.path.basename(f))
+                splitfiles.append((f, debugfile, "", "", "objcopy", "", ""))
+            start = time.time()
+            if name == "serial":
+                for arg in splitfiles:
+                    oe.package.splitdebuginfo(arg)
+            else:
+                pool = bb.utils.multiprocessingpool(options.jobs)
+                pool.map(oe.package.splitdebuginfo, splitfiles)
+                pool.close()
+                pool.join()
+            print("split %d files %s: %.3fs" % (len(splitfiles),
+                  name if name == "serial" else "with %d processes" % options.jobs, time.time() - start))
+    finally:
+        if options.keep:
+            print("temporary files are in %s" % tmpdir)
+        else:
+            shutil.rmtree(tmpdir)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -99,6 +99,14 @@ do_nothing () {
    echo Nothing to do
 }
 
+# Rebuild the index of the cache dir used by the builds, if there is one
+update_index () {
+    if [ -f "$cache_dir/sstate-index" ]; then
+        echo "Updating $cache_dir/sstate-index"
+        `dirname $0`/sstate-index --cache-dir=$cache_dir
+    fi
+}
+
 # Read the input "y"
 read_confirm () {
   echo "$total_deleted from $total_files files will be removed! "
@@ -308,6 +316,7 @@ remove_duplicated () {
               echo "Done"
           done
           echo "$total_deleted files have been removed!"
+          update_index
       else
           do_nothing
       fi
@@ -372,6 +381,7 @@ rm_by_stamps (){
                   rm -f $verbose $i
               done
               echo "$total_deleted files have been removed"
+              update_index
           else
               do_nothing
           fi